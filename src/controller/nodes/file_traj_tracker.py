@@ -2,7 +2,6 @@
 
 import rospy
 import numpy as np
-import csv
 import os
 
 from scipy.spatial.transform import Rotation as R
@@ -13,6 +12,8 @@ from planner.msg import State, Control, NominalTrajectory
 from controller.controller_utils import compute_control, lin_PWM, ang_PWM, EKF_prediction_step, EKF_correction_step
 from planner.planner_utils import wrap_states
 from planner.reachability_utils import generate_robot_matrices
+from controller.loop_timer import LoopTimer
+from controller.run_logger import RunLogger
 import params.params as params
 
 
@@ -59,11 +60,17 @@ class traj_tracker():
 
         # Logging
         path = '/home/navlab-nuc/Rover/flightroom_data/4_12_2022/debug/'
-        filename = 'track_'+str(rospy.get_time())+'.csv'
-        self.logger = csv.writer(open(os.path.join(path, filename), 'w'))
-        self.logger.writerow(['t', 'x', 'y', 'theta', 'z_x', 'z_y', 'z_theta', 
-                              'x_nom', 'y_nom', 'theta_nom', 'v_nom', 
-                              'x_hat', 'y_hat', 'theta_hat', 'v_hat', 'u_w', 'u_a'])
+        filename = 'track_'+str(rospy.get_time())+'.bin'
+        self.logger = RunLogger(os.path.join(path, filename), 
+                                ['t', 'x', 'y', 'theta', 'z_x', 'z_y', 'z_theta', 
+                                 'x_nom', 'y_nom', 'theta_nom', 'v_nom', 
+                                 'x_hat', 'y_hat', 'theta_hat', 'v_hat', 'u_w', 'u_a'],
+                                params.RUN_LOG_BUFFER_LEN, params.RUN_LOG_FLUSH_PERIOD)
+
+        # Control loop timing
+        self.timing_file = os.path.join(path, 'track_timing_'+str(rospy.get_time())+'.npz')
+        self.loop_timer = LoopTimer(['matrices', 'ekf_update', 'control', 'pwm', 'console', 'publish', 'logging', 'ekf_predict', 'braking'], 
+                                    params.DT, params.TIMING_BUFFER_LEN, params.TIMING_TOPIC, params.TIMING_PUBLISH_PERIOD)
 
 
     def traj_callback(self, data):
@@ -105,6 +112,7 @@ class traj_tracker():
 
         """
         print("idx ", self.idx, " ----------------------------------------")
+        self.loop_timer.mark('console')
 
         x_nom_msg = self.X_nom_curr[self.idx]
         x_nom = np.array([[x_nom_msg.x],[x_nom_msg.y],[x_nom_msg.theta],[x_nom_msg.v]])
@@ -115,14 +123,18 @@ class traj_tracker():
         if self.idx == 0:
             self.x_hat = x_nom
 
-        A,B,C,K = generate_robot_matrices(x_nom, u_nom, params.Q_LQR, params.R_LQR, params.DT)
+        A,B,C,K = generate_robot_matrices(x_nom, u_nom, params.Q_LQR, params.R_LQR, params.DT, params.GAIN_SCHEDULE)
+        self.loop_timer.mark('matrices')
 
         # ======== EKF Update ========
         self.x_hat, self.P = EKF_correction_step(self.x_hat, self.P, self.z_gt, C, params.R_EKF)
+        self.loop_timer.mark('ekf_update')
         self.state_est_pub.publish(wrap_states(self.x_hat)[0])
+        self.loop_timer.mark('publish')
 
         # ======== Apply feedback control law ========
         u = compute_control(x_nom, u_nom, self.x_hat, K)
+        self.loop_timer.mark('control')
 
         # Create motor command msg
         motor_cmd = Twist()
@@ -132,19 +144,23 @@ class traj_tracker():
         # motor_cmd.linear.x = lin_PWM(self.v_des, u[0][0])
         motor_cmd.linear.x = 0.0
         motor_cmd.angular.z = ang_PWM(self.v_des, u[0][0])
+        self.loop_timer.mark('pwm')
 
         print(" - v_des: ", round(self.v_des,2), " u_a: ", round(u[1][0],2), " u_w: ", round(u[0][0],2))
         print(" - lin PWM: ", round(motor_cmd.linear.x,2), ", ang PWM: ", round(motor_cmd.angular.z,2))
+        self.loop_timer.mark('console')
 
         self.cmd_pub.publish(motor_cmd)
+        self.loop_timer.mark('publish')
 
         self.idx += 1
 
         # Log data
-        self.logger.writerow([rospy.get_time(), self.z_gt[0][0], self.z_gt[1][0], self.z_gt[2][0], 
-                              self.z[0][0], self.z[1][0], self.z[2][0],
-                              x_nom[0][0], x_nom[1][0], x_nom[2][0], x_nom[3][0], self.x_hat[0][0], 
-                              self.x_hat[1][0], self.x_hat[2][0], self.x_hat[3][0], u[0][0], u[1][0]])
+        self.logger.log([rospy.get_time(), self.z_gt[0][0], self.z_gt[1][0], self.z_gt[2][0], 
+                         self.z[0][0], self.z[1][0], self.z[2][0],
+                         x_nom[0][0], x_nom[1][0], x_nom[2][0], x_nom[3][0], self.x_hat[0][0], 
+                         self.x_hat[1][0], self.x_hat[2][0], self.x_hat[3][0], u[0][0], u[1][0]])
+        self.loop_timer.mark('logging')
         
         # if self.idx == int(self.traj_len/2):
         #     self.v_des = 0
@@ -162,15 +178,20 @@ class traj_tracker():
             self.idx = 0
 
             # Send multiple stop commands in case some don't go through
+            self.loop_timer.mark('console')
             for i in range(5):
                 self.rate.sleep()
                 self.stop_motors()
+            self.loop_timer.mark('braking')
 
             self.done_pub.publish(True)
             
 
+        self.loop_timer.mark('console')
+
         # ======== EKF Predict ========
         self.x_hat, self.P = EKF_prediction_step(self.x_hat, u, self.P, A, params.Q_EKF, params.DT)
+        self.loop_timer.mark('ekf_predict')
 
         # ======== Debugging ========
         x_err = self.z[0] - x_nom[0]
@@ -194,11 +215,16 @@ class traj_tracker():
         """
         rospy.loginfo("Running Trajectory Tracker")
         while not rospy.is_shutdown():
+            self.loop_timer.start_tick()
             
             if self.X_nom_curr is not None:
                 self.track()
 
+            self.loop_timer.end_tick()
             self.rate.sleep()
+
+        self.logger.close()
+        self.loop_timer.dump(self.timing_file)
         
         # spin() simply keeps python from exiting until this node is stopped
         rospy.spin()
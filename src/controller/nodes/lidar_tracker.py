@@ -2,17 +2,18 @@
 
 import rospy
 import numpy as np
-import csv
 import os
 
 from scipy.spatial.transform import Rotation as R
-from geometry_msgs.msg import Point, Twist, PoseStamped
-from std_msgs.msg import Float64
+from geometry_msgs.msg import PointStamped, Twist, PoseStamped
+from std_msgs.msg import Float64, Int32
 
 from planner.msg import State, Control, NominalTrajectory
 from controller.controller_utils import wrap_angle, compute_control, lin_PWM, ang_PWM, EKF_prediction_step, EKF_correction_step
 from planner.planner_utils import wrap_states
 from planner.reachability_utils import generate_robot_matrices
+from controller.loop_timer import LoopTimer
+from controller.run_logger import RunLogger
 import params.params as params
 
 class lidar_tracker():
@@ -39,7 +40,7 @@ class lidar_tracker():
         self.P = params.P_0  # covariance
 
         self.z = np.zeros((3,1))  # measurement
-        self.z_gt = np.zeros((3,1))  # ground-truth measurement (no noise)
+        self.z_gt = np.zeros(3)  # ground-truth measurement (no noise)
         self.imu_heading = 0  
         self.init_heading = None
 
@@ -50,22 +51,29 @@ class lidar_tracker():
 
         # Publishers
         self.cmd_pub = rospy.Publisher('cmd_vel', Twist, queue_size=10)
+        self.seg_num_pub = rospy.Publisher('controller/seg_num', Int32, queue_size=10)  # segment taken as current trajectory
         self.state_est_pub = rospy.Publisher('controller/state_est', State, queue_size=1)
 
         # Subscribers
         traj_sub = rospy.Subscriber('planner/traj', NominalTrajectory, self.traj_callback)
-        lidar_sub = rospy.Subscriber('sensing/lidar/pos_measurement', Point, self.lidar_callback)
+        lidar_sub = rospy.Subscriber('sensing/lidar/pos_measurement', PointStamped, self.lidar_callback)
         imu_sub = rospy.Subscriber('sensing/imu/heading', Float64, self.imu_callback)
         #mocap_sub = rospy.Subscriber('sensing/mocap', State, self.mocap_callback)
         mocap_sub = rospy.Subscriber('vrpn_client_node/rover/pose', PoseStamped, self.mocap_callback)
 
         # Logging
         path = '/home/navlab-nuc/Rover/flightroom_data/6_15_2022/tracker_logs'
-        filename = 'lidar_track_'+str(rospy.get_time())+'.csv'
-        self.logger = csv.writer(open(os.path.join(path, filename), 'w'))
-        self.logger.writerow(['t', 'x', 'y', 'theta', 'z_x', 'z_y', 'z_theta', 
-                              'x_nom', 'y_nom', 'theta_nom', 'v_nom', 
-                              'x_hat', 'y_hat', 'theta_hat', 'v_hat', 'u_w', 'u_a'])
+        filename = 'lidar_track_'+str(rospy.get_time())+'.bin'
+        self.logger = RunLogger(os.path.join(path, filename), 
+                                ['t', 'x', 'y', 'theta', 'z_x', 'z_y', 'z_theta', 
+                                 'x_nom', 'y_nom', 'theta_nom', 'v_nom', 
+                                 'x_hat', 'y_hat', 'theta_hat', 'v_hat', 'u_w', 'u_a'],
+                                params.RUN_LOG_BUFFER_LEN, params.RUN_LOG_FLUSH_PERIOD)
+
+        # Control loop timing (ticks are driven by lidar measurements, so no lateness is recorded)
+        self.timing_file = os.path.join(path, 'lidar_track_timing_'+str(rospy.get_time())+'.npz')
+        self.loop_timer = LoopTimer(['matrices', 'ekf_update', 'control', 'pwm', 'console', 'publish', 'logging', 'ekf_predict', 'braking'], 
+                                    None, params.TIMING_BUFFER_LEN, params.TIMING_TOPIC, params.TIMING_PUBLISH_PERIOD)
 
 
     def imu_callback(self, data):
@@ -92,6 +100,7 @@ class lidar_tracker():
             self.U_nom_curr = data.controls 
             # Publish initial state estimate (for lidar node)
             self.state_est_pub.publish(data.states[0])
+            self.seg_num_pub.publish(self.seg_num)
         # Otherwise, set next trajectory
         else:
             self.X_nom_next = data.states 
@@ -124,11 +133,13 @@ class lidar_tracker():
         
         """
         # Form measurement z
-        z = np.array([data.x, data.y, self.imu_heading])[:,None]  # (x, y, theta)
+        z = np.array([data.point.x, data.point.y, self.imu_heading])[:,None]  # (x, y, theta)
         
         if self.X_nom_curr is not None and not np.isnan(z[0]):
-            # Call track
+            # Call track (timed as a control loop tick)
+            self.loop_timer.start_tick()
             self.track(z)
+            self.loop_timer.end_tick()
 
 
     def track(self, z):
@@ -136,6 +147,7 @@ class lidar_tracker():
 
         """
         print("idx ", self.idx, " ----------------------------------------")
+        self.loop_timer.mark('console')
 
         x_nom_msg = self.X_nom_curr[self.idx]
         x_nom = np.array([[x_nom_msg.x],[x_nom_msg.y],[x_nom_msg.theta],[x_nom_msg.v]])
@@ -146,16 +158,20 @@ class lidar_tracker():
         if self.idx == 0 and self.seg_num == 1:
             self.x_hat = x_nom
 
-        A,B,C,K = generate_robot_matrices(x_nom, u_nom, params.Q_LQR, params.R_LQR, params.DT)
+        A,B,C,K = generate_robot_matrices(x_nom, u_nom, params.Q_LQR, params.R_LQR, params.DT, params.GAIN_SCHEDULE)
+        self.loop_timer.mark('matrices')
         # K = np.array([[0, 0, 1, 0],
         #               [0, 0, 0, 1]])
 
         # ======== EKF Update ========
         self.x_hat, self.P = EKF_correction_step(self.x_hat, self.P, z, C, params.R_EKF)
+        self.loop_timer.mark('ekf_update')
         self.state_est_pub.publish(wrap_states(self.x_hat)[0])
+        self.loop_timer.mark('publish')
 
         # ======== Apply feedback control law ========
         u = compute_control(x_nom, u_nom, self.x_hat, K)
+        self.loop_timer.mark('control')
 
         # Create motor command msg
         motor_cmd = Twist()
@@ -164,19 +180,23 @@ class lidar_tracker():
         self.v_des += params.DT * u[1][0]  # integrate acceleration
         motor_cmd.linear.x = lin_PWM(self.v_des, u[0][0])
         motor_cmd.angular.z = ang_PWM(self.v_des, u[0][0])
+        self.loop_timer.mark('pwm')
 
         print(" - v_des: ", round(self.v_des,2), " u_a: ", round(u[1][0],2), " u_w: ", round(u[0][0],2))
         print(" - lin PWM: ", round(motor_cmd.linear.x,2), ", ang PWM: ", round(motor_cmd.angular.z,2))
+        self.loop_timer.mark('console')
 
         self.cmd_pub.publish(motor_cmd)
+        self.loop_timer.mark('publish')
 
         self.idx += 1
 
         # Log data TODO: update this
-        self.logger.writerow([rospy.get_time(), self.z_gt[0], self.z_gt[1], self.z_gt[2], 
-                              z[0][0], z[1][0], z[2][0],
-                              x_nom[0][0], x_nom[1][0], x_nom[2][0], x_nom[3][0], self.x_hat[0][0], 
-                              self.x_hat[1][0], self.x_hat[2][0], self.x_hat[3][0], u[0][0], u[1][0]])
+        self.logger.log([rospy.get_time(), self.z_gt[0], self.z_gt[1], self.z_gt[2], 
+                         z[0][0], z[1][0], z[2][0],
+                         x_nom[0][0], x_nom[1][0], x_nom[2][0], x_nom[3][0], self.x_hat[0][0], 
+                         self.x_hat[1][0], self.x_hat[2][0], self.x_hat[3][0], u[0][0], u[1][0]])
+        self.loop_timer.mark('logging')
 
         # ======== Check for end of trajectory ========
         if self.idx >= params.SEG_LEN:
@@ -192,6 +212,7 @@ class lidar_tracker():
                 self.X_nom_next = None
                 self.idx = 0
                 self.seg_num += 1
+                self.seg_num_pub.publish(self.seg_num)
             else:
                 rospy.loginfo("Executing braking maneuver")
 
@@ -205,12 +226,17 @@ class lidar_tracker():
             self.idx = 0
 
             # Send multiple stop commands in case some don't go through
+            self.loop_timer.mark('console')
             for i in range(5):
                 self.rate.sleep()
                 self.stop_motors()
+            self.loop_timer.mark('braking')
+
+        self.loop_timer.mark('console')
 
         # ======== EKF Predict ========
         self.x_hat, self.P = EKF_prediction_step(self.x_hat, u, self.P, A, params.Q_EKF, params.DT)
+        self.loop_timer.mark('ekf_predict')
 
     
     def stop_motors(self):
@@ -233,6 +259,9 @@ class lidar_tracker():
 
             # Loop while track is called from lidar_callback
             self.rate.sleep()
+
+        self.logger.close()
+        self.loop_timer.dump(self.timing_file)
         
         # spin() simply keeps python from exiting until this node is stopped
         rospy.spin()
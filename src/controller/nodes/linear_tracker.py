@@ -2,13 +2,13 @@
 
 import rospy
 import numpy as np
-import csv
 import os
 
 from geometry_msgs.msg import Twist
 
 from trajectory_msgs.msg import JointTrajectory
-from controller.controller_utils import v_to_PWM  # TODO: mec_v_to_PWM
+from controller.loop_timer import LoopTimer
+from controller.run_logger import RunLogger
 import params.rtd_params as params
 import rtd.utils as utils
 
@@ -16,8 +16,8 @@ import rtd.utils as utils
 class linear_tracker():
     """Linear tracker
 
-    Tracks nominal trajectories for linear 2D double-integrator robot. 
-    Controls are x and y accelerations.
+    Tracks nominal trajectories for linear 2D or 3D double-integrator robot. 
+    Controls are x, y (and z) accelerations.
     Used for RTD Linear Planner with Rover in mecanum drive
 
     Attributes
@@ -35,7 +35,7 @@ class linear_tracker():
         self.idx = 0  # current index in the trajectory
         self.traj = None
 
-        self.v_des = np.zeros(2)
+        self.v_des = np.zeros(params.N_DIM)
         self.t_start = 0
 
         # Publishers
@@ -48,9 +48,14 @@ class linear_tracker():
 
         # Logging
         path = '/home/navlab-nuc/multirobot-planning/data/ros_sim_runs'
-        filename = 'trajectory_'+str(rospy.get_time())+'.csv'
-        self.logger = csv.writer(open(os.path.join(path, filename), 'w'))
-        self.logger.writerow(['t', 'x_nom', 'y_nom'])
+        filename = 'trajectory_'+str(rospy.get_time())+'.bin'
+        self.logger = RunLogger(os.path.join(path, filename), ['t'] + [d+'_nom' for d in 'xyz'[:params.N_DIM]], 
+                                params.RUN_LOG_BUFFER_LEN, params.RUN_LOG_FLUSH_PERIOD)
+
+        # Control loop timing
+        self.timing_file = os.path.join(path, 'trajectory_timing_'+str(rospy.get_time())+'.npz')
+        self.loop_timer = LoopTimer(['pwm', 'console', 'publish', 'logging', 'braking'], 
+                                    params.DT, params.TIMING_BUFFER_LEN, params.TIMING_TOPIC, params.TIMING_PUBLISH_PERIOD)
 
 
     def traj_callback(self, data):
@@ -61,7 +66,7 @@ class linear_tracker():
         """
         # Store new trajectory
         time = np.linspace(0, params.TRAJ_TIME_LEN, params.TRAJ_IDX_LEN)  # TODO: update time to not always start at 0
-        self.traj = utils.unwrap_2D_traj_msg(data, time)
+        self.traj = utils.unwrap_traj_msg(data, time)
         # Reset index
         self.idx = 0
         rospy.loginfo("Received trajectory")
@@ -74,6 +79,7 @@ class linear_tracker():
 
         """
         print("idx ", self.idx, " ----------------------------------------")
+        self.loop_timer.mark('console')
 
         x_nom = self.traj.positions[:,self.idx]
         u_nom = self.traj.accelerations[:,self.idx]
@@ -85,33 +91,41 @@ class linear_tracker():
         self.v_des += params.DT * u_nom  # integrate acceleration
         motor_cmd.linear.x = 0.2 * self.v_des[0]  # TODO: mec_v_to_PWM
         motor_cmd.linear.y = 0.2 * self.v_des[1]
+        if params.N_DIM == 3:
+            motor_cmd.linear.z = 0.2 * self.v_des[2]
+        self.loop_timer.mark('pwm')
 
         print(" - x_nom: ", np.round(x_nom,2))
-        print(" - v_des: ", np.round(self.v_des,2), " u_x: ", round(u_nom[0],2), " u_y: ", round(u_nom[1],2))
+        print(" - v_des: ", np.round(self.v_des,2), " u_nom: ", np.round(u_nom,2))
         print(" - x PWM: ", round(motor_cmd.linear.x,2), ", y PWM: ", round(motor_cmd.linear.y,2))
 
         # print(" - v_des: ", np.round(self.v_des,2), " u_x: ", np.round(u_nom[0],2), " u_y: ", np.round(u_nom[1],2))
         # print(" - x PWM: ", round(motor_cmd.linear.x,2), ", y PWM: ", round(motor_cmd.linear.y,2))
+        self.loop_timer.mark('console')
 
         self.cmd_pub.publish(motor_cmd)
+        self.loop_timer.mark('publish')
 
         self.idx += 1
 
         # Log data
-        self.logger.writerow([rospy.get_time(), x_nom[0], x_nom[1]])
+        self.logger.log([rospy.get_time()] + x_nom.tolist())
+        self.loop_timer.mark('logging')
 
         # ======== Check for end of trajectory ========
         if self.idx >= params.TRAJ_IDX_LEN:
             rospy.loginfo("Reached end of current trajectory - braking")
             # Reset class variables
             self.traj = None
-            self.v_des = 0
+            self.v_des = np.zeros(params.N_DIM)
             self.idx = 0
 
             # Send multiple stop commands in case some don't go through
+            self.loop_timer.mark('console')
             for i in range(5):
                 self.rate.sleep()
                 self.stop_motors()
+            self.loop_timer.mark('braking')
 
     
     def stop_motors(self):
@@ -131,11 +145,16 @@ class linear_tracker():
         """
         rospy.loginfo("Running Linear Tracker")
         while not rospy.is_shutdown():
+            self.loop_timer.start_tick()
             
             if self.traj is not None:
                 self.track()
 
+            self.loop_timer.end_tick()
             self.rate.sleep()
+
+        self.logger.close()
+        self.loop_timer.dump(self.timing_file)
         
         # spin() simply keeps python from exiting until this node is stopped
         rospy.spin()
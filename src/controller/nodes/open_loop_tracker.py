@@ -2,14 +2,16 @@
 
 import rospy
 import numpy as np
-import csv
 import os
 
 from scipy.spatial.transform import Rotation as R
 from geometry_msgs.msg import Twist, PoseStamped
+from std_msgs.msg import Int32
 
 from planner.msg import State, Control, NominalTrajectory
 from controller.controller_utils import lin_PWM, ang_PWM
+from controller.loop_timer import LoopTimer
+from controller.run_logger import RunLogger
 import params.params as params
 
 class open_loop_tracker():
@@ -40,6 +42,7 @@ class open_loop_tracker():
 
         # Publishers
         self.cmd_pub = rospy.Publisher('cmd_vel', Twist, queue_size=10)
+        self.seg_num_pub = rospy.Publisher('controller/seg_num', Int32, queue_size=10)  # segment taken as current trajectory
 
         # Subscribers
         traj_sub = rospy.Subscriber('planner/traj', NominalTrajectory, self.traj_callback)
@@ -48,10 +51,16 @@ class open_loop_tracker():
 
         # Logging
         path = '/home/navlab-nuc/Rover/flightroom_data/4_12_2022/debug/'
-        filename = 'track_'+str(rospy.get_time())+'.csv'
-        self.logger = csv.writer(open(os.path.join(path, filename), 'w'))
-        self.logger.writerow(['t', 'x', 'y', 'theta', 'z_x', 'z_y', 'z_theta', 
-                              'x_nom', 'y_nom', 'theta_nom', 'v_nom'])
+        filename = 'track_'+str(rospy.get_time())+'.bin'
+        self.logger = RunLogger(os.path.join(path, filename), 
+                                ['t', 'x', 'y', 'theta', 'z_x', 'z_y', 'z_theta', 
+                                 'x_nom', 'y_nom', 'theta_nom', 'v_nom'],
+                                params.RUN_LOG_BUFFER_LEN, params.RUN_LOG_FLUSH_PERIOD)
+
+        # Control loop timing
+        self.timing_file = os.path.join(path, 'track_timing_'+str(rospy.get_time())+'.npz')
+        self.loop_timer = LoopTimer(['pwm', 'console', 'publish', 'logging', 'braking'], 
+                                    params.DT, params.TIMING_BUFFER_LEN, params.TIMING_TOPIC, params.TIMING_PUBLISH_PERIOD)
 
 
     def traj_callback(self, data):
@@ -65,6 +74,7 @@ class open_loop_tracker():
         if self.X_nom_curr is None:
             self.X_nom_curr = data.states 
             self.U_nom_curr = data.controls 
+            self.seg_num_pub.publish(self.seg_num)
         # Otherwise, set next trajectory
         else:
             self.X_nom_next = data.states 
@@ -99,6 +109,7 @@ class open_loop_tracker():
 
         """
         print("idx ", self.idx, " ----------------------------------------")
+        self.loop_timer.mark('console')
 
         x_nom_msg = self.X_nom_curr[self.idx]
         x_nom = np.array([[x_nom_msg.x],[x_nom_msg.y],[x_nom_msg.theta],[x_nom_msg.v]])
@@ -111,18 +122,22 @@ class open_loop_tracker():
         self.v_des += params.DT * u_nom_msg.a  # integrate acceleration
         motor_cmd.linear.x = lin_PWM(self.v_des, u_nom_msg.omega)
         motor_cmd.angular.z = ang_PWM(self.v_des, u_nom_msg.omega)
+        self.loop_timer.mark('pwm')
 
         print(" - v_des: ", round(self.v_des,2), " u_a: ", round(u_nom_msg.a,2), " u_w: ", round(u_nom_msg.omega,2))
         print(" - lin PWM: ", round(motor_cmd.linear.x,2), ", ang PWM: ", round(motor_cmd.angular.z,2))
+        self.loop_timer.mark('console')
 
         self.cmd_pub.publish(motor_cmd)
+        self.loop_timer.mark('publish')
 
         self.idx += 1
 
         # Log data
-        self.logger.writerow([rospy.get_time(), self.z_gt[0][0], self.z_gt[1][0], self.z_gt[2][0], 
-                              self.z[0][0], self.z[1][0], self.z[2][0],
-                              x_nom[0][0], x_nom[1][0], x_nom[2][0], x_nom[3][0]])
+        self.logger.log([rospy.get_time(), self.z_gt[0][0], self.z_gt[1][0], self.z_gt[2][0], 
+                         self.z[0][0], self.z[1][0], self.z[2][0],
+                         x_nom[0][0], x_nom[1][0], x_nom[2][0], x_nom[3][0]])
+        self.loop_timer.mark('logging')
 
         # ======== Check for end of trajectory ========
         if self.idx >= params.SEG_LEN:
@@ -138,6 +153,7 @@ class open_loop_tracker():
                 self.X_nom_next = None
                 self.idx = 0
                 self.seg_num += 1
+                self.seg_num_pub.publish(self.seg_num)
             else:
                 rospy.loginfo("Executing braking maneuver")
 
@@ -151,9 +167,11 @@ class open_loop_tracker():
             self.idx = 0
 
             # Send multiple stop commands in case some don't go through
+            self.loop_timer.mark('console')
             for i in range(5):
                 self.rate.sleep()
                 self.stop_motors()
+            self.loop_timer.mark('braking')
 
     
     def stop_motors(self):
@@ -173,11 +191,16 @@ class open_loop_tracker():
         """
         rospy.loginfo("Running Open-loop Tracker")
         while not rospy.is_shutdown():
+            self.loop_timer.start_tick()
             
             if self.X_nom_curr is not None:
                 self.track()
 
+            self.loop_timer.end_tick()
             self.rate.sleep()
+
+        self.logger.close()
+        self.loop_timer.dump(self.timing_file)
         
         # spin() simply keeps python from exiting until this node is stopped
         rospy.spin()
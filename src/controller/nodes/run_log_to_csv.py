@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+
+import sys
+import os
+
+from controller.run_logger import run_log_to_csv
+
+
+if __name__ == '__main__':
+    # Convert binary run logs to CSV files (same path with .csv extension)
+    if len(sys.argv) < 2:
+        print("Usage: run_log_to_csv.py LOG_FILE [LOG_FILE ...]")
+        sys.exit(1)
+
+    for filename in sys.argv[1:]:
+        csv_filename = os.path.splitext(filename)[0] + '.csv'
+        run_log_to_csv(filename, csv_filename)
+        print("Saved ", csv_filename)
@@ -2,17 +2,18 @@
 
 import rospy
 import numpy as np
-import csv
 import os
 
 from scipy.spatial.transform import Rotation as R
 from geometry_msgs.msg import Twist, PoseStamped
-from std_msgs.msg import Float64
+from std_msgs.msg import Float64, Int32
 
 from planner.msg import State, Control, NominalTrajectory
 from controller.controller_utils import compute_control, lin_PWM, ang_PWM, EKF_prediction_step, EKF_correction_step
-from planner.planner_utils import wrap_states
-from planner.reachability_utils import generate_robot_matrices
+from planner.planner_utils import wrap_states, unwrap_states, unwrap_controls
+from planner.reachability_utils import generate_robot_matrices_batch
+from controller.loop_timer import LoopTimer
+from controller.run_logger import RunLogger
 import params.params as params
 
 class traj_tracker():
@@ -32,10 +33,8 @@ class traj_tracker():
         # Class variables
         self.idx = 0  # current index in the trajectory
         self.seg_num = 1  # current segment number
-        self.X_nom_curr = None
-        self.U_nom_curr = None
-        self.X_nom_next = None
-        self.U_nom_next = None
+        self.traj_curr = None  # current trajectory (X_nom, U_nom, A, B, C, K)
+        self.traj_next = None  # next trajectory (X_nom, U_nom, A, B, C, K)
 
         self.x_hat = np.zeros((4,1))  # state estimate
         self.P = params.P_0  # covariance
@@ -49,6 +48,7 @@ class traj_tracker():
 
         # Publishers
         self.cmd_pub = rospy.Publisher('cmd_vel', Twist, queue_size=10)
+        self.seg_num_pub = rospy.Publisher('controller/seg_num', Int32, queue_size=10)  # segment taken as current trajectory
         self.state_est_pub = rospy.Publisher('controller/state_est', State, queue_size=1)
         self.debug_pub = rospy.Publisher('debug/x_err', Float64, queue_size=1)
 
@@ -59,29 +59,56 @@ class traj_tracker():
 
         # Logging
         path = '/home/navlab-nuc/Rover/flightroom_data/4_12_2022/debug/'
-        filename = 'track_'+str(rospy.get_time())+'.csv'
-        self.logger = csv.writer(open(os.path.join(path, filename), 'w'))
-        self.logger.writerow(['t', 'x', 'y', 'theta', 'z_x', 'z_y', 'z_theta', 
-                              'x_nom', 'y_nom', 'theta_nom', 'v_nom', 
-                              'x_hat', 'y_hat', 'theta_hat', 'v_hat', 'u_w', 'u_a'])
+        filename = 'track_'+str(rospy.get_time())+'.bin'
+        self.logger = RunLogger(os.path.join(path, filename), 
+                                ['t', 'x', 'y', 'theta', 'z_x', 'z_y', 'z_theta', 
+                                 'x_nom', 'y_nom', 'theta_nom', 'v_nom', 
+                                 'x_hat', 'y_hat', 'theta_hat', 'v_hat', 'u_w', 'u_a'],
+                                params.RUN_LOG_BUFFER_LEN, params.RUN_LOG_FLUSH_PERIOD)
+
+        # Control loop timing
+        self.timing_file = os.path.join(path, 'track_timing_'+str(rospy.get_time())+'.npz')
+        self.loop_timer = LoopTimer(['ekf_update', 'control', 'pwm', 'console', 'publish', 'logging', 'ekf_predict', 'braking'], 
+                                    params.DT, params.TIMING_BUFFER_LEN, params.TIMING_TOPIC, params.TIMING_PUBLISH_PERIOD)
 
 
     def traj_callback(self, data):
         """Trajectory subscriber callback.
 
-        Save nominal states and controls from received trajectory.
+        Save nominal states and controls from received trajectory as arrays, and precompute 
+        the linearized model and feedback gain matrices for each index. This runs in the 
+        subscriber thread, so the control loop only indexes the precomputed arrays.
 
         """
+        traj = self.prepare_trajectory(data)
         self.new_traj_flag = True
         # If no current trajectory yet, set it
-        if self.X_nom_curr is None:
-            self.X_nom_curr = data.states 
-            self.U_nom_curr = data.controls 
+        if self.traj_curr is None:
+            self.traj_curr = traj
+            self.seg_num_pub.publish(self.seg_num)
         # Otherwise, set next trajectory
         else:
-            self.X_nom_next = data.states 
-            self.U_nom_next = data.controls
+            self.traj_next = traj
         rospy.loginfo("Received trajectory of length %d", len(data.states))
+
+
+    def prepare_trajectory(self, data):
+        """Convert trajectory msg to arrays and compute A, B, C and K matrices for each index
+
+        Returns
+        -------
+        tuple (X_nom, U_nom, A, B, C, K)
+            Nominal states (4xN), nominal controls (2xN-1), linearized motion model matrices 
+            (N-1x4x4), control input matrix (4x2), measurement matrix (3x4) and feedback gain
+            matrices (N-1x2x4).
+
+        """
+        X_nom = unwrap_states(data.states)
+        U_nom = unwrap_controls(data.controls)
+        n = U_nom.shape[1]
+        A, B, C, K = generate_robot_matrices_batch(X_nom[:,:n].T, U_nom.T, params.Q_LQR, params.R_LQR, 
+                                                   params.DT, params.GAIN_SCHEDULE)
+        return X_nom, U_nom, A, B, C, K
     
 
     def measurement_callback(self, data):
@@ -111,26 +138,29 @@ class traj_tracker():
 
         """
         print("idx ", self.idx, " ----------------------------------------")
+        self.loop_timer.mark('console')
 
-        x_nom_msg = self.X_nom_curr[self.idx]
-        x_nom = np.array([[x_nom_msg.x],[x_nom_msg.y],[x_nom_msg.theta],[x_nom_msg.v]])
-        u_nom_msg = self.U_nom_curr[self.idx]
-        u_nom = np.array([[u_nom_msg.omega],[u_nom_msg.a]])
+        X_nom, U_nom, A_all, B, C, K_all = self.traj_curr
+        x_nom = X_nom[:,[self.idx]]
+        u_nom = U_nom[:,[self.idx]]
         
         # Start of first segment
         if self.idx == 0 and self.seg_num == 1:
             self.x_hat = x_nom
 
-        A,B,C,K = generate_robot_matrices(x_nom, u_nom, params.Q_LQR, params.R_LQR, params.DT)
+        A = A_all[self.idx]; K = K_all[self.idx]
         # K = np.array([[0, 0, 1, 0],
         #               [0, 0, 0, 1]])
 
         # ======== EKF Update ========
         self.x_hat, self.P = EKF_correction_step(self.x_hat, self.P, self.z_gt, C, params.R_EKF)
+        self.loop_timer.mark('ekf_update')
         self.state_est_pub.publish(wrap_states(self.x_hat)[0])
+        self.loop_timer.mark('publish')
 
         # ======== Apply feedback control law ========
         u = compute_control(x_nom, u_nom, self.x_hat, K)
+        self.loop_timer.mark('control')
 
         # Create motor command msg
         motor_cmd = Twist()
@@ -139,19 +169,23 @@ class traj_tracker():
         self.v_des += params.DT * u[1][0]  # integrate acceleration
         motor_cmd.linear.x = lin_PWM(self.v_des, u[0][0])
         motor_cmd.angular.z = ang_PWM(self.v_des, u[0][0])
+        self.loop_timer.mark('pwm')
 
         print(" - v_des: ", round(self.v_des,2), " u_a: ", round(u[1][0],2), " u_w: ", round(u[0][0],2))
         print(" - lin PWM: ", round(motor_cmd.linear.x,2), ", ang PWM: ", round(motor_cmd.angular.z,2))
+        self.loop_timer.mark('console')
 
         self.cmd_pub.publish(motor_cmd)
+        self.loop_timer.mark('publish')
 
         self.idx += 1
 
         # Log data
-        self.logger.writerow([rospy.get_time(), self.z_gt[0][0], self.z_gt[1][0], self.z_gt[2][0], 
-                              self.z[0][0], self.z[1][0], self.z[2][0],
-                              x_nom[0][0], x_nom[1][0], x_nom[2][0], x_nom[3][0], self.x_hat[0][0], 
-                              self.x_hat[1][0], self.x_hat[2][0], self.x_hat[3][0], u[0][0], u[1][0]])
+        self.logger.log([rospy.get_time(), self.z_gt[0][0], self.z_gt[1][0], self.z_gt[2][0], 
+                         self.z[0][0], self.z[1][0], self.z[2][0],
+                         x_nom[0][0], x_nom[1][0], x_nom[2][0], x_nom[3][0], self.x_hat[0][0], 
+                         self.x_hat[1][0], self.x_hat[2][0], self.x_hat[3][0], u[0][0], u[1][0]])
+        self.loop_timer.mark('logging')
 
         # ======== Check for end of trajectory ========
         if self.idx >= params.SEG_LEN:
@@ -159,33 +193,35 @@ class traj_tracker():
             rospy.loginfo("Finished tracking trajectory")
 
             # If we have a next trajectory, switch to tracking that. Otherwise, continue the trajectory (braking maneuver)
-            if self.X_nom_next is not None:
+            if self.traj_next is not None:
                 rospy.loginfo("Switching to next trajectory")
-                self.X_nom_curr = self.X_nom_next
-                self.U_nom_curr = self.U_nom_next
-                self.X_nom_next = None
-                self.X_nom_next = None
+                self.traj_curr = self.traj_next
+                self.traj_next = None
                 self.idx = 0
                 self.seg_num += 1
+                self.seg_num_pub.publish(self.seg_num)
             else:
                 rospy.loginfo("Executing braking maneuver")
 
         # ======== Check for end of braking maneuver ========
-        if self.idx >= len(self.U_nom_curr):
+        if self.idx >= self.traj_curr[1].shape[1]:
             rospy.loginfo("Braking maneuver completed")
             # Reset class variables
-            self.X_nom_curr = None
-            self.U_nom_curr = None
+            self.traj_curr = None
             self.v_des = 0
             self.idx = 0
 
             # Send multiple stop commands in case some don't go through
+            self.loop_timer.mark('console')
             for i in range(5):
                 self.rate.sleep()
                 self.stop_motors()
+            self.loop_timer.mark('braking')
+        self.loop_timer.mark('console')
 
         # ======== EKF Predict ========
         self.x_hat, self.P = EKF_prediction_step(self.x_hat, u, self.P, A, params.Q_EKF, params.DT)
+        self.loop_timer.mark('ekf_predict')
 
         # ======== Debugging ========
         x_err = self.z[0] - x_nom[0]
@@ -209,11 +245,16 @@ class traj_tracker():
         """
         rospy.loginfo("Running Trajectory Tracker")
         while not rospy.is_shutdown():
+            self.loop_timer.start_tick()
             
-            if self.X_nom_curr is not None:
+            if self.traj_curr is not None:
                 self.track()
 
+            self.loop_timer.end_tick()
             self.rate.sleep()
+
+        self.logger.close()
+        self.loop_timer.dump(self.timing_file)
         
         # spin() simply keeps python from exiting until this node is stopped
         rospy.spin()
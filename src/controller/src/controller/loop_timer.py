@@ -0,0 +1,140 @@
+# Timing instrumentation for tracker control loops
+
+import rospy
+import time
+import numpy as np
+
+from std_msgs.msg import Float64MultiArray, MultiArrayDimension
+
+
+class LoopTimer:
+    """Control loop timing instrumentation
+
+    Records per-stage durations of each control loop tick and the lateness of each tick
+    start into preallocated ring buffers. Percentiles over the buffers are periodically
+    published on a diagnostics topic and can be dumped at shutdown.
+
+    The lateness of a tick is the time its start is behind the ideal rospy.Rate schedule.
+    Like rospy.Rate, the schedule is reset if a tick is more than one period late. Ticks
+    which are not driven by a rate loop (e.g. run from a subscriber callback) have no
+    schedule, so lateness is not recorded if the period is None.
+
+    Attributes
+    ----------
+    stages : list of str
+        Names of the timed stages of a tick (a 'total' stage is appended).
+    period : float or None
+        Control loop period [s] (None if ticks are not driven by a rate loop).
+    durations : np.array (n_stages x capacity)
+        Ring buffer of stage durations [s] (NaN for stages not reached in a tick).
+    lateness : np.array (capacity)
+        Ring buffer of tick start lateness [s] (NaN if period is None).
+    n_ticks : int
+        Total number of recorded ticks.
+
+    """
+    def __init__(self, stages, period, capacity, topic=None, publish_period=None, percentiles=(50, 95, 99)):
+        self.stages = list(stages) + ['total']
+        self.stage_idx = {s: i for i, s in enumerate(self.stages)}
+        self.period = period
+        self.percentiles = list(percentiles)
+        self.capacity = capacity
+
+        self.durations = np.full((len(self.stages), capacity), np.nan)
+        self.lateness = np.full(capacity, np.nan)
+        self.n_ticks = 0
+        self.idx = 0
+
+        self.t_expected = None  # ideal start time of current tick
+        self.t_tick = None  # start time of current tick
+        self.t_mark = None  # time of last stage mark
+
+        if topic is not None:
+            self.pub = rospy.Publisher(topic, Float64MultiArray, queue_size=1)
+            rospy.Timer(rospy.Duration(publish_period), self.publish_diagnostics)
+
+
+    def start_tick(self):
+        """Start timing a control loop tick (call right after rate.sleep())"""
+        now = time.perf_counter()
+        self.idx = self.n_ticks % self.capacity
+        self.durations[:,self.idx] = np.nan
+
+        if self.period is not None:
+            if self.t_expected is None or now - self.t_expected > 2*self.period:
+                self.t_expected = now
+            else:
+                self.t_expected += self.period
+            self.lateness[self.idx] = now - self.t_expected
+
+        self.t_tick = now
+        self.t_mark = now
+
+
+    def mark(self, stage):
+        """Record duration of stage since the last mark (or start of tick)
+
+        Durations of a stage marked more than once in a tick are summed.
+
+        """
+        now = time.perf_counter()
+        i = self.stage_idx[stage]
+        if np.isnan(self.durations[i, self.idx]):
+            self.durations[i, self.idx] = now - self.t_mark
+        else:
+            self.durations[i, self.idx] += now - self.t_mark
+        self.t_mark = now
+
+
+    def end_tick(self):
+        """Finish timing a control loop tick"""
+        self.durations[-1, self.idx] = time.perf_counter() - self.t_tick
+        self.n_ticks += 1
+
+
+    def summary(self):
+        """Percentiles and maximum of recorded stage durations and tick lateness
+
+        Returns
+        -------
+        np.array ((n_stages+1) x (n_percentiles+1))
+            Rows are stages followed by lateness, columns are percentiles followed by max [s].
+
+        """
+        n = min(self.n_ticks, self.capacity)
+        data = np.vstack((self.durations[:,:n], self.lateness[:n]))
+        with np.errstate(all='ignore'):
+            stats = np.full((data.shape[0], len(self.percentiles)+1), np.nan)
+            for i in range(data.shape[0]):
+                row = data[i][~np.isnan(data[i])]
+                if len(row) > 0:
+                    stats[i,:-1] = np.percentile(row, self.percentiles)
+                    stats[i,-1] = np.max(row)
+        return stats
+
+
+    def publish_diagnostics(self, event):
+        """Publish timing summary (rows: stages and lateness, columns: percentiles and max)"""
+        stats = self.summary()
+        msg = Float64MultiArray()
+        msg.layout.dim = [MultiArrayDimension(label=','.join(self.stages + ['lateness']), size=stats.shape[0], stride=stats.size),
+                          MultiArrayDimension(label=','.join([str(p) for p in self.percentiles] + ['max']), size=stats.shape[1], stride=stats.shape[1])]
+        msg.data = stats.flatten().tolist()
+        self.pub.publish(msg)
+
+
+    def dump(self, filename):
+        """Log timing summary and save recorded timings to .npz file"""
+        stats = self.summary()
+        header = ''.join(['{:>10}'.format('p'+str(p)) for p in self.percentiles]) + '{:>10}'.format('max')
+        period = '%.1f ms' % (1e3*self.period) if self.period is not None else 'callback driven'
+        rospy.loginfo("Control loop timing [ms] over %d ticks (period %s)\n%s%s", self.n_ticks, period,
+                      '{:>12}'.format(''), header)
+        for name, row in zip(self.stages + ['lateness'], stats):
+            rospy.loginfo('{:>12}'.format(name) + ''.join(['{:10.2f}'.format(1e3*x) for x in row]))
+
+        # Chronological order of recorded ticks in the ring buffers
+        n = min(self.n_ticks, self.capacity)
+        order = (np.arange(n) + self.n_ticks - n) % self.capacity
+        np.savez(filename, stages=self.stages, durations=self.durations[:,order], lateness=self.lateness[order],
+                 period=self.period if self.period is not None else np.nan, n_ticks=self.n_ticks)
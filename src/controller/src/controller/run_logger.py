@@ -0,0 +1,142 @@
+# Buffered binary logger for tracker and planner run data
+
+import rospy
+import threading
+import numpy as np
+
+HEADER_PREFIX = 'RUNLOG'
+
+
+class RunLogger:
+    """Buffered binary run logger
+
+    Fixed-schema float64 records are appended to a preallocated ring buffer, and a
+    background thread flushes them in chunks to a binary columnar file, so no
+    formatting or file I/O happens in the caller's loop. If the buffer fills up
+    before it is flushed, new records are dropped and counted.
+
+    File format: one text header line 'RUNLOG,<n_cols>,<col_1>,...,<col_n>', followed
+    by chunks of an int64 record count n and the n x n_cols records stored column by
+    column (float64). Use load_run_log or run_log_to_csv to read it.
+
+    Attributes
+    ----------
+    columns : list of str
+        Column names.
+    buf : np.array (capacity x n_cols)
+        Ring buffer of records.
+    n_written : int
+        Total number of records appended.
+    n_flushed : int
+        Total number of records written to file.
+    n_dropped : int
+        Number of records dropped because the buffer was full.
+
+    """
+    def __init__(self, filename, columns, capacity, flush_period):
+        self.filename = filename
+        self.columns = list(columns)
+        self.capacity = capacity
+        self.flush_period = flush_period
+        self.buf = np.zeros((capacity, len(self.columns)))
+        self.n_written = 0
+        self.n_flushed = 0
+        self.n_dropped = 0
+
+        self.file = open(filename, 'wb')
+        self.file.write((','.join([HEADER_PREFIX, str(len(self.columns))] + self.columns) + '\n').encode())
+
+        self.log_lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.flush_event = threading.Event()
+        self.closed = False
+        self.flush_thread = threading.Thread(target=self.flush_loop, daemon=True)
+        self.flush_thread.start()
+
+
+    def log(self, record):
+        """Append a record (sequence of n_cols floats)"""
+        with self.log_lock:
+            n_buffered = self.n_written - self.n_flushed
+            if n_buffered >= self.capacity:
+                self.n_dropped += 1
+                return
+            self.buf[self.n_written % self.capacity] = record
+            self.n_written += 1
+        # Wake up flush thread early if buffer is half full
+        if n_buffered + 1 >= self.capacity // 2:
+            self.flush_event.set()
+
+
+    def flush(self):
+        """Write buffered records to file"""
+        with self.flush_lock:
+            n_written = self.n_written
+            n = n_written - self.n_flushed
+            if n == 0:
+                return
+            idx = np.arange(self.n_flushed, n_written) % self.capacity
+            chunk = np.ascontiguousarray(self.buf[idx].T)
+            np.array([n], dtype=np.int64).tofile(self.file)
+            chunk.tofile(self.file)
+            self.file.flush()
+            self.n_flushed = n_written
+
+
+    def flush_loop(self):
+        """Flush thread loop"""
+        while not self.closed:
+            self.flush_event.wait(self.flush_period)
+            self.flush_event.clear()
+            self.flush()
+
+
+    def close(self):
+        """Flush remaining records, close file and log number of written and dropped records"""
+        self.closed = True
+        self.flush_event.set()
+        self.flush_thread.join()
+        self.flush()
+        self.file.close()
+        if self.n_dropped > 0:
+            rospy.logwarn("Run log %s: %d records written, %d dropped (buffer full)", self.filename, self.n_written, self.n_dropped)
+        else:
+            rospy.loginfo("Run log %s: %d records written", self.filename, self.n_written)
+
+
+def load_run_log(filename):
+    """Load records from run log file
+
+    Returns
+    -------
+    columns : list of str
+        Column names.
+    data : np.array (N x n_cols)
+        Records.
+
+    """
+    with open(filename, 'rb') as f:
+        header = f.readline().decode().strip().split(',')
+        if header[0] != HEADER_PREFIX:
+            raise ValueError("Not a run log file: " + filename)
+        n_cols = int(header[1])
+        columns = header[2:]
+
+        chunks = []
+        while True:
+            n = np.fromfile(f, dtype=np.int64, count=1)
+            if len(n) == 0:
+                break
+            chunk = np.fromfile(f, dtype=np.float64, count=n[0]*n_cols)
+            if len(chunk) < n[0]*n_cols:
+                break  # incomplete last chunk (e.g. node was killed while flushing)
+            chunks.append(chunk.reshape((n_cols, n[0])).T)
+
+    data = np.vstack(chunks) if len(chunks) > 0 else np.zeros((0, n_cols))
+    return columns, data
+
+
+def run_log_to_csv(filename, csv_filename):
+    """Convert run log file to CSV file"""
+    columns, data = load_run_log(filename)
+    np.savetxt(csv_filename, data, fmt='%.10g', delimiter=',', header=','.join(columns), comments='')
@@ -3,6 +3,8 @@ import math
 from scipy.stats.distributions import chi2
 
 from planner.probabilistic_zonotope import pZ
+from planner.obstacle_grid import ObstacleGrid
+from planner.gain_schedule import GainSchedule
 
 # Planner params
 DT = 0.2  # time discretization
@@ -25,10 +27,23 @@ MAX_ORDER_INIT_REACH_SET = 10  # maximum order of reach set at the beginning of
 
 CALIBRATION_ITERATIONS = 10  # number of trajectory sample + safety check iterations to run during calibration
 CALIBRATION_MAX_TIME_MULTIPLIER = 1.5  # multiplier for estimating max time during calibration
+SAFETY_CHECK_BATCH_SIZE = 10  # number of sampled trajectory parameters checked together in one batched reachability pass
+SAFETY_CHECK_N_WORKERS = 3  # number of worker processes for checking sampled trajectory parameters (0: check in planner process)
+CHECK_LATENCY_WINDOW = 50  # number of recent safety check latencies kept by the check scheduler
+CHECK_LATENCY_PERCENTILE = 95  # percentile of recent safety check latencies used as latency estimate
+CHECK_LATENCY_FALLBACK = 1.0  # [s] conservative safety check latency estimate until a latency is recorded (e.g. during calibration)
+CHECK_CANDIDATE_POOL_SIZE = 50  # number of trajectory parameters sampled and sorted by distance to network output at a time
 
 COLLISION_CHECK_DIST_THRESH = np.inf  # distance threshold for nearby obstacles to check
 CHECK_DIST_REQ = not np.isinf(COLLISION_CHECK_DIST_THRESH)  # boolean indicating if above threshold is non-inf
 COLLISION_CHECK_ZONOTOPE_ORDER = 4  # max order of confidence zonotope for collision-checking
+COLLISION_CHECK_GRID_CELL_SIZE = 1.0  # [m] cell size of obstacle spatial index for collision-checking
+
+REACH_LIBRARY_FILE = 'reach_library'  # precomputed reach set library (in planner models folder), used to screen candidates if present
+REACH_LIBRARY_KW_RES = 0.05  # desired angular velocity resolution of reach set library
+REACH_LIBRARY_KV_RES = 0.05  # desired speed resolution of reach set library
+REACH_LIBRARY_V0_RES = 0.1  # initial speed resolution of reach set library
+REACH_LIBRARY_N_INIT = 3  # number of canonical initial reach sets in reach set library
 
 # Controller params
 # Q_LQR = np.diag([50, 50, 50, 150])  # LQR state cost matrix
@@ -39,6 +54,10 @@ COLLISION_CHECK_ZONOTOPE_ORDER = 4  # max order of confidence zonotope for colli
 # R_LQR = np.diag([10, 1])  # LQR control cost matrix
 Q_LQR = np.diag([1, 1, 5, 50])  # LQR state cost matrix
 R_LQR = np.diag([5, 1])  # LQR control cost matrix
+GAIN_SCHEDULE_THETA_RES = np.deg2rad(2.0)  # heading resolution of LQR gain schedule
+GAIN_SCHEDULE_V_RES = 0.02  # speed resolution of LQR gain schedule
+GAIN_SCHEDULE_FILE = 'gain_schedule.npz'  # precomputed gain schedule (in planner models folder), built by build_gain_schedule.py
+GAIN_SCHEDULE = GainSchedule(Q_LQR, R_LQR, DT, GAIN_SCHEDULE_THETA_RES, GAIN_SCHEDULE_V_RES)
 
 
 # from initial flight room tests
@@ -53,6 +72,13 @@ R_EKF = np.diag([0.01, 0.01, 0.001])  # EKF measurement noise covariance (for mo
 X_0 = np.array([-5, 0, 0, 0]).reshape((4,1))  # Initial robot state
 P_0 = 0.01 * np.diag(np.array([0.01, 0.01, 0.001, 0.0]))  # Initial state estimation covariance
 
+# Logging and control loop timing params
+TIMING_BUFFER_LEN = 1500  # number of control loop ticks kept for timing statistics
+TIMING_PUBLISH_PERIOD = 5.0  # [s] period for publishing control loop timing statistics
+TIMING_TOPIC = 'controller/timing'  # topic for control loop timing statistics
+RUN_LOG_BUFFER_LEN = 4096  # number of records buffered by run loggers before flushing to file
+RUN_LOG_FLUSH_PERIOD = 1.0  # [s] period for flushing run loggers to file
+
 # Environment
 
 # In-distribution (uncertainty)
@@ -69,6 +95,7 @@ ENV_INFO = {}
 ENV_INFO['goalZ'] = pZ(GOAL_ARR[0:2,[0]], np.diag(GOAL_ARR[[3,2],0]), np.zeros((2,2)))
 ENV_INFO['obstZ'] = [pZ(OBST_ARR_1[0:2,[0]], np.diag(OBST_ARR_1[[3,2],0]), np.zeros((2,2))),
                      pZ(OBST_ARR_2[0:2,[0]], np.diag(OBST_ARR_2[[3,2],0]), np.zeros((2,2)))]
+ENV_INFO['obstIndex'] = ObstacleGrid(ENV_INFO['obstZ'], COLLISION_CHECK_GRID_CELL_SIZE)
 # Rectangular area where bias is different: x_min, y_min, x_max, y_max
 ENV_INFO['bias_area_lims'] = [BIAS_ARR[0,0]-BIAS_ARR[3,0], 
                               BIAS_ARR[1,0]-BIAS_ARR[2,0], 
@@ -84,7 +111,18 @@ LM_BOX_YMAX = LANDMARK_POS[1] + LM_BOX_W / 2
 LM_BOX_YMIN = LANDMARK_POS[1] - LM_BOX_W / 2
 LIDAR_HEIGHT = 0.15  # Height of LiDAR off the ground [m]
 LIDAR_OFFSET = np.array([0.09, 0.0])  # x-y offset of LiDAR with respect to robot center
+LIDAR_MAX_FRAME_AGE = 0.3  # [s] point clouds older than this are skipped by landmark localization
+LANDMARK_MAP_FILE = None  # .npy file of landmark positions (n_landmarks x 2) for multi-landmark localization (None: single landmark at LANDMARK_POS)
+LANDMARK_VIEW_RANGE = 8.0  # [m] landmarks within this range of the state estimate are searched for
+
+PC_RECORD_CHUNKED = True  # record point clouds in chunk files (otherwise one .npy file per point cloud)
+PC_RECORD_CHUNK_FRAMES = 500  # number of point clouds per chunk file
+PC_RECORD_ENCODING = 'int16'  # point encoding for recording: 'float32', 'float16' or 'int16' (quantized)
+PC_RECORD_QUANT_RES = 0.005  # [m] quantization resolution for 'int16' point encoding
+PC_RECORD_QUEUE_LEN = 50  # max number of point clouds waiting to be written before dropping
+PC_RECORD_INDEX_PERIOD = 50  # number of point clouds between saves of the recording index
 
 MAX_SEGMENTS = 20
 
 MODEL_NAME = "unicycle_2_tough_obst_kv_0.5_kw_0.5_dist_kw_reward_small_goal_best"
+MODEL_WEIGHTS_FILE = MODEL_NAME + "_actor.npz"  # exported actor weights for NumPy-only inference (in planner models folder)
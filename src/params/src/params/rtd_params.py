@@ -8,6 +8,13 @@ T_PLAN = 0.4  # [s] amount of time allotted for planning itself
 TRAJ_TIME_LEN = 3.0  # [s] Trajectory total duration
 TRAJ_IDX_LEN = int(TRAJ_TIME_LEN / DT) + 1  # Trajectory length in timestep
 
+# Logging and control loop timing parameters
+TIMING_BUFFER_LEN = 1500  # number of control loop ticks kept for timing statistics
+TIMING_PUBLISH_PERIOD = 5.0  # [s] period for publishing control loop timing statistics
+TIMING_TOPIC = 'controller/timing'  # topic for control loop timing statistics
+RUN_LOG_BUFFER_LEN = 4096  # number of records buffered by run loggers before flushing to file
+RUN_LOG_FLUSH_PERIOD = 1.0  # [s] period for flushing run loggers to file
+
 NEXT_IC_IDX = 5  # Index of trajectory for next set of initial conditions for replanning
 
 N_DIM = 2  # workspace dimension (i.e. 2D or 3D)
@@ -23,13 +30,25 @@ DELTA_V_PEAK_MAX = 3.0  # Delta from initial velocity constraint
 R_GOAL_REACHED = 0.3  # [m] stop planning when within this dist of goal
 
 N_PLAN_MAX = 10000  # Max number of plans to evaluate
+N_PLAN_CHUNK = 500  # Number of plans checked against obstacles at once
+PLAN_METHOD = 'analytic'  # 'analytic' (solve for v_peak, sampling as fallback) or 'sampling'
 
 MODEL_NAME = 'quadrotor_linear_planning_model.mat'
 
-P_0 = np.array([[-5], [0]])  # Initial position
+if N_DIM == 2:
+    P_0 = np.array([[-5], [0]])  # Initial position
+
+    P_GOAL = np.array([[5], [0]])  # Goal position
+
+    OBSTACLES = [(np.array([3, 1]), 1.5),
+                 (np.array([0, -1.5]), 1.5),
+                 (np.array([-3, 1]), 1.5)]
+else:
+    P_0 = np.array([[-5], [0], [1]])  # Initial position
 
-P_GOAL = np.array([[5], [0]])  # Goal position
+    P_GOAL = np.array([[5], [0], [1]])  # Goal position
 
-OBSTACLES = [(np.array([3, 1]), 1.5),
-             (np.array([0, -1.5]), 1.5),
-             (np.array([-3, 1]), 1.5)]
\ No newline at end of file
+    # Spheres (center, radius) in 3D
+    OBSTACLES = [(np.array([3, 1, 1]), 1.5),
+                 (np.array([0, -1.5, 1]), 1.5),
+                 (np.array([-3, 1, 1]), 1.5)]
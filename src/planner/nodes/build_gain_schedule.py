@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+
+import rospkg
+import time
+
+import params.params as params
+
+
+if __name__ == '__main__':
+    # Precompute LQR gain schedule over all headings and speed range and save to models folder
+    filename = rospkg.RosPack().get_path('planner') + '/models/' + params.GAIN_SCHEDULE_FILE
+    print("Building gain schedule")
+    start_time = time.time()
+    params.GAIN_SCHEDULE.precompute(params.KV_LIMS)
+    params.GAIN_SCHEDULE.save(filename)
+    print("Saved gain schedule with ", len(params.GAIN_SCHEDULE.cache), " gains to ", filename, 
+          " in ", round(time.time() - start_time, 1), " s")
@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+
+import numpy as np
+import rospkg
+import time
+
+from planner.reach_library import build_reach_library, canonical_initial_sets
+import params.params as params
+
+
+if __name__ == '__main__':
+    # Build reach set library over trajectory parameter grid and save to models folder
+    filename = rospkg.RosPack().get_path('planner') + '/models/' + params.REACH_LIBRARY_FILE
+    kw_grid = np.arange(params.KW_LIMS[0], params.KW_LIMS[1] + params.REACH_LIBRARY_KW_RES/2, params.REACH_LIBRARY_KW_RES)
+    kv_grid = np.arange(params.KV_LIMS[0], params.KV_LIMS[1] + params.REACH_LIBRARY_KV_RES/2, params.REACH_LIBRARY_KV_RES)
+    v0_grid = np.arange(params.KV_LIMS[0], params.KV_LIMS[1] + params.REACH_LIBRARY_V0_RES/2, params.REACH_LIBRARY_V0_RES)
+
+    print("Building reach set library with ", len(kw_grid)*len(kv_grid)*len(v0_grid)*params.REACH_LIBRARY_N_INIT, " entries")
+    start_time = time.time()
+    init_sets = canonical_initial_sets(params.REACH_LIBRARY_N_INIT)
+    build_reach_library(filename, kw_grid, kv_grid, v0_grid, init_sets, params.ENV_INFO)
+    print("Saved reach set library to ", filename, " in ", round(time.time() - start_time, 1), " s")
@@ -0,0 +1,14 @@
+#!/usr/bin/env python
+
+import rospkg
+
+import planner.NN_utils as nn_util
+import params.params as params
+
+
+if __name__ == '__main__':
+    # Export actor weights of trained model to models folder for NumPy-only inference
+    models_path = rospkg.RosPack().get_path('planner') + '/models/'
+    model = nn_util.load_model(models_path + params.MODEL_NAME)
+    nn_util.export_actor_weights(model, models_path + params.MODEL_WEIGHTS_FILE)
+    print("Saved actor weights to ", models_path + params.MODEL_WEIGHTS_FILE)
@@ -4,13 +4,13 @@ import numpy as np
 import time
 import rospy
 import rospkg
-import csv
 import os
 
 
 from planner.msg import State, NominalTrajectory
 import planner.planner_utils as plan_util
-import planner.NN_utils as nn_util
+from planner.nn_policy import load_policy
+from controller.run_logger import RunLogger
 import params.params as params
 
 
@@ -38,20 +38,19 @@ class nn_planner():
         #self.x_nom_hist = params.X_0
         self.traj_msg = None
 
-        # Load learned model
+        # Load learned policy (from cached actor weights, exported from the trained model on first run)
         rospy.loginfo("Loading model")
-        model_file = rospkg.RosPack().get_path('planner') + '/models/' + params.MODEL_NAME
-        self.model = nn_util.load_model(model_file)
+        models_path = rospkg.RosPack().get_path('planner') + '/models/'
+        self.policy = load_policy(models_path + params.MODEL_NAME, models_path + params.MODEL_WEIGHTS_FILE)
 
         self.done = False  # flag to check when to stop planning
         self.seg_num = 1  # current segment number
 
         # Logging
         path = '/home/navlab-nuc/Rover/flightroom_data/6_15_2022/planner_logs'
-        filename = 'nn_plan_'+str(rospy.get_time())+'.csv'
-        self.log_file = open(os.path.join(path, filename), 'w')
-        self.logger = csv.writer(self.log_file)
-        self.logger.writerow(['t', 'kw', 'kv'])
+        filename = 'nn_plan_'+str(rospy.get_time())+'.bin'
+        self.logger = RunLogger(os.path.join(path, filename), ['t', 'kw', 'kv'], 
+                                params.RUN_LOG_BUFFER_LEN, params.RUN_LOG_FLUSH_PERIOD)
 
 
     def replan(self, event):
@@ -61,7 +60,7 @@ class nn_planner():
         print("Replanning: t = ", rospy.get_time() - self.init_time)
 
         # Get network output
-        [action_mean, action_cov] = nn_util.evaluate_model(self.model, self.x_nom_end)
+        [action_mean, action_cov] = self.policy.evaluate(self.x_nom_end)
         kw = action_mean[0,0]; kv = action_mean[0,1]
 
         print(" Generating trajectory segment with kw = ", round(kw,2), "kv = ", round(kv,2))
@@ -95,7 +94,7 @@ class nn_planner():
             self.done = True
 
         # Write to log
-        self.logger.writerow([rospy.get_time(), kw, kv])
+        self.logger.log([rospy.get_time(), kw, kv])
 
 
     def run(self):
@@ -114,7 +113,7 @@ class nn_planner():
 
             self.rate.sleep()
 
-        self.log_file.close()
+        self.logger.close()
         rospy.loginfo("Exiting node")
 
 
@@ -3,15 +3,20 @@
 import rospy
 import numpy as np
 import rospkg
-import csv
 import os
 import time
+import threading
 
+from std_msgs.msg import Int32
 from planner.msg import State, Control, NominalTrajectory
 import planner.planner_utils as plan_util
 import planner.reachability_utils as reach_util
-import planner.NN_utils as nn_util
+from planner.nn_policy import load_policy
 from planner.probabilistic_zonotope import pZ
+from planner.reach_library import ReachLibrary
+from planner.safety_check_pool import SafetyCheckPool
+from planner.check_scheduler import CheckScheduler
+from controller.run_logger import RunLogger
 import params.params as params
 
 
@@ -24,6 +29,28 @@ class reach_planner():
     def __init__(self):
         #np.random.seed(0)
 
+        # Load precomputed LQR gain schedule, if it has been built (otherwise gains are solved on demand)
+        gain_schedule_file = rospkg.RosPack().get_path('planner') + '/models/' + params.GAIN_SCHEDULE_FILE
+        if params.GAIN_SCHEDULE.load(gain_schedule_file):
+            print("Loaded gain schedule")
+        else:
+            print("No gain schedule found, run build_gain_schedule.py to precompute it")
+
+        # Load precomputed reach set library for ordering candidates, if it has been built
+        library_file = rospkg.RosPack().get_path('planner') + '/models/' + params.REACH_LIBRARY_FILE
+        if os.path.isfile(library_file + '.npz'):
+            print("Loading reach set library")
+            self.reach_library = ReachLibrary(library_file)
+        else:
+            self.reach_library = None
+
+        # Start worker processes for checking sampled trajectory parameters in parallel (forked 
+        # before the node is initialized, so no rospy threads are running at fork time)
+        if params.SAFETY_CHECK_N_WORKERS > 0:
+            self.check_pool = SafetyCheckPool(params.SAFETY_CHECK_N_WORKERS)
+        else:
+            self.check_pool = None
+
         # Initialize node 
         rospy.init_node('reach_planner', anonymous=True, disable_signals=True)
         self.rate = rospy.Rate(10)
@@ -31,61 +58,159 @@ class reach_planner():
         # Publishers
         self.traj_pub = rospy.Publisher('planner/traj', NominalTrajectory, queue_size=10)
 
-        # Replan timer
-        rospy.Timer(rospy.Duration(params.T_SEG), self.replan)
-        self.init_time = rospy.get_time()
-
         # Class variables
         self.x_nom0 = params.X_0
         self.P0 = params.P_0
-        self.traj_msg = None
+        self.traj_buffer = {}  # planned trajectory messages waiting to be published, by segment number
+        self.buffer_cond = threading.Condition()
+        self.tick = 0  # number of publish timer ticks
+        self.tracker_seg_num = 0  # segment the tracker has taken as its current trajectory
 
-        # Load learned model
+        # Load learned policy (from cached actor weights, exported from the trained model on first run)
         print("Loading model")
-        model_file = rospkg.RosPack().get_path('planner') + '/models/' + params.MODEL_NAME
-        self.model = nn_util.load_model(model_file)
+        models_path = rospkg.RosPack().get_path('planner') + '/models/'
+        self.policy = load_policy(models_path + params.MODEL_NAME, models_path + params.MODEL_WEIGHTS_FILE)
 
         # Get initial reach set
         self.Xaug0 = reach_util.initialize_reachability_analysis(params.X_0, params.P_0)
 
-        # Calibration to estimate max time it would take to sample a trajectory parameter and check its safety
-        self.max_check_time = plan_util.calibrate_sample_safety_check_time(
-            params.X_0, self.Xaug0, params.P_0, params.ENV_INFO)
-        print("Calibrating max safety check time: ", self.max_check_time, " s")
+        # Scheduler for checking sampled trajectory parameters within the planning deadline
+        self.check_scheduler = CheckScheduler(params.CHECK_LATENCY_WINDOW, params.CHECK_LATENCY_PERCENTILE,
+            params.CHECK_CANDIDATE_POOL_SIZE, params.SAFETY_CHECK_BATCH_SIZE, params.CHECK_LATENCY_FALLBACK)
+
+        # Calibration to seed the safety check latency estimate, run in the background while 
+        # planning starts (latencies of the planner's own checks are recorded as well, and 
+        # params.CHECK_LATENCY_FALLBACK is used until the first latency is recorded)
+        self.calibration_thread = threading.Thread(target=self.calibrate, daemon=True)
+        self.calibration_thread.start()
 
         self.done = False  # flag to check when to stop planning
-        self.seg_num = 1  # current segment number
+        self.stop_planning = False  # flag to stop planning thread at shutdown
+        self.seg_num = 1  # segment number currently being planned
 
         # Logging
         path = '/home/navlab-nuc/Rover/flightroom_data/6_15_2022/planner_logs/'
-        filename = 'reach_plan_'+str(rospy.get_time())+'.csv'
-        self.log_file = open(os.path.join(path, filename), 'w')
-        self.logger = csv.writer(self.log_file)
-        self.logger.writerow(['t', 'kw', 'kv', 'rs'])
+        filename = 'reach_plan_'+str(rospy.get_time())+'.bin'
+        self.logger = RunLogger(os.path.join(path, filename), ['t', 'kw', 'kv', 'rs'], 
+                                params.RUN_LOG_BUFFER_LEN, params.RUN_LOG_FLUSH_PERIOD)
+
+        # Subscribers
+        seg_num_sub = rospy.Subscriber('controller/seg_num', Int32, self.seg_num_callback)
+
+        # Publish timer and planning thread
+        rospy.Timer(rospy.Duration(params.T_SEG), self.publish_plan)
+        self.init_time = rospy.get_time()
+        self.planning_thread = threading.Thread(target=self.planning_loop, daemon=True)
+        self.planning_thread.start()
         
 
-    def replan(self, event):
+    def calibrate(self):
+        """Calibration thread
+
+        Estimates the time needed to check the safety of a batch of sampled trajectory 
+        parameters, and records it in the check scheduler.
+
+        """
+        max_check_time = plan_util.calibrate_sample_safety_check_time(
+            params.X_0, reach_util.initialize_reachability_analysis(params.X_0, params.P_0), 
+            params.P_0, params.ENV_INFO, self.check_scheduler)
+        print("Calibrating max safety check time: ", max_check_time, " s, latency estimate: ", 
+              round(self.check_scheduler.latency_estimate(),3), " s")
+
+
+    def publish_plan(self, event):
+        """Publish timer callback
+
+        Publishes planned trajectory segments which are due.
+
+        """
+        with self.buffer_cond:
+            self.tick += 1
+            self.publish_ready_segments()
+            self.buffer_cond.notify_all()
+
+
+    def seg_num_callback(self, data):
+        """Tracker segment number subscriber callback
+
+        Publishes the next segment if it was waiting for the tracker to take the previous one.
+
+        """
+        with self.buffer_cond:
+            self.tracker_seg_num = data.data
+            self.publish_ready_segments()
+            self.buffer_cond.notify_all()
+
+
+    def publish_ready_segments(self):
+        """Publish buffered trajectory segments which are due (buffer_cond must be held)
+
+        In order to establish receding horizon planning, the first segment is sent at the
+        start of segment 2. Segment k > 1 is sent as soon as it is planned, but not before 
+        the start of segment k, and not before the tracker has confirmed that it took segment 
+        k-1 as its current trajectory (the tracker only holds one next trajectory, so an earlier
+        segment k would overwrite segment k-1).
+
+        """
+        for seg_num in sorted(self.traj_buffer):
+            if max(seg_num, 2) > self.tick or seg_num - 1 > self.tracker_seg_num:
+                break
+            print("  Publishing trajectory for segment ", seg_num, "\n")
+            self.traj_pub.publish(self.traj_buffer.pop(seg_num))
+
+
+    def planning_loop(self):
+        """Planning thread
+
+        Plans segments back to back, starting the next segment as soon as the current one
+        is selected rather than waiting for the timer, so time left over from one segment
+        carries over to the next. Segments are double-buffered: the next segment is planned
+        while the previous one waits to be published.
+
+        """
+        while not self.done and not self.stop_planning and not rospy.is_shutdown():
+            traj_msg = self.plan_segment()
+
+            if traj_msg is not None:
+                with self.buffer_cond:
+                    # Wait for previously planned segment to be published
+                    while len(self.traj_buffer) > 0 and not self.stop_planning and not rospy.is_shutdown():
+                        self.buffer_cond.wait(0.1)
+                    self.traj_buffer[self.seg_num] = traj_msg
+                    self.publish_ready_segments()
+
+            self.seg_num += 1
+            if self.seg_num >= params.MAX_SEGMENTS:
+                rospy.loginfo("Max number of segments reached...stopping planning")
+                self.done = True
+
+
+    def plan_segment(self):
         """Plan next trajectory segment
 
+        Returns
+        -------
+        NominalTrajectory or None
+            Trajectory message of the planned segment (None if no safe trajectory was found).
+
         """
+        traj_msg = None
         if not self.done: 
-            # In order to establish receding horizon planning, we plan the 
-            # first segment during segment 1 and send it at the start of planning segment 2
-            if self.seg_num == 2:
-                print("  Publishing trajectory for segment 1 \n")
-                self.traj_pub.publish(self.traj_msg)
-
             print("Replanning : segment ", self.seg_num, ", t = ", rospy.get_time() - self.init_time)
 
             # Reduce initial reach set to specified order
             self.Xaug0 = pZ.reduce(self.Xaug0, params.MAX_ORDER_INIT_REACH_SET)
 
+            # Send initial conditions for this segment to safety check workers
+            if self.check_pool is not None:
+                self.check_pool.start_segment(self.x_nom0, self.Xaug0, self.P0)
+
             # Get network output
             start_time = time.time()
-            [action_mean, action_cov] = nn_util.evaluate_model(self.model, self.x_nom0)
+            [action_mean, action_cov] = self.policy.evaluate(self.x_nom0)
             kw0 = action_mean[0,0]; kv0 = action_mean[0,1]
             #print("  Network sampled parameters: kw = ", round(kw0,3), ", kv = ", round(kv0,3))
-            self.logger.writerow([rospy.get_time(), kw0, kv0, 2])
+            self.logger.log([rospy.get_time(), kw0, kv0, 2])
 
             # Check if trajectory specified by above nominal trajectory is safe (fail-safe trajectory is appended)
             start_time = time.time()
@@ -96,8 +221,8 @@ class reach_planner():
                 # Select network output as trajectory parameter
                 kw_safe = kw0; kv_safe = kv0
                 # Store selected trajectory information
-                Xaug = cand_Xaug
-                P_all = cand_P_all
+                Xaug0_next = cand_Xaug[params.SEG_LEN]
+                P0_next = cand_P_all[:,:,params.SEG_LEN]
                 xnom_seg = cand_xnom_seg
                 unom_seg = cand_unom_seg
                 
@@ -105,33 +230,57 @@ class reach_planner():
             else:
                 # Calculate remaining time for planning next trajectory segment
                 remaining_planning_time = (self.seg_num+1)*params.T_SEG - (rospy.get_time() - self.init_time)
-                # Init selected trajectory parameter dist
-                selected_trajectory_param_dist_sq = np.inf
-                # Sample new trajectory parameter if time remaining in current segment is sufficient
+                # Sample new trajectory parameters near network output, closest ones checked first
+                # (those predicted to be collision free by the reach set library before the others)
+                screen = None
+                if self.reach_library is not None:
+                    x_nom0 = self.x_nom0; P0 = self.P0
+                    screen = lambda kw, kv: self.reach_library.screen(kw, kv, x_nom0, P0, params.ENV_INFO)
+                self.check_scheduler.start(kw0, kv0, lambda: plan_util.sample_near_network_output(action_mean, action_cov), screen)
                 print("  Initial trajectory unsafe, remaining planning time: ", remaining_planning_time)
-                
-                while remaining_planning_time > self.max_check_time:
 
-                    # Sample new trajectory parameter near network output
-                    [kw, kv] = plan_util.sample_near_network_output(action_mean, action_cov)
-                    #print("  Resampling kw = ", round(kw,3), " kv = ", round(kv,3))
-                    self.logger.writerow([rospy.get_time(), kw, kv, 1])
-
-                    # Check safety of sampled trajectory parameter
-                    [isSafe, cand_Xaug, _, P_all, cand_xnom_seg, cand_unom_seg] = plan_util.check_trajectory_parameter_safety(kw, kv, self.x_nom0, self.Xaug0, self.P0, params.ENV_INFO)
+                # Check sampled trajectory parameters in worker processes, then recompute the 
+                # reach sets of the selected one
+                if self.check_pool is not None:
+                    [kw_safe, kv_safe] = self.sample_safe_trajectory_parameter_parallel()
+                    if kw_safe is not None:
+                        [safeTrajectoryFound, cand_Xaug, _, cand_P_all, xnom_seg, unom_seg] = plan_util.check_trajectory_parameter_safety(kw_safe, kv_safe, self.x_nom0, self.Xaug0, self.P0, params.ENV_INFO)
+                        Xaug0_next = cand_Xaug[params.SEG_LEN]
+                        P0_next = cand_P_all[:,:,params.SEG_LEN]
+                        remaining_planning_time = 0
+                    else:
+                        # Workers were kept busy until the deadline, update remaining time
+                        remaining_planning_time = (self.seg_num+1)*params.T_SEG - (rospy.get_time() - self.init_time)
+                
+                # Only start another check if it is expected to finish before the deadline
+                while self.check_scheduler.has_time(remaining_planning_time):
+
+                    # Next batch of candidates closer to the network output than the selected one
+                    [kw, kv] = self.check_scheduler.next_batch()
+                    for i in range(len(kw)):
+                        self.logger.log([rospy.get_time(), kw[i], kv[i], 1])
+
+                    if len(kw) == 0:
+                        remaining_planning_time = (self.seg_num+1)*params.T_SEG - (rospy.get_time() - self.init_time)
+                        continue
+
+                    # Check safety of sampled trajectory parameters
+                    t_check = time.time()
+                    [isSafe, cand_reach_sets, cand_xnom, cand_unom, cand_N] = plan_util.check_trajectory_parameter_safety_batch(kw, kv, self.x_nom0, self.Xaug0, self.P0, params.ENV_INFO)
+                    self.check_scheduler.record(time.time() - t_check)
                     
-                    # Select trajectory if it is safe and if parameter distance is lower than previously selected parameter
-                    current_trajectory_param_dist_sq = (kw-kw0)**2 + (kv-kv0)**2
-                    if isSafe and current_trajectory_param_dist_sq < selected_trajectory_param_dist_sq:
+                    # Select closest safe trajectory if its parameter distance is lower than previously selected parameter
+                    b = self.check_scheduler.update(kw, kv, isSafe)
+                    if b is not None:
                         safeTrajectoryFound = True
                         # Select current trajectory parameter
-                        kw_safe = kw; kv_safe = kv
-                        selected_trajectory_param_dist_sq = current_trajectory_param_dist_sq
+                        kw_safe = kw[b]; kv_safe = kv[b]
                         # Store selected trajectory information
-                        Xaug = cand_Xaug
-                        P_all = cand_P_all
-                        xnom_seg = cand_xnom_seg
-                        unom_seg = cand_unom_seg
+                        [cand_Xaug_G, cand_Xaug_Sigma, _, cand_P_all] = cand_reach_sets
+                        Xaug0_next = reach_util.get_batch_reach_set(cand_xnom, cand_Xaug_G, cand_Xaug_Sigma, b, params.SEG_LEN)
+                        P0_next = cand_P_all[b,:,:,params.SEG_LEN]
+                        xnom_seg = cand_xnom[b,:,:cand_N[b]]
+                        unom_seg = cand_unom[b,:,:cand_N[b]-1]
                         
                     # Calculate remaining time for planning upcoming segment
                     remaining_planning_time = (self.seg_num+1)*params.T_SEG - (rospy.get_time() - self.init_time)
@@ -139,25 +288,21 @@ class reach_planner():
             if safeTrajectoryFound:
                 # Update initial conditions for next segment
                 self.x_nom0 = xnom_seg[:,[params.SEG_LEN]]
-                self.Xaug0 = Xaug[params.SEG_LEN]
-                self.P0 = P_all[:,:,params.SEG_LEN]
+                self.Xaug0 = Xaug0_next
+                self.P0 = P0_next
                 
                 print("  Generating trajectory segment with kw = ", round(kw_safe,3), "kv = ", round(kv_safe,3))
                 print("  Segment endpoint: x = ", round(self.x_nom0[0][0],2), 
                                         " y = ", round(self.x_nom0[1][0],2), 
                                         " theta = ", round(self.x_nom0[2][0],2))
             
-                # Publish trajectory
-                self.traj_msg = NominalTrajectory()
-                self.traj_msg.states = plan_util.wrap_states(xnom_seg)
-                self.traj_msg.controls = plan_util.wrap_controls(unom_seg)
-                # For segment 1, we hold off on publishing until start of planning segment 2
-                if self.seg_num != 1:
-                    print("  Publishing trajectory for segment ", self.seg_num, "\n")
-                    self.traj_pub.publish(self.traj_msg)
+                # Trajectory message to publish
+                traj_msg = NominalTrajectory()
+                traj_msg.states = plan_util.wrap_states(xnom_seg)
+                traj_msg.controls = plan_util.wrap_controls(unom_seg)
 
                 # Write to log
-                self.logger.writerow([rospy.get_time(), kw_safe, kv_safe, 0])
+                self.logger.log([rospy.get_time(), kw_safe, kv_safe, 0])
 
                 # Check if we have reached the goal region
                 reachedGoal = plan_util.is_trajectory_inside_region(xnom_seg, params.GOAL_ARR)
@@ -169,10 +314,46 @@ class reach_planner():
                 print("Failed to find safe trajectory - executing fail-safe maneuver")
                 self.done = True
 
-            self.seg_num += 1
-            if self.seg_num >= params.MAX_SEGMENTS:
-                rospy.loginfo("Max number of segments reached...stopping planning")
-                self.done = True
+        return traj_msg
+
+
+    def sample_safe_trajectory_parameter_parallel(self):
+        """Check safety of scheduled trajectory parameters in worker processes
+
+        Keeps all workers busy until the remaining planning time is only enough for the exact
+        recheck of the selected parameter, and returns the safe trajectory parameter closest 
+        to the network output.
+
+        Returns
+        -------
+        kw_safe, kv_safe : float
+            Selected trajectory parameter (None if no safe one was found).
+
+        """
+        kw_safe = None; kv_safe = None
+        remaining_planning_time = (self.seg_num+1)*params.T_SEG - (rospy.get_time() - self.init_time)
+
+        while self.check_scheduler.has_time(remaining_planning_time):
+
+            # Keep two batches queued per worker
+            while self.check_pool.total_pending() < 2*self.check_pool.n_workers:
+                [kw, kv] = self.check_scheduler.next_batch()
+                if len(kw) == 0:
+                    break
+                for i in range(len(kw)):
+                    self.logger.log([rospy.get_time(), kw[i], kv[i], 1])
+                self.check_pool.submit(kw, kv)
+
+            # Select closest safe trajectory parameter among returned results
+            for kw, kv, isSafe, latency in self.check_pool.get_results(timeout=0.01):
+                self.check_scheduler.record(latency)
+                b = self.check_scheduler.update(kw, kv, isSafe)
+                if b is not None:
+                    kw_safe = kw[b]; kv_safe = kv[b]
+
+            remaining_planning_time = (self.seg_num+1)*params.T_SEG - (rospy.get_time() - self.init_time)
+
+        return kw_safe, kv_safe
 
 
     def run(self):
@@ -181,17 +362,23 @@ class reach_planner():
         """
         rospy.loginfo("Running Reachability Planner")
 
-        while not rospy.is_shutdown() and not self.done:
+        while not rospy.is_shutdown() and (not self.done or len(self.traj_buffer) > 0):
             # connections = self.traj_pub.get_num_connections()
             # rospy.loginfo("Waiting for tracker, connections: %d", connections)
 
             # if connections > 0:
             
-            # loop while replan is periodically called by Timer
+            # loop while segments are planned by planning thread and published by Timer
 
             self.rate.sleep()
 
-        self.log_file.close()
+        # Wait for planning thread to finish its current segment before closing the logger and pool
+        self.stop_planning = True
+        self.planning_thread.join()
+        self.logger.close()
+        if self.check_pool is not None:
+            self.check_pool.close()
+        rospy.loginfo("Gain schedule hits: %d, misses: %d", params.GAIN_SCHEDULE.hits, params.GAIN_SCHEDULE.misses)
         rospy.loginfo("Exiting node")
 
 
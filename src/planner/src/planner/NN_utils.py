@@ -3,6 +3,7 @@ import torch
 import torch.nn as nn
 from torch.distributions import Normal
 
+from planner.nn_policy import policy_inputs, map_control_inputs
 import params.params as params
 
 class ActorCritic(nn.Module):
@@ -80,39 +81,54 @@ def evaluate_model(model, x_nom):
     Get model output distribution mean and covariance
     """
 
-    #get model device
-    use_cuda = False
-    device   = torch.device("cuda" if use_cuda else "cpu")
-
-    #get input state for model
-    state = torch.FloatTensor(np.concatenate((x_nom[:,[-1]],params.OBST_ARR_1,params.OBST_ARR_2),axis=0).T).to(device)
-
-    #get model output distribution
-    dist, _ = model(state)
-
-    #get mean of output distribution
-    action_mean = map_control_inputs(dist.loc.cpu().detach().numpy())
+    #get model output mean for final state (actor only)
+    action_mean = evaluate_model_batch(model, x_nom[:,-1][None,:])
 
     #get covariance of output distribution
-    if params.SAMPLE_METHOD == 1: action_cov = np.diag(dist.scale.cpu().detach().numpy()[0])
+    if params.SAMPLE_METHOD == 1: action_cov = np.diag(model.log_std.exp().detach().numpy()[0])
     elif params.SAMPLE_METHOD == 2: action_cov = params.SAMPLE_STD_DEV*np.identity(action_mean.shape[1])
 
     return [action_mean, action_cov]
 
 
-def map_control_inputs(action_array):
-    """
-    TODO
+def evaluate_model_batch(model, x_noms):
+    """Get model output distribution means for a batch of states
+
+    Only the actor head is evaluated.
+
+    Parameters
+    ----------
+    x_noms : np.array (B x 4)
+        Batch of nominal states.
+
+    Returns
+    -------
+    np.array (B x 2)
+        Trajectory parameters (kw, kv) of each state.
+
     """
-    for i in range(action_array.shape[0]):
+    state = torch.FloatTensor(policy_inputs(x_noms))
+    with torch.no_grad():
+        mu = model.actor(state)
+    return map_control_inputs(mu.numpy())
+
 
-        kw = action_array[i,0]; kv = action_array[i,1]
-        kw_scaled = ((kw + 1.0)/2.0); kv_scaled = ((kv + 1.0)/2.0);  # between 0 and 1
-        kw_mapped = kw_scaled*(params.KW_LIMS[1] - params.KW_LIMS[0]) + params.KW_LIMS[0]; #mapped to output range
-        kv_mapped = kv_scaled*(params.KV_LIMS[1] - params.KV_LIMS[0]) + params.KV_LIMS[0]; #mapped to output range
+def export_actor_weights(model, filename):
+    """Save actor weights of trained model to .npz file for NumPy-only inference (nn_policy.NumpyPolicy)
 
-        #get output array
-        action_array[i,0] = np.clip(kw_mapped, params.KW_LIMS[0], params.KW_LIMS[1])
-        action_array[i,1] = np.clip(kv_mapped, params.KV_LIMS[0], params.KV_LIMS[1])
+    Parameters
+    ----------
+    model : ActorCritic
+        Trained model.
+    filename : str
+        Path of .npz file.
 
-    return action_array
\ No newline at end of file
+    """
+    linear_layers = [m for m in model.actor if isinstance(m, nn.Linear)]
+    leaky_relus = [m for m in model.actor if isinstance(m, nn.LeakyReLU)]
+    arrays = {}
+    for i, layer in enumerate(linear_layers):
+        arrays['W_'+str(i)] = layer.weight.detach().cpu().numpy()
+        arrays['b_'+str(i)] = layer.bias.detach().cpu().numpy()
+    np.savez(filename, n_layers=len(linear_layers), log_std=model.log_std.detach().cpu().numpy(),
+             negative_slope=leaky_relus[0].negative_slope, **arrays)
@@ -0,0 +1,144 @@
+# Deadline-aware scheduler for checking safety of sampled trajectory parameters
+
+import threading
+import numpy as np
+
+
+class CheckScheduler:
+    """Anytime scheduler for trajectory parameter safety checks
+
+    Keeps a rolling window of safety check latencies and only starts a new check if a high
+    percentile of the recent latencies fits in the remaining planning time. Sampled trajectory
+    parameters are checked in order of increasing distance to the network output (candidates
+    predicted to be collision free by an optional screen first), and candidates which are
+    farther than the best safe one found so far are skipped, so the best safe trajectory
+    parameter is always available when the deadline arrives.
+
+    Attributes
+    ----------
+    latencies : np.array
+        Ring buffer of recent check latencies [s].
+    n_latencies : int
+        Number of recorded latencies (up to window size).
+    percentile : float
+        Percentile of recent latencies used as latency estimate.
+    fallback : float
+        Latency estimate used until a latency has been recorded [s].
+    pool_size : int
+        Number of trajectory parameters sampled and sorted at a time.
+    batch_size : int
+        Number of trajectory parameters per check.
+    best_dist_sq : float
+        Squared distance of best safe trajectory parameter to network output.
+
+    """
+    def __init__(self, window, percentile, pool_size, batch_size, fallback):
+        self.latencies = np.zeros(window)
+        self.n_latencies = 0
+        self.latency_idx = 0
+        self.latency_lock = threading.Lock()
+        self.percentile = percentile
+        self.fallback = fallback
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+
+        self.kw0 = None; self.kv0 = None
+        self.sampler = None
+        self.screen = None
+        self.best_dist_sq = np.inf
+        self.kw_queue = np.zeros(0); self.kv_queue = np.zeros(0)
+
+
+    def record(self, latency):
+        """Record latency of a batch safety check (of up to batch_size trajectory parameters)"""
+        with self.latency_lock:
+            self.latencies[self.latency_idx] = latency
+            self.latency_idx = (self.latency_idx + 1) % len(self.latencies)
+            self.n_latencies = min(self.n_latencies + 1, len(self.latencies))
+
+
+    def latency_estimate(self):
+        """High percentile of recent check latencies (fallback if none recorded)"""
+        with self.latency_lock:
+            if self.n_latencies == 0:
+                return self.fallback
+            return np.percentile(self.latencies[:self.n_latencies], self.percentile)
+
+
+    def has_time(self, remaining_time):
+        """Check if there is enough remaining time for another safety check"""
+        return remaining_time > self.latency_estimate()
+
+
+    def start(self, kw0, kv0, sampler, screen=None):
+        """Start scheduling candidates for a new planning segment
+
+        Parameters
+        ----------
+        kw0, kv0 : float
+            Network output trajectory parameter.
+        sampler : function
+            Returns a sampled trajectory parameter (kw, kv).
+        screen : function, optional
+            Returns a boolean array of whether each trajectory parameter (kw, kv arrays) is
+            predicted to be collision free. Only used to order candidates, so candidates
+            predicted to collide are still checked after the others.
+
+        """
+        self.kw0 = kw0; self.kv0 = kv0
+        self.sampler = sampler
+        self.screen = screen
+        self.best_dist_sq = np.inf
+        self.kw_queue = np.zeros(0); self.kv_queue = np.zeros(0)
+
+
+    def next_batch(self):
+        """Next batch of candidates, closest to the network output first (after screening)
+
+        Returns
+        -------
+        kw, kv : np.array
+            Trajectory parameters to check (may be empty if all sampled candidates are
+            farther than the best safe one).
+
+        """
+        if len(self.kw_queue) == 0:
+            # Sample a new pool of candidates and sort by distance to network output, with
+            # candidates predicted to be collision free by the screen first
+            kw, kv = np.array([self.sampler() for _ in range(self.pool_size)]).T
+            dist_sq = (kw-self.kw0)**2 + (kv-self.kv0)**2
+            if self.screen is not None:
+                order = np.lexsort((dist_sq, ~self.screen(kw, kv)))
+            else:
+                order = np.argsort(dist_sq)
+            keep = order[dist_sq[order] < self.best_dist_sq]
+            self.kw_queue = kw[keep]; self.kv_queue = kv[keep]
+
+        kw = self.kw_queue[:self.batch_size]; kv = self.kv_queue[:self.batch_size]
+        self.kw_queue = self.kw_queue[self.batch_size:]; self.kv_queue = self.kv_queue[self.batch_size:]
+        return kw, kv
+
+
+    def update(self, kw, kv, isSafe):
+        """Update best safe candidate with results of a check
+
+        Returns
+        -------
+        int or None
+            Index of the checked candidate which is the new best safe one, or None.
+
+        """
+        dist_sq = (kw-self.kw0)**2 + (kv-self.kv0)**2
+        dist_sq[~isSafe] = np.inf
+        if len(dist_sq) == 0:
+            return None
+        b = int(np.argmin(dist_sq))
+        if dist_sq[b] >= self.best_dist_sq:
+            return None
+
+        # Skip queued candidates which are farther than the new best
+        self.best_dist_sq = dist_sq[b]
+        queue_dist_sq = (self.kw_queue-self.kw0)**2 + (self.kv_queue-self.kv0)**2
+        self.kw_queue = self.kw_queue[queue_dist_sq < self.best_dist_sq]
+        self.kv_queue = self.kv_queue[queue_dist_sq < self.best_dist_sq]
+        return b
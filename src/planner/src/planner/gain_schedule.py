@@ -0,0 +1,138 @@
+# Gain schedule for LQR feedback gains of the linearized unicycle model
+
+import os
+import numpy as np
+
+from planner.reachability_utils import dlqr_calculate
+
+
+class GainSchedule:
+    """Memoized LQR feedback gains keyed on the quantized linearization point
+
+    The linearized motion model matrix A only depends on the nominal heading and speed 
+    (and the fixed time-step), so feedback gains are cached on a (theta, v) grid. Lookups 
+    snap to the nearest grid point and solve the DARE there on a miss.
+
+    Attributes
+    ----------
+    Q_lqr : np.array (4x4)
+        LQR state cost weight matrix
+    R_lqr : np.array (2x2)
+        LQR input cost weight matrix
+    dt : float
+        discrete time-step
+    theta_res : float
+        heading grid resolution [rad]
+    v_res : float
+        speed grid resolution [m/s]
+    cache : dict
+        Map from (theta, v) grid index to feedback gain matrix K (2x4)
+    hits : int
+        Number of lookups served from the cache
+    misses : int
+        Number of lookups which required solving the DARE
+
+    """
+    def __init__(self, Q_lqr, R_lqr, dt, theta_res, v_res):
+        self.Q_lqr = Q_lqr
+        self.R_lqr = R_lqr
+        self.dt = dt
+        self.theta_res = theta_res
+        self.v_res = v_res
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+
+
+    def key(self, theta, v):
+        """Grid index of linearization point (heading is wrapped to [-pi, pi))
+        
+        Speeds are never snapped to zero, where the linearized model is not controllable.
+        """
+        theta = (theta + np.pi) % (2*np.pi) - np.pi
+        i_v = int(np.round(v / self.v_res))
+        if i_v == 0:
+            i_v = 1 if v >= 0 else -1
+        return int(np.round(theta / self.theta_res)), i_v
+
+
+    def get(self, theta, v):
+        """Get feedback gain for linearization point
+
+        Parameters
+        ----------
+        theta : float
+            nominal heading
+        v : float
+            nominal speed
+
+        Returns
+        -------
+        K : np.array (2x4)
+            Control feedback gain matrix at the nearest grid point.
+
+        """
+        key = self.key(theta, v)
+        K = self.cache.get(key)
+        if K is None:
+            self.misses += 1
+            K = self._solve(key)
+            self.cache[key] = K
+        else:
+            self.hits += 1
+        return K
+
+
+    def _solve(self, key):
+        """Solve for feedback gain at grid point"""
+        theta = key[0] * self.theta_res; v = key[1] * self.v_res
+        dt = self.dt
+
+        # Linearized motion model and control input matrices (see generate_robot_matrices)
+        A = np.identity(4)
+        A[0,2] = -v*np.sin(theta)*dt
+        A[0,3] = np.cos(theta)*dt
+        A[1,2] = v*np.cos(theta)*dt
+        A[1,3] = np.sin(theta)*dt
+        B = np.zeros((4,2))
+        B[2,0] = dt; B[3,1] = dt
+
+        return dlqr_calculate(A, B, self.Q_lqr, self.R_lqr)
+
+
+    def precompute(self, v_lims):
+        """Fill cache over all headings and the speed range v_lims = [v_min, v_max]"""
+        n_theta = int(np.ceil(np.pi / self.theta_res))
+        i_v_min, i_v_max = int(np.floor(v_lims[0] / self.v_res)), int(np.ceil(v_lims[1] / self.v_res))
+        for i_theta in range(-n_theta, n_theta+1):
+            for i_v in range(i_v_min, i_v_max+1):
+                if i_v != 0 and (i_theta, i_v) not in self.cache:
+                    self.cache[(i_theta, i_v)] = self._solve((i_theta, i_v))
+
+
+    def save(self, filename):
+        """Save cached gains to .npz file"""
+        keys = np.array(list(self.cache.keys()), dtype=int).reshape((-1,2))
+        K = np.array(list(self.cache.values())).reshape((-1,2,4))
+        np.savez(filename, keys=keys, K=K, Q_lqr=self.Q_lqr, R_lqr=self.R_lqr, 
+                 dt=self.dt, theta_res=self.theta_res, v_res=self.v_res)
+
+
+    def load(self, filename):
+        """Load cached gains from .npz file
+
+        Returns
+        -------
+        bool
+            True if the file exists and was computed with the same parameters.
+
+        """
+        if not os.path.isfile(filename):
+            return False
+        with np.load(filename) as data:
+            if not (np.array_equal(data['Q_lqr'], self.Q_lqr) and np.array_equal(data['R_lqr'], self.R_lqr) 
+                    and data['dt'] == self.dt and data['theta_res'] == self.theta_res and data['v_res'] == self.v_res):
+                return False
+            for key, K in zip(data['keys'], data['K']):
+                self.cache[(int(key[0]), int(key[1]))] = K
+        return True
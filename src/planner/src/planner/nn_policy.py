@@ -0,0 +1,148 @@
+# NumPy-only inference of the trained policy network (actor head of NN_utils.ActorCritic)
+
+import os
+import numpy as np
+
+import params.params as params
+
+
+class NumpyPolicy:
+    """Actor network evaluated with plain NumPy matmuls
+
+    Weights are exported from a trained NN_utils.ActorCritic model with
+    NN_utils.export_actor_weights. Hidden layers use leaky ReLU activations
+    and the output layer uses tanh, as in ActorCritic.actor.
+
+    Attributes
+    ----------
+    weights : list of np.array
+        Weight matrix (n_out x n_in) of each linear layer.
+    biases : list of np.array
+        Bias vector (n_out) of each linear layer.
+    log_std : np.array (1 x num_outputs)
+        Log standard deviation of output distribution.
+    negative_slope : float
+        Negative slope of leaky ReLU activations.
+
+    """
+    def __init__(self, weights, biases, log_std, negative_slope=0.1):
+        self.weights = weights
+        self.biases = biases
+        self.log_std = log_std
+        self.negative_slope = negative_slope
+
+
+    @classmethod
+    def load(cls, filename):
+        """Load policy from weights file saved by NN_utils.export_actor_weights"""
+        data = np.load(filename)
+        n_layers = int(data['n_layers'])
+        weights = [data['W_'+str(i)] for i in range(n_layers)]
+        biases = [data['b_'+str(i)] for i in range(n_layers)]
+        return cls(weights, biases, data['log_std'], float(data['negative_slope']))
+
+
+    def actor(self, states):
+        """Actor network output (mean of output distribution)
+
+        Parameters
+        ----------
+        states : np.array (B x num_inputs)
+            Batch of network inputs.
+
+        Returns
+        -------
+        np.array (B x num_outputs)
+            Network outputs in [-1, 1].
+
+        """
+        h = states
+        for W, b in zip(self.weights[:-1], self.biases[:-1]):
+            h = h @ W.T + b
+            h = np.where(h > 0, h, self.negative_slope*h)
+        return np.tanh(h @ self.weights[-1].T + self.biases[-1])
+
+
+    def evaluate(self, x_nom):
+        """Get policy output distribution mean and covariance (same outputs as NN_utils.evaluate_model)"""
+        action_mean = self.evaluate_batch(x_nom[:,-1][None,:])
+        if params.SAMPLE_METHOD == 1: action_cov = np.diag(np.exp(self.log_std[0]))
+        elif params.SAMPLE_METHOD == 2: action_cov = params.SAMPLE_STD_DEV*np.identity(action_mean.shape[1])
+        return [action_mean, action_cov]
+
+
+    def evaluate_batch(self, x_noms):
+        """Get policy output means for a batch of states
+
+        Parameters
+        ----------
+        x_noms : np.array (B x 4)
+            Batch of nominal states.
+
+        Returns
+        -------
+        np.array (B x 2)
+            Trajectory parameters (kw, kv) of each state.
+
+        """
+        return map_control_inputs(self.actor(policy_inputs(x_noms)))
+
+
+def policy_inputs(x_noms):
+    """Network inputs (state and obstacles) for a batch of nominal states
+
+    Parameters
+    ----------
+    x_noms : np.array (B x 4)
+        Batch of nominal states.
+
+    Returns
+    -------
+    np.array (B x 12)
+
+    """
+    obst = np.concatenate((params.OBST_ARR_1, params.OBST_ARR_2), axis=0).T
+    return np.hstack((x_noms, np.repeat(obst, len(x_noms), axis=0)))
+
+
+def map_control_inputs(action_array):
+    """Map network outputs in [-1, 1] to trajectory parameter limits (in place)
+
+    Parameters
+    ----------
+    action_array : np.array (B x 2)
+        Network outputs (kw, kv) of each row.
+
+    Returns
+    -------
+    np.array (B x 2)
+        Trajectory parameters (kw, kv) of each row.
+
+    """
+    lims = np.array([params.KW_LIMS, params.KV_LIMS])
+    scaled = (action_array[:,0:2] + 1.0)/2.0  # between 0 and 1
+    action_array[:,0:2] = np.clip(scaled*(lims[:,1] - lims[:,0]) + lims[:,0], lims[:,0], lims[:,1])
+    return action_array
+
+
+def load_policy(model_file, weights_file):
+    """Load NumPy policy from cached weights file, exporting it from the trained model if missing
+
+    torch is only imported (through NN_utils) when the weights file has to be created.
+
+    Parameters
+    ----------
+    model_file : str
+        Path of trained model checkpoint.
+    weights_file : str
+        Path of cached actor weights (.npz).
+
+    Returns
+    -------
+    NumpyPolicy
+
+    """
+    if not os.path.isfile(weights_file):
+        import planner.NN_utils as nn_util
+        nn_util.export_actor_weights(nn_util.load_model(model_file), weights_file)
+    return NumpyPolicy.load(weights_file)
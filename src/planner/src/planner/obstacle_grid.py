@@ -0,0 +1,92 @@
+# Spatial index of obstacle zonotopes for collision checking
+
+import numpy as np
+
+from planner.probabilistic_zonotope import pZ
+
+
+class ObstacleGrid:
+    """Static uniform grid index over the interval hulls of 2D obstacle zonotopes
+
+    Each obstacle is registered in every grid cell overlapped by its interval hull. 
+    Queries return only the obstacles whose interval hulls overlap the query box, 
+    so the exact intersection test only needs to be run on those.
+
+    Attributes
+    ----------
+    obstZ : M-element list of pZ objects
+        Obstacle zonotopes.
+    lower : np.array (2xM)
+        Lower bounds of obstacle interval hulls.
+    upper : np.array (2xM)
+        Upper bounds of obstacle interval hulls.
+    cell_size : float
+        Side length of grid cells.
+    cells : dict
+        Map from (i,j) cell index to list of obstacle indices.
+
+    """
+    def __init__(self, obstZ, cell_size=1.0):
+        self.obstZ = obstZ
+        self.cell_size = cell_size
+
+        # Interval hulls of obstacles
+        M = len(obstZ)
+        self.lower = np.zeros((2,M)); self.upper = np.zeros((2,M))
+        for j in range(M):
+            lo, hi = pZ.interval_hull(obstZ[j])
+            self.lower[:,j] = lo[0:2,0]; self.upper[:,j] = hi[0:2,0]
+
+        # Register obstacles in all cells overlapped by their interval hull
+        self.cells = {}
+        for j in range(M):
+            i_min, j_min = self._cell_idx(self.lower[:,j]); i_max, j_max = self._cell_idx(self.upper[:,j])
+            for ci in range(i_min, i_max+1):
+                for cj in range(j_min, j_max+1):
+                    self.cells.setdefault((ci,cj), []).append(j)
+
+
+    def __len__(self):
+        return len(self.obstZ)
+
+
+    def _cell_idx(self, p):
+        """Grid cell index of 2D point"""
+        return int(np.floor(p[0] / self.cell_size)), int(np.floor(p[1] / self.cell_size))
+
+
+    def query(self, lower, upper):
+        """Find obstacles whose interval hulls overlap an axis-aligned box
+
+        Parameters
+        ----------
+        lower : np.array (2x1)
+            Lower bounds of query box.
+        upper : np.array (2x1)
+            Upper bounds of query box.
+
+        Returns
+        -------
+        list
+            Sorted indices of overlapping obstacles.
+
+        """
+        lower = np.asarray(lower).flatten(); upper = np.asarray(upper).flatten()
+
+        # Gather obstacles registered in the cells covered by the query box
+        i_min, j_min = self._cell_idx(lower); i_max, j_max = self._cell_idx(upper)
+        if (i_max - i_min + 1) * (j_max - j_min + 1) > len(self.cells):
+            # Query box covers more cells than are occupied, iterate over occupied cells instead
+            cand = set()
+            for (ci,cj), idxs in self.cells.items():
+                if i_min <= ci <= i_max and j_min <= cj <= j_max:
+                    cand.update(idxs)
+        else:
+            cand = set()
+            for ci in range(i_min, i_max+1):
+                for cj in range(j_min, j_max+1):
+                    cand.update(self.cells.get((ci,cj), ()))
+
+        # Keep only obstacles whose interval hulls actually overlap the query box
+        return [j for j in sorted(cand) 
+                if np.all(self.lower[:,j] <= upper) and np.all(lower <= self.upper[:,j])]
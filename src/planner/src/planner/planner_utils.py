@@ -62,6 +62,40 @@ def wrap_controls(u_nom):
     return controls
 
 
+def unwrap_states(states):
+    """Unwraps a vector of state msgs into a np array of nominal states
+
+    Parameters
+    ----------
+    states : State[]
+        vector of state msgs
+
+    Returns
+    -------
+    x_nom : np.array (4xN where N is trajectory length)
+        nominal states
+
+    """
+    return np.array([[s.x, s.y, s.theta, s.v] for s in states]).reshape((-1,4)).T
+
+
+def unwrap_controls(controls):
+    """Unwraps a vector of control msgs into a np array of nominal controls
+
+    Parameters
+    ----------
+    controls : Control[]
+        vector of control msgs
+
+    Returns
+    -------
+    u_nom : np.array (2xN where N is trajectory length)
+        nominal controls
+
+    """
+    return np.array([[c.omega, c.a] for c in controls]).reshape((-1,2)).T
+
+
 def trajectory_parameter_to_nominal_trajectory(kw, kv, xnom0, t_plan, dt, max_acc_mag):
     """Map trajectory parameter to nominal trajectory
 
@@ -136,6 +170,85 @@ def trajectory_parameter_to_nominal_trajectory(kw, kv, xnom0, t_plan, dt, max_ac
     return [xnom, unom]
 
 
+def trajectory_parameters_to_nominal_trajectories(kw, kv, xnom0, t_plan, dt, max_acc_mag):
+    """Map a batch of trajectory parameters to nominal trajectories
+
+    Vectorized counterpart of trajectory_parameter_to_nominal_trajectory. Speeds and 
+    headings of the (Euler-discretized) unicycle are computed in closed form, since speed 
+    ramps towards its target at the maximum acceleration and heading changes at a constant 
+    rate. Positions are then obtained with cumulative sums.
+
+    Nominal trajectories have different lengths due to the braking maneuver, so they are 
+    padded to a common length by holding their final state (with zero control input).
+
+    Parameters
+    ----------
+    kw : np.array (B)
+        desired angular rates
+    kv : np.array (B)
+        desired speeds
+    xnom0 : np.array (4x1)
+        initial nominal state
+    t_plan : float
+        total trajectory time duration
+    dt : float
+        discrete time-step
+    max_acc_mag : float
+        maximum magnitude of acceleration/deceleration [m/s^2]
+
+    Returns
+    -------
+    xnom : np.array (Bx4xN)
+        padded nominal states
+    unom : np.array (Bx2x(N-1))
+        padded nominal control inputs
+    N_timesteps : np.array (B)
+        length of each nominal trajectory before padding
+
+    """
+    kw = np.asarray(kw, dtype=float)[:,None]; kv = np.asarray(kv, dtype=float)[:,None]
+    n_batch = kw.shape[0]
+    N_initial_timesteps = int(t_plan/dt)
+    dv_max = max_acc_mag*dt  # maximum change in speed per timestep
+
+    # Speed at end of initial part of trajectory, which sets length of braking maneuver
+    v0 = xnom0[3,0]
+    v_end = v0 + np.clip(kv[:,0] - v0, -N_initial_timesteps*dv_max, N_initial_timesteps*dv_max)
+    N_brake_timesteps = np.maximum(np.ceil(np.round(np.abs(v_end)/dv_max, 9)).astype(int), 1)
+    N_timesteps = N_initial_timesteps + 1 + N_brake_timesteps
+    N_max = N_timesteps.max()
+
+    # Timestep indices of initial part and of braking maneuver
+    k = np.arange(N_max)[None,:]
+    k_initial = np.minimum(k, N_initial_timesteps)
+    k_brake = np.maximum(k - N_initial_timesteps, 0)
+
+    # Speeds ramp towards kv, then towards zero
+    v = v0 + np.clip(kv - v0, -k_initial*dv_max, k_initial*dv_max)
+    v = v - np.clip(v_end[:,None], -k_brake*dv_max, k_brake*dv_max)
+
+    # Headings change at constant rate during initial part of trajectory
+    theta_unwrapped = xnom0[2,0] + k_initial*dt*kw
+
+    # Integrate positions
+    xnom = np.zeros((n_batch, xnom0.shape[0], N_max))
+    xnom[:,0,1:] = xnom0[0,0] + dt*np.cumsum(v[:,:-1]*np.cos(theta_unwrapped[:,:-1]), axis=1)
+    xnom[:,1,1:] = xnom0[1,0] + dt*np.cumsum(v[:,:-1]*np.sin(theta_unwrapped[:,:-1]), axis=1)
+    xnom[:,0,0] = xnom0[0,0]; xnom[:,1,0] = xnom0[1,0]
+    xnom[:,2,:] = wrap_angle(theta_unwrapped)
+    xnom[:,2,0] = xnom0[2,0]
+    xnom[:,3,:] = v
+
+    # Controls: yaw rate kw during initial part, acceleration towards target speed
+    unom = np.zeros((n_batch, 2, N_max-1))
+    is_initial = k[:,:-1] < N_initial_timesteps
+    unom[:,0,:] = np.where(is_initial, kw, 0.0)
+    v_target = np.where(is_initial, kv, 0.0)
+    unom[:,1,:] = np.clip((v_target - v[:,:-1])/dt, -max_acc_mag, max_acc_mag)
+
+    return xnom, unom, N_timesteps
+
+
 def check_trajectory_parameter_safety(kw, kv, x_nom0, Xaug0, P0, env):
     """Check if trajectory parameter is safe
 
@@ -156,17 +269,83 @@ def check_trajectory_parameter_safety(kw, kv, x_nom0, Xaug0, P0, env):
     # Compute reachable sets for the trajectory with either range sensing or position sensing
     [Xaug, Zaug, P_all] = reach_util.compute_reachable_sets_position_sensing(
         xnom_seg, unom_seg, Xaug0, P0, params.Q_EKF, WpZ, VpZs, Rhats, 
-        params.Q_LQR, params.R_LQR, params.SIGMA_CONF_LVL, params.DT)
+        params.Q_LQR, params.R_LQR, params.SIGMA_CONF_LVL, params.DT, params.GAIN_SCHEDULE)
 
     # Check if trajectory is safe
     isSafe = reach_util.is_collision_free(Zaug, env['obstZ'], 
         collisionCheckOrder=params.COLLISION_CHECK_ZONOTOPE_ORDER, 
         distCheck=params.CHECK_DIST_REQ, 
-        dist_threshold=params.COLLISION_CHECK_DIST_THRESH)
+        dist_threshold=params.COLLISION_CHECK_DIST_THRESH, 
+        unsafe_index=env.get('obstIndex'))
 
     return isSafe, Xaug, Zaug, P_all, xnom_seg, unom_seg
 
 
+def check_trajectory_parameter_safety_batch(kw, kv, x_nom0, Xaug0, P0, env):
+    """Check if a batch of trajectory parameters are safe
+
+    Reachable sets for all trajectory parameters are computed in one pass. Only the 
+    unpadded part of each nominal trajectory is collision checked.
+
+    Parameters
+    ----------
+    kw : np.array (B)
+        desired angular rates
+    kv : np.array (B)
+        desired speeds
+    x_nom0 : np.array (4x1)
+        initial nominal state
+    Xaug0 : pZ object
+        initial reachable set
+    P0 : np.array (4x4)
+        initial state estimation covariance matrix
+    env : dict
+        environment info
+
+    Returns
+    -------
+    isSafe : np.array (B) of bool
+        flags indicating if each trajectory parameter is safe
+    reach_sets : tuple (Xaug_G, Xaug_Sigma, Zaug_G, P_all)
+        batched reachability results (see reachability_utils.compute_reachable_sets_position_sensing_batch)
+    xnom : np.array (Bx4xN)
+        padded nominal states
+    unom : np.array (Bx2x(N-1))
+        padded nominal control inputs
+    N_timesteps : np.array (B)
+        length of each nominal trajectory before padding
+    
+    """
+    n_batch = len(kw)
+
+    # Create padded nominal trajectories for given trajectory parameters
+    [xnom, unom, N_timesteps] = trajectory_parameters_to_nominal_trajectories(
+        kw, kv, x_nom0, params.T_SEG, params.DT, params.MAX_ACC_MAG)
+
+    # Create motion and sensing pZs along nominal trajectories
+    [WpZ, VpZ_G, VpZ_Sigma, Rhats] = reach_util.create_motion_sensing_pZ_batch(
+        xnom, params.Q_EKF, params.R_EKF, params.SIGMA_CONF_LVL, 
+        env['bias_area_lims'], env['regular_bias'], 
+        env['different_bias'])
+
+    # Compute reachable sets for all trajectories
+    reach_sets = reach_util.compute_reachable_sets_position_sensing_batch(
+        xnom, unom, Xaug0, P0, params.Q_EKF, WpZ, VpZ_G, VpZ_Sigma, Rhats, 
+        params.Q_LQR, params.R_LQR, params.SIGMA_CONF_LVL, params.DT, params.GAIN_SCHEDULE)
+
+    # Check if trajectories are safe
+    isSafe = np.zeros(n_batch, dtype=bool)
+    for b in range(n_batch):
+        Zaug = reach_util.get_batch_conf_zonotopes(xnom, reach_sets[2], b, N_timesteps[b])
+        isSafe[b] = reach_util.is_collision_free(Zaug, env['obstZ'], 
+            collisionCheckOrder=params.COLLISION_CHECK_ZONOTOPE_ORDER, 
+            distCheck=params.CHECK_DIST_REQ, 
+            dist_threshold=params.COLLISION_CHECK_DIST_THRESH, 
+            unsafe_index=env.get('obstIndex'))
+
+    return isSafe, reach_sets, xnom, unom, N_timesteps
+
+
 def is_trajectory_inside_region(x_nom, region_array):
     """Check if nominal trajectory is inside specified region
 
@@ -183,10 +362,11 @@ def is_trajectory_inside_region(x_nom, region_array):
     return isInside
 
 
-def calibrate_sample_safety_check_time(x_nom0, Xaug0, P0, env):
+def calibrate_sample_safety_check_time(x_nom0, Xaug0, P0, env, check_scheduler=None):
     """
     TODO
-    calibration process to estimate the maximum time needed for sampling a trajectory parameter and checking its safety
+    calibration process to estimate the maximum time needed for sampling a batch of trajectory parameters and checking their safety
+    (if a check scheduler is given, the iteration times are recorded to seed its latency window)
     """
 
     N = params.CALIBRATION_ITERATIONS
@@ -201,15 +381,17 @@ def calibrate_sample_safety_check_time(x_nom0, Xaug0, P0, env):
         t_start = time.time()
 
         # Sample new trajectory parameters within specified limits near network output. TODO: sample random parameters instead of the center ones
-        kw, kv = sample_near_trajectory_parameters(
+        kw, kv = np.array([sample_near_trajectory_parameters(
             (params.KW_LIMS[0]+params.KW_LIMS[1])/2, 
-            (params.KV_LIMS[0]+params.KV_LIMS[1])/2)
+            (params.KV_LIMS[0]+params.KV_LIMS[1])/2) for _ in range(params.SAFETY_CHECK_BATCH_SIZE)]).T
 
-        # Create nominal trajectory and check safety
-        check_trajectory_parameter_safety(kw, kv, x_nom0, Xaug0, P0, env)
+        # Create nominal trajectories and check safety
+        check_trajectory_parameter_safety_batch(kw, kv, x_nom0, Xaug0, P0, env)
 
         # Note time taken for iteration
         iter_times[i] = time.time() - t_start
+        if check_scheduler is not None:
+            check_scheduler.record(iter_times[i])
 
     # Save a conservative estimate for max time
     mean_iter_time = np.mean(iter_times)
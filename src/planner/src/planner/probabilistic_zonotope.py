@@ -101,6 +101,14 @@ class pZ:
         return pZ(pZ1.c, new_G, pZ1.Sigma)
 
 
+    def interval_hull(pZ1):
+        """
+        Axis-aligned bounding box of the generator part (center +- row sums of |G|), returned as (lower, upper) bounds
+        """
+        radius = np.sum(np.abs(pZ1.G), axis=1).reshape((pZ1.dim,1))
+        return pZ1.c - radius, pZ1.c + radius
+
+
     def conf_zonotope(pZ1, conf_value):
         """
         TODO
@@ -118,4 +126,108 @@ class pZ:
         # Add ellipsoid generator to existing generators
         new_G = np.concatenate((pZ1.G, cov_G), 1)
 
-        return pZ( pZ1.c, new_G, np.zeros((pZ1.c.shape[0],pZ1.c.shape[0])) );
\ No newline at end of file
+        return pZ( pZ1.c, new_G, np.zeros((pZ1.c.shape[0],pZ1.c.shape[0])) );
+
+class pZ_buffer:
+    """
+    Array-backed p-zonotope with a preallocated generator buffer.
+
+    Generators are stored in the first n_gen columns of a (dim x capacity) buffer, 
+    so operations write into existing memory instead of concatenating new arrays. 
+    The c, G and Sigma attributes can be read like those of pZ.
+    """
+    __slots__ = ('dim', 'c', 'G_buf', 'n_gen', 'Sigma')
+
+    def __init__(self, dim, capacity, G_buf=None) -> None:
+
+        self.dim = dim
+        self.c = np.zeros((dim,1))
+
+        # Use provided buffer (e.g. a view into a larger preallocated array) if given
+        if G_buf is None:
+            G_buf = np.zeros((dim,capacity))
+        elif G_buf.shape != (dim,capacity):
+            raise ValueError('Generator buffer must have shape (dim, capacity)')
+        self.G_buf = G_buf
+        self.n_gen = 0
+
+        self.Sigma = np.zeros((dim,dim))
+
+
+    @property
+    def G(self):
+        """
+        Live generator columns (view into the buffer)
+        """
+        return self.G_buf[:,:self.n_gen]
+
+
+    @property
+    def capacity(self):
+        """
+        Maximum number of generators
+        """
+        return self.G_buf.shape[1]
+
+
+    def from_pZ(pZ1, capacity):
+        """
+        Create buffer-backed copy of a p-zonotope
+        """
+        pZ_buf = pZ_buffer(pZ1.dim, capacity)
+        pZ_buf.set(pZ1)
+        return pZ_buf
+
+
+    def to_pZ(self):
+        """
+        Copy live contents into a regular pZ
+        """
+        return pZ(self.c.copy(), self.G.copy(), self.Sigma.copy())
+
+
+    def set(self, pZ1):
+        """
+        Copy center, generators and covariance of pZ1 into this buffer
+        """
+        n = pZ1.G.shape[1]
+        if n > self.capacity:
+            raise ValueError('Number of generators exceeds buffer capacity')
+        self.c[:] = pZ1.c
+        self.G_buf[:,:n] = pZ1.G
+        self.n_gen = n
+        self.Sigma[:] = pZ1.Sigma
+        return self
+
+
+    def linear_transform(self, T, pZ1):
+        """
+        Write linear transformation T of pZ1 into this buffer (in-place version of pZ.linear_transform)
+        """
+        n = pZ1.G.shape[1]
+        if n > self.capacity:
+            raise ValueError('Number of generators exceeds buffer capacity')
+        # pZ1 may be this buffer, so compute the products before writing
+        center = T @ pZ1.c
+        generators = T @ pZ1.G
+        covariance = T @ pZ1.Sigma @ np.transpose(T)
+
+        self.c[:] = center
+        self.G_buf[:,:n] = generators
+        self.n_gen = n
+        self.Sigma[:] = covariance
+        return self
+
+
+    def minkowski_sum_into(self, pZ1):
+        """
+        Add pZ1 to this buffer (in-place version of pZ.minkowski_sum), appending its generators
+        """
+        n = pZ1.G.shape[1]
+        if self.n_gen + n > self.capacity:
+            raise ValueError('Number of generators exceeds buffer capacity')
+        self.c += pZ1.c
+        self.G_buf[:,self.n_gen:self.n_gen+n] = pZ1.G
+        self.n_gen += n
+        self.Sigma += pZ1.Sigma
+        return self
@@ -0,0 +1,220 @@
+# Offline precomputed library of confidence reachable sets over the trajectory parameter grid
+
+import numpy as np
+
+import planner.planner_utils as plan_util
+import planner.reachability_utils as reach_util
+from planner.probabilistic_zonotope import pZ
+import params.params as params
+
+
+class ReachLibrary:
+    """Library of precomputed confidence reachable sets
+
+    Confidence reach sets are computed offline in a canonical frame (start at the origin
+    with zero heading) over a grid of trajectory parameters (kw, kv), initial speeds v0
+    and initial reachable sets, reduced to the collision checking order and stored in
+    memory-mapped arrays. Online, the reach sets of the nearest grid entry are rigidly
+    transformed to the current start state.
+
+    The library is built with the sensing bias applied everywhere, but the stored reach
+    sets still only approximate the exact ones (nearest grid entry, and canonical initial
+    sets which are only matched on the position covariance, not the generators of the
+    current initial reach set). It should therefore only be used to order candidates for
+    the exact safety check, never to discard them.
+
+    Attributes
+    ----------
+    kw_grid : np.array
+        Grid of desired angular rates.
+    kv_grid : np.array
+        Grid of desired speeds.
+    v0_grid : np.array
+        Grid of initial speeds.
+    init_P_trace : np.array
+        Trace of the position block of the initial estimation covariance for each initial set.
+    N : np.array (n_kw x n_kv x n_v0 x n_init)
+        Number of reach sets of each entry.
+    c : np.memmap (n_kw x n_kv x n_v0 x n_init x N_max x 2)
+        Reach set centers in canonical frame.
+    G : np.memmap (n_kw x n_kv x n_v0 x n_init x N_max x 2 x n_gen)
+        Reach set generators in canonical frame.
+
+    """
+    def __init__(self, filename):
+        meta = np.load(filename + '.npz')
+        self.kw_grid = meta['kw_grid']
+        self.kv_grid = meta['kv_grid']
+        self.v0_grid = meta['v0_grid']
+        self.init_P_trace = meta['init_P_trace']
+        self.N = meta['N']
+        self.c = np.load(filename + '_c.npy', mmap_mode='r')
+        self.G = np.load(filename + '_G.npy', mmap_mode='r')
+
+
+    def index(self, kw, kv, x_nom0, P0):
+        """Index of library entry nearest to trajectory parameter and initial conditions
+
+        The initial set is chosen as the first one whose position covariance is at least
+        as large as the current one (or the largest one).
+
+        """
+        i_kw = np.argmin(np.abs(self.kw_grid - kw))
+        i_kv = np.argmin(np.abs(self.kv_grid - kv))
+        i_v0 = np.argmin(np.abs(self.v0_grid - x_nom0[3,0]))
+        i_init = min(np.searchsorted(self.init_P_trace, np.trace(P0[0:2,0:2])), len(self.init_P_trace)-1)
+        return i_kw, i_kv, i_v0, i_init
+
+
+    def lookup(self, kw, kv, x_nom0, P0):
+        """Get confidence reachable sets for trajectory parameter starting from x_nom0
+
+        Parameters
+        ----------
+        kw : float
+            desired angular rate
+        kv : float
+            desired speed
+        x_nom0 : np.array (4x1)
+            initial nominal state
+        P0 : np.array (4x4)
+            initial state estimation covariance matrix
+
+        Returns
+        -------
+        Zaug : list of pZ objects without any covariance component
+            Confidence reachable sets transformed to the start state.
+
+        """
+        idx = self.index(kw, kv, x_nom0, P0)
+        n = self.N[idx]
+
+        # Rigid transformation from canonical frame to start state
+        theta0 = x_nom0[2,0]
+        R = np.array([[np.cos(theta0), -np.sin(theta0)],
+                      [np.sin(theta0), np.cos(theta0)]])
+        c = self.c[idx][:n] @ R.T + x_nom0[0:2,0]
+        G = np.einsum('ij,kjl->kil', R, self.G[idx][:n])
+
+        return [pZ(c[k][:,None], G[k], np.zeros((2,2))) for k in range(n)]
+
+
+    def is_collision_free(self, kw, kv, x_nom0, P0, env):
+        """Check if library reach sets for trajectory parameter are collision free"""
+        Zaug = self.lookup(kw, kv, x_nom0, P0)
+        return reach_util.is_collision_free(Zaug, env['obstZ'], unsafe_index=env.get('obstIndex'))
+
+
+    def screen(self, kw, kv, x_nom0, P0, env):
+        """Predict which trajectory parameters (arrays) are collision free, for ordering candidates"""
+        return np.array([self.is_collision_free(kw[i], kv[i], x_nom0, P0, env) for i in range(len(kw))], dtype=bool)
+
+
+def canonical_initial_sets(n_init):
+    """Canonical initial reachable sets and covariances for building the library
+
+    The first set is the initial reachable set at t=0. Each following set is the reach set
+    at the end of a segment of driving straight at maximum speed from the previous one,
+    reduced to the initial reach set order used by the planner.
+
+    Returns
+    -------
+    list of tuples (Xaug0, P0)
+        Initial reachable sets (pZ objects) and estimation covariance matrices (4x4).
+
+    """
+    x_nom0 = np.zeros((4,1))
+    Xaug0 = reach_util.initialize_reachability_analysis(x_nom0, params.P_0)
+    P0 = params.P_0
+    init_sets = [(Xaug0, P0)]
+
+    for i in range(1, n_init):
+        xnom, unom, _ = plan_util.trajectory_parameters_to_nominal_trajectories(
+            np.zeros(1), np.array([params.KV_LIMS[1]]), x_nom0, params.T_SEG, params.DT, params.MAX_ACC_MAG)
+        [WpZ, VpZ_G, VpZ_Sigma, Rhats] = reach_util.create_motion_sensing_pZ_batch(
+            xnom, params.Q_EKF, params.R_EKF, params.SIGMA_CONF_LVL,
+            params.ENV_INFO['bias_area_lims'], params.ENV_INFO['regular_bias'], params.ENV_INFO['different_bias'])
+        [Xaug_G, Xaug_Sigma, _, P_all] = reach_util.compute_reachable_sets_position_sensing_batch(
+            xnom, unom, Xaug0, P0, params.Q_EKF, WpZ, VpZ_G, VpZ_Sigma, Rhats,
+            params.Q_LQR, params.R_LQR, params.SIGMA_CONF_LVL, params.DT, params.GAIN_SCHEDULE)
+        Xaug0 = pZ.reduce(reach_util.get_batch_reach_set(xnom, Xaug_G, Xaug_Sigma, 0, params.SEG_LEN),
+                          params.MAX_ORDER_INIT_REACH_SET)
+        P0 = P_all[0,:,:,params.SEG_LEN]
+        init_sets.append((Xaug0, P0))
+
+    return init_sets
+
+
+def build_reach_library(filename, kw_grid, kv_grid, v0_grid, init_sets, env):
+    """Precompute confidence reachable sets over the trajectory parameter grid and save them
+
+    Writes filename.npz (grids and reach set counts), filename_c.npy (centers) and
+    filename_G.npy (generators). Reach sets are stored in float32 and reduced to
+    params.COLLISION_CHECK_ZONOTOPE_ORDER.
+
+    Parameters
+    ----------
+    filename : str
+        Path of library files without extension.
+    kw_grid : np.array
+        Grid of desired angular rates.
+    kv_grid : np.array
+        Grid of desired speeds.
+    v0_grid : np.array
+        Grid of initial speeds.
+    init_sets : list of tuples (Xaug0, P0)
+        Initial reachable sets and estimation covariance matrices.
+    env : dict
+        Environment info (only the sensing bias is used, and applied everywhere).
+
+    """
+    # Sort initial sets by increasing position covariance for lookup
+    init_P_trace = np.array([np.trace(P0[0:2,0:2]) for _, P0 in init_sets])
+    init_sets = [init_sets[i] for i in np.argsort(init_P_trace)]
+    init_P_trace = np.sort(init_P_trace)
+
+    n_kw = len(kw_grid); n_kv = len(kv_grid); n_v0 = len(v0_grid); n_init = len(init_sets)
+    order = params.COLLISION_CHECK_ZONOTOPE_ORDER
+    n_gen = 2*order
+
+    # Longest possible trajectory (braking from the highest speed)
+    v_max = max(np.max(np.abs(kv_grid)), np.max(np.abs(v0_grid)))
+    N_max = int(params.T_SEG/params.DT) + 1 + max(int(np.ceil(v_max/(params.MAX_ACC_MAG*params.DT))), 1)
+
+    c = np.lib.format.open_memmap(filename + '_c.npy', mode='w+', dtype=np.float32,
+                                  shape=(n_kw, n_kv, n_v0, n_init, N_max, 2))
+    G = np.lib.format.open_memmap(filename + '_G.npy', mode='w+', dtype=np.float32,
+                                  shape=(n_kw, n_kv, n_v0, n_init, N_max, 2, n_gen))
+    N = np.zeros((n_kw, n_kv, n_v0, n_init), dtype=int)
+
+    # Conservatively apply the larger sensing bias everywhere
+    bias_area_lims = [-np.inf, -np.inf, np.inf, np.inf]
+    bias = max(env['regular_bias'], env['different_bias'])
+
+    for i_v0 in range(n_v0):
+        x_nom0 = np.array([[0.0], [0.0], [0.0], [v0_grid[i_v0]]])
+        for i_kw in range(n_kw):
+            # Batch over all kv values for this (v0, kw)
+            xnom, unom, N_timesteps = plan_util.trajectory_parameters_to_nominal_trajectories(
+                np.full(n_kv, kw_grid[i_kw]), kv_grid, x_nom0, params.T_SEG, params.DT, params.MAX_ACC_MAG)
+            [WpZ, VpZ_G, VpZ_Sigma, Rhats] = reach_util.create_motion_sensing_pZ_batch(
+                xnom, params.Q_EKF, params.R_EKF, params.SIGMA_CONF_LVL, bias_area_lims, bias, bias)
+
+            for i_init in range(n_init):
+                Xaug0, P0 = init_sets[i_init]
+                [_, _, Zaug_G, _] = reach_util.compute_reachable_sets_position_sensing_batch(
+                    xnom, unom, Xaug0, P0, params.Q_EKF, WpZ, VpZ_G, VpZ_Sigma, Rhats,
+                    params.Q_LQR, params.R_LQR, params.SIGMA_CONF_LVL, params.DT, params.GAIN_SCHEDULE)
+
+                # Reduce and store reach sets of each trajectory
+                for i_kv in range(n_kv):
+                    Zaug = reach_util.get_batch_conf_zonotopes(xnom, Zaug_G, i_kv, N_timesteps[i_kv])
+                    for k in range(N_timesteps[i_kv]):
+                        tZ = pZ.reduce(Zaug[k], order)
+                        c[i_kw, i_kv, i_v0, i_init, k] = tZ.c[:,0]
+                        G[i_kw, i_kv, i_v0, i_init, k, :, :tZ.G.shape[1]] = tZ.G
+                    N[i_kw, i_kv, i_v0, i_init] = N_timesteps[i_kv]
+
+    c.flush(); G.flush()
+    np.savez(filename + '.npz', kw_grid=kw_grid, kv_grid=kv_grid, v0_grid=v0_grid,
+             init_P_trace=init_P_trace, N=N)
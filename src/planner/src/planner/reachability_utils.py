@@ -7,7 +7,8 @@ from scipy.optimize import linprog
 from scipy.stats.distributions import chi2
 import cvxpy as cvx
 
-from planner.probabilistic_zonotope import pZ
+from planner.probabilistic_zonotope import pZ, pZ_buffer
+from planner.obstacle_grid import ObstacleGrid
 
 
 def initialize_reachability_analysis(x_nom0, P0):
@@ -88,7 +89,7 @@ def create_motion_sensing_pZ(xnom, Q, R, m, bias_area_lims, regular_bias, differ
     return WpZ, VpZs, Rhats
 
 
-def compute_reachable_sets_position_sensing(xnom, unom, Xaug0, P0, Q, WpZ, VpZs, Rhats, Q_lqr, R_lqr, m, dt):
+def compute_reachable_sets_position_sensing(xnom, unom, Xaug0, P0, Q, WpZ, VpZs, Rhats, Q_lqr, R_lqr, m, dt, gain_schedule=None):
     """Compute reachable sets for unicycle model with position and heading sensing
 
     Parameters
@@ -117,11 +118,13 @@ def compute_reachable_sets_position_sensing(xnom, unom, Xaug0, P0, Q, WpZ, VpZs,
         Desired confidence level.
     dt : float
         Discrete time-step.
+    gain_schedule : GainSchedule
+        Cached feedback gains to use instead of solving the DARE at every timestep.
 
     Returns
     -------
-    Xaug : N-element list of pZ objects
-        Probabilistic reachable sets.
+    Xaug : N-element list of pZ_buffer objects
+        Probabilistic reachable sets (generators share one preallocated array).
     Zaug : N-element list of pZ objects without any covariance component
         Confidence reachable sets.
     P_all : np.array (4x4xN)
@@ -139,16 +142,21 @@ def compute_reachable_sets_position_sensing(xnom, unom, Xaug0, P0, Q, WpZ, VpZs,
     # Get confidence value for m-sigma in 2d using chi-square distribution
     conf_value = np.sqrt(chi2.ppf(math.erf(m/np.sqrt(2)),df=2))
     
+    # Preallocate generator storage for all reach sets. Each timestep appends the generators of 
+    # the motion and sensing uncertainties (lagrange remainders have no generators)
+    capacity = Xaug0.G.shape[1] + (N_timesteps-1)*WpZ.G.shape[1] + sum(VpZs[k].G.shape[1] for k in range(1,N_timesteps))
+    G_all = np.zeros((N_timesteps,2*state_dim,capacity))
+
     # Init state estimation covariance matrices, prob reach sets and confidence reach sets
     P_all = np.zeros((state_dim,state_dim,N_timesteps)); P_all[:,:,0] = np.copy(P0)
-    Xaug = [None]*N_timesteps; Xaug[0] = Xaug0
+    Xaug = [pZ_buffer(2*state_dim, capacity, G_all[k]) for k in range(N_timesteps)]; Xaug[0].set(Xaug0)
     Zaug = [None]*N_timesteps; Zaug[0] = pZ.conf_zonotope(pZ( Xaug[0].c[0:2,:], Xaug[0].G[0:2,:], Xaug[0].Sigma[0:2,0:2] ), conf_value)
 
     # Iterate over nominal trajectory to compute reach sets
     for k in range(1,N_timesteps):
 
         # Get robot matrices
-        A, B, C, K = generate_robot_matrices(xnom[:,[k-1]], unom[:,[k-1]], Q_lqr, R_lqr, dt)
+        A, B, C, K = generate_robot_matrices(xnom[:,[k-1]], unom[:,[k-1]], Q_lqr, R_lqr, dt, gain_schedule)
 
         # Perform the EKF predict step
         P_pred = A @ P_all[:,:,k-1] @ A.T + Q
@@ -177,16 +185,17 @@ def compute_reachable_sets_position_sensing(xnom, unom, Xaug0, P0, Q, WpZ, VpZs,
         Lf1 = lagrange_remainder_f( del_s, xnom[:,[k-1]], unom[:,[k-1]], m, dt)
         Lf2 = lagrange_remainder_f( del_shat, xnom[:,[k-1]], unom[:,[k-1]], m, dt)
 
-        # Get each term for obtaining reach set for timestep k
-        t2 = pZ.linear_transform(phi, pZ(np.zeros((2*state_dim,1)), Xaug[k-1].G, Xaug[k-1].Sigma))
+        # Get each term for obtaining reach set for timestep k (the first is written directly into the reach set buffer)
+        Xaug[k].linear_transform(phi, Xaug[k-1])
         t3 = pZ.linear_transform(phi_w, WpZ)
         t4 = pZ.linear_transform(phi_v, VpZs[k])
         t5 = pZ.linear_transform(phi_Lf1, Lf1)
         t6 = pZ.linear_transform(phi_Lf2, Lf2)
 
         # Add inidividual terms to get reach set which is centered at the nominal trajectory
-        Xaug[k] = pZ.minkowski_sum([t2, t3, t4, t5, t6])
-        Xaug[k].c = np.tile(xnom[:,[k]],(2,1))
+        for t in (t3, t4, t5, t6):
+            Xaug[k].minkowski_sum_into(t)
+        Xaug[k].c[:] = np.tile(xnom[:,[k]],(2,1))
 
         # Generate confidence zonotopes for collision checks
         Zaug[k] = pZ.conf_zonotope(pZ( Xaug[k].c[0:2,:], Xaug[k].G[0:2,:], Xaug[k].Sigma[0:2,0:2]), conf_value)
@@ -194,9 +203,258 @@ def compute_reachable_sets_position_sensing(xnom, unom, Xaug0, P0, Q, WpZ, VpZs,
     return Xaug, Zaug, P_all
 
 
-def is_collision_free( Zaug, unsafeZ, collisionCheckOrder=np.inf, distCheck=False, dist_threshold=np.inf):
+def create_motion_sensing_pZ_batch(xnom, Q, R, m, bias_area_lims, regular_bias, different_bias):
+    """Create motion and sensing p-zonotopes for a batch of nominal trajectories
+
+    Batched counterpart of create_motion_sensing_pZ. Sensing p-zonotopes are returned 
+    as stacked generator and covariance arrays instead of lists of pZ objects.
+
+    Parameters
+    ----------
+    xnom : np.array (Bx4xN)
+        Nominal states for B trajectories
+    Q : np.array (4x4)
+        Motion model covariance
+    R : np.array (3x3)
+        Sensing model covariance
+    m : float 
+        Desired confidence level
+    bias_area_lims : 4-element list of scalars [x_min, y_min, x_max, y_max]
+        Area limits for where position/range sensing bias is present: 
+    regular_bias : float
+        Amount of position/range sensing bias outside bias area
+    different_bias : float
+        Amount of position/range sensing bias inside bias area
+
+    Returns
+    -------
+    WpZ : pZ object
+        p-zonotope for motion uncertainty.
+    VpZ_G : np.array (Bx3x3xN)
+        Generators of sensing uncertainty p-zonotopes along nominal trajectories.
+    VpZ_Sigma : np.array (3x3xN)
+        Covariances of sensing uncertainty p-zonotopes along nominal trajectories.
+    Rhats : np.array (Bx3x3xN)
+        Approximate measurement covariance matrices to be used by EKF.
+    """
+
+    # Get batch size and trajectory length
+    n_batch = xnom.shape[0]; N = xnom.shape[2]
+    # Get state and measurement dimensions
+    state_dim = xnom.shape[1]
+    measurement_dim = R.shape[0]
+
+    # Get nominal trajectory indices within bias area
+    bias_area_idx = (xnom[:,0,:] >= bias_area_lims[0]) * (xnom[:,1,:] >= bias_area_lims[1]) * (xnom[:,0,:] <= bias_area_lims[2]) * (xnom[:,1,:] <= bias_area_lims[3])
+
+    # Create sensing bias array along nominal trajectories, assuming no bias in the heading measurements
+    bias_array = np.ones(measurement_dim); bias_array[-1] = 0
+    z_bias_w = np.where(bias_area_idx[:,None,:], different_bias, regular_bias) * bias_array[None,:,None]
+
+    # Create prob zonotope for motion uncertainties
+    WpZ = pZ(np.zeros((state_dim,1)), np.zeros((state_dim,0)), Q)
+
+    # Sensing generators are diagonal bias matrices, covariance is the same along the trajectory
+    VpZ_G = np.zeros((n_batch, measurement_dim, measurement_dim, N))
+    diag_idx = np.arange(measurement_dim)
+    VpZ_G[:,diag_idx,diag_idx,:] = z_bias_w
+    VpZ_Sigma = np.repeat(R[:,:,np.newaxis], N, axis=2)
+
+    # Use over-bounding hypothesis for the approximate measurement covariance matrices
+    Rhats = np.zeros((n_batch, measurement_dim, measurement_dim, N))
+    Rhats[:,diag_idx,diag_idx,:] = ((z_bias_w + m*np.sqrt(np.diag(R))[None,:,None])/m)**2
+
+    return WpZ, VpZ_G, VpZ_Sigma, Rhats
+
+
+def compute_reachable_sets_position_sensing_batch(xnom, unom, Xaug0, P0, Q, WpZ, VpZ_G, VpZ_Sigma, Rhats, Q_lqr, R_lqr, m, dt, gain_schedule=None):
+    """Compute reachable sets for a batch of nominal trajectories of the unicycle model with position and heading sensing
+
+    Batched counterpart of compute_reachable_sets_position_sensing. All B trajectories 
+    start from the same initial reachable set and are propagated together, with the 
+    EKF covariances, reach coefficients and p-zonotope generators/covariances stored 
+    as stacked arrays.
+
+    Parameters
+    ----------
+    xnom : np.array (Bx4xN)
+        Nominal states.
+    unom : np.array (Bx2xN)
+        Nominal control inputs.
+    Xaug0 : pZ object
+        Initial reachable set (shared by all trajectories).
+    P0 : np.array (4x4)
+        Initial state estimation covariance matrix.
+    Q : np.array (4x4)
+        Motion model covariance.
+    WpZ : pZ object
+        p-zonotope for motion uncertainty.
+    VpZ_G : np.array (Bx3x3xN)
+        Generators of sensing uncertainty p-zonotopes along nominal trajectories.
+    VpZ_Sigma : np.array (3x3xN)
+        Covariances of sensing uncertainty p-zonotopes along nominal trajectories.
+    Rhats : np.array (Bx3x3xN)
+        Approximate measurement covariance matrices to be used by EKF.
+    Q_lqr : np.array (4x4)
+        LQR state weight matrix used to determine K.
+    R_lqr : np.array (2x2)
+        LQR control weight matrices used to determine K.
+    m : float
+        Desired confidence level.
+    dt : float
+        Discrete time-step.
+    gain_schedule : GainSchedule
+        Cached feedback gains to use instead of solving the DARE at every timestep.
+
+    Returns
+    -------
+    Xaug_G : N-element list of np.array (Bx8xn_gen)
+        Generators of probabilistic reachable sets (centers are the tiled nominal states).
+    Xaug_Sigma : np.array (Bx8x8xN)
+        Covariances of probabilistic reachable sets.
+    Zaug_G : N-element list of np.array (Bx2xn_gen)
+        Generators of confidence reachable sets (centers are the nominal positions).
+    P_all : np.array (Bx4x4xN)
+        State estimation covariance matrices along nominal trajectories. 
+
+    """
+
+    # Get batch size and the timesteps for which we need to compute the reachable sets
+    n_batch = xnom.shape[0]; N_timesteps = xnom.shape[2]
+
+    # Get state, input and measurement dimensions
+    state_dim = xnom.shape[1]; input_dim = unom.shape[1]
+    measurement_dim = Rhats.shape[1]
+
+    # Get confidence value for m-sigma in 2d using chi-square distribution
+    conf_value = np.sqrt(chi2.ppf(math.erf(m/np.sqrt(2)),df=2))
+
+    # Constant blocks of the reach coefficients
+    I_s = np.broadcast_to(np.identity(state_dim), (n_batch, state_dim, state_dim))
+    Z_ss = np.zeros((n_batch, state_dim, state_dim))
+    Z_sm = np.zeros((n_batch, state_dim, measurement_dim))
+    Z_is = np.zeros((n_batch, input_dim, state_dim))
+
+    # Init state estimation covariance matrices, prob reach sets and confidence reach sets
+    P_all = np.zeros((n_batch,state_dim,state_dim,N_timesteps)); P_all[...,0] = P0
+    Xaug_G = [None]*N_timesteps; Xaug_G[0] = np.broadcast_to(Xaug0.G, (n_batch,) + Xaug0.G.shape)
+    Xaug_Sigma = np.zeros((n_batch,2*state_dim,2*state_dim,N_timesteps)); Xaug_Sigma[...,0] = Xaug0.Sigma
+    Zaug_G = [None]*N_timesteps; Zaug_G[0] = conf_zonotope_generators_batch(Xaug_G[0][:,0:2,:], Xaug_Sigma[:,0:2,0:2,0], conf_value)
+
+    # Iterate over nominal trajectories to compute reach sets
+    for k in range(1,N_timesteps):
+
+        # Get robot matrices
+        A, B, C, K = generate_robot_matrices_batch(xnom[:,:,k-1], unom[:,:,k-1], Q_lqr, R_lqr, dt, gain_schedule)
+
+        # Perform the EKF predict step
+        P_pred = A @ P_all[...,k-1] @ A.transpose(0,2,1) + Q
+
+        # Perform the EKF update/correction step
+        L = P_pred @ C.T @ np.linalg.inv(C @ P_pred @ C.T + Rhats[...,k])
+        LC = L @ C
+        P_all[...,k] = P_pred - LC @ P_pred
+
+        # Recursive reach coefficients for previous reach set, motion uncertainty and sensing uncertainty
+        BK = B @ K; LCA = LC @ A
+        phi = np.block([[A, -BK],[LCA, A - BK - LCA]])
+        phi_w = np.concatenate((I_s, LC), axis=1)
+        phi_v = np.concatenate((Z_sm, L), axis=1)
+
+        # Recursive reach coefficients for lagrange remainders
+        phi_Lf1 = phi_w
+        phi_Lf2 = np.concatenate((Z_ss, I_s - LC), axis=1)
+
+        # Compute prob zonotopes needed for motion model lagrange remainders
+        T_s = np.block([[I_s, Z_ss], [Z_is, -K]])
+        T_shat = np.block([[Z_ss, I_s], [Z_is, -K]])
+        Sigma_prev = Xaug_Sigma[...,k-1]
+
+        # Compute motion model lagrange remainders (covariance only)
+        Lf1_Sigma = lagrange_remainder_f_batch(T_s @ Xaug_G[k-1], T_s @ Sigma_prev @ T_s.transpose(0,2,1), xnom[:,:,k-1], m, dt)
+        Lf2_Sigma = lagrange_remainder_f_batch(T_shat @ Xaug_G[k-1], T_shat @ Sigma_prev @ T_shat.transpose(0,2,1), xnom[:,:,k-1], m, dt)
+
+        # Add inidividual terms to get reach set which is centered at the nominal trajectory
+        Xaug_G[k] = np.concatenate((phi @ Xaug_G[k-1], phi_w @ WpZ.G, phi_v @ VpZ_G[...,k]), axis=2)
+        Xaug_Sigma[...,k] = (phi @ Sigma_prev @ phi.transpose(0,2,1) 
+                             + phi_w @ WpZ.Sigma @ phi_w.transpose(0,2,1)
+                             + phi_v @ VpZ_Sigma[:,:,k] @ phi_v.transpose(0,2,1) 
+                             + phi_Lf1 @ Lf1_Sigma @ phi_Lf1.transpose(0,2,1) 
+                             + phi_Lf2 @ Lf2_Sigma @ phi_Lf2.transpose(0,2,1))
+
+        # Generate confidence zonotopes for collision checks
+        Zaug_G[k] = conf_zonotope_generators_batch(Xaug_G[k][:,0:2,:], Xaug_Sigma[:,0:2,0:2,k], conf_value)
+
+    return Xaug_G, Xaug_Sigma, Zaug_G, P_all
+
+
+def get_batch_reach_set(xnom, Xaug_G, Xaug_Sigma, b, k):
+    """Extract a single probabilistic reachable set from batched reachability results
+
+    Parameters
+    ----------
+    xnom : np.array (Bx4xN)
+        Nominal states.
+    Xaug_G : N-element list of np.array (Bx8xn_gen)
+        Generators of probabilistic reachable sets.
+    Xaug_Sigma : np.array (Bx8x8xN)
+        Covariances of probabilistic reachable sets.
+    b : int
+        Trajectory index in the batch.
+    k : int
+        Timestep index.
+
+    Returns
+    -------
+    pZ object
+        Probabilistic reachable set of trajectory b at timestep k.
+
+    """
+    return pZ(np.tile(xnom[b][:,[k]],(2,1)), np.array(Xaug_G[k][b]), np.array(Xaug_Sigma[b,:,:,k]))
+
+
+def get_batch_conf_zonotopes(xnom, Zaug_G, b, n_timesteps):
+    """Extract confidence reachable sets of a single trajectory from batched reachability results
+
+    Parameters
+    ----------
+    xnom : np.array (Bx4xN)
+        Nominal states.
+    Zaug_G : N-element list of np.array (Bx2xn_gen)
+        Generators of confidence reachable sets.
+    b : int
+        Trajectory index in the batch.
+    n_timesteps : int
+        Number of timesteps to extract (length of trajectory b).
+
+    Returns
+    -------
+    Zaug : n_timesteps-element list of pZ objects without any covariance component
+        Confidence reachable sets.
+
+    """
+    return [pZ(xnom[b][0:2,[k]], Zaug_G[k][b], np.zeros((2,2))) for k in range(n_timesteps)]
+
+
+def conf_zonotope_generators_batch(G, Sigma, conf_value):
+    """Generators of confidence zonotopes for a batch of p-zonotopes
+
+    Batched counterpart of pZ.conf_zonotope which only returns the generators.
+
+    """
+    # Get eigenvalues and eigenvectors, and approximate the scaled ellipsoids with generators
+    d, v = np.linalg.eig(Sigma)
+    cov_G = conf_value * v * np.sqrt(np.abs(d))[:,None,:]
+
+    return np.concatenate((G, cov_G), axis=2)
+
+
+def is_collision_free( Zaug, unsafeZ, collisionCheckOrder=np.inf, distCheck=False, dist_threshold=np.inf, unsafe_index=None):
     """Check if confidence reachable sets are collision free w.r.t. unsafe zonotope
 
+    Only unsafe sets whose interval hulls overlap the interval hull of a reach set are 
+    passed to the exact intersection test.
+
     Parameters
     ----------
     Zaug : N-element list of pZ objects without any covariance component
@@ -209,6 +467,8 @@ def is_collision_free( Zaug, unsafeZ, collisionCheckOrder=np.inf, distCheck=Fals
         Flag to determine whether to consider only nearby obstacles for collision checking.
     dist_threshold : float
         Distance threshold for determining nearby obstacles.
+    unsafe_index : ObstacleGrid
+        Prebuilt spatial index of unsafeZ. Built on the fly if not provided.
     
     Returns
     -------
@@ -217,8 +477,10 @@ def is_collision_free( Zaug, unsafeZ, collisionCheckOrder=np.inf, distCheck=Fals
 
     """
 
-    # Get length of trajectory and number of unsafe sets
-    N = len(Zaug); M = len(unsafeZ)
+    # Get length of trajectory and spatial index of unsafe sets
+    N = len(Zaug)
+    if unsafe_index is None:
+        unsafe_index = ObstacleGrid(unsafeZ)
     
     # Init collision free flag and iterate over reach sets
     isCollisionFree = True
@@ -231,8 +493,9 @@ def is_collision_free( Zaug, unsafeZ, collisionCheckOrder=np.inf, distCheck=Fals
         else:
             tZ = Zaug[k]
 
-        # Iterate over unsafe sets        
-        for j in range(M):
+        # Iterate over unsafe sets whose interval hulls overlap the reach set interval hull
+        lower, upper = pZ.interval_hull(tZ)
+        for j in unsafe_index.query(lower, upper):
             
             # Check if unsafe set is closer than specified distance threshold
             if distCheck:
@@ -257,13 +520,21 @@ def is_collision_free( Zaug, unsafeZ, collisionCheckOrder=np.inf, distCheck=Fals
 
     return isCollisionFree
 
-def is_empty_con_zonotope(A, b, method='scipy'):
+def is_empty_con_zonotope(A, b, method='auto'):
     """Check if constrained zonotope is empty. 
     
     Used to detect intersection between reach set and unsafe set.
     Implemented by Adam Dai, Derek Knowles (http://cs229.stanford.edu/proj2021spr/report2/81976691.pdf)
+
+    With method 'auto', 2D problems are solved in closed form (see is_empty_con_zonotope_2D) 
+    and higher dimensional problems with the scipy LP.
     """
 
+    if method == 'auto':
+        method = 'geometric' if A.shape[0] == 2 else 'scipy'
+    if method == 'geometric':
+        return is_empty_con_zonotope_2D(A, b)
+
     # Dimension of problem
     d = A.shape[1]
 
@@ -299,6 +570,54 @@ def is_empty_con_zonotope(A, b, method='scipy'):
     return True
 
 
+def is_empty_con_zonotope_2D(A, b, tol=1e-9):
+    """Check if 2D constrained zonotope is empty without solving an LP.
+
+    The constrained zonotope {x : A x = b, ||x||_inf <= 1} is non-empty iff b lies in the 
+    zonotope with center 0 and generators A. In 2D, this zonotope has one pair of facets 
+    per generator direction, so b is tested against the halfspace bounds along each 
+    generator normal. Degenerate zonotopes (a point or a line segment) are handled separately.
+
+    Parameters
+    ----------
+    A : np.array (2 x n_gen)
+        Generators of the Minkowski sum of the two zonotopes.
+    b : np.array (2 x 1)
+        Difference between the zonotope centers.
+    tol : float
+        Tolerance on the halfspace bounds.
+
+    Returns
+    -------
+    bool
+        True if the constrained zonotope is empty (i.e. no intersection).
+
+    """
+    # Remove zero generators
+    G = A[:, np.any(A != 0, axis=0)]
+
+    # Zonotope is a point
+    if G.shape[1] == 0:
+        return bool(np.linalg.norm(b) > tol)
+
+    # Zonotope is a line segment if all generators are parallel to the largest one, 
+    # then b must lie on the line and within the segment
+    G_norms = np.sqrt(G[0,:]**2 + G[1,:]**2)
+    u = G[:,[np.argmax(G_norms)]] / np.max(G_norms)
+    if np.all(np.abs(u[0,0]*G[1,:] - u[1,0]*G[0,:]) <= tol * np.max(G_norms)):
+        normals = np.hstack((u, np.array([[-u[1,0]], [u[0,0]]])))
+        d = np.array([np.sum(np.abs(u.T @ G)), 0.0])
+        return bool(np.any(np.abs(normals.T @ b).flatten() > d + tol))
+
+    # Unit normals of the generator directions
+    normals = np.vstack((-G[1,:], G[0,:])) / G_norms
+
+    # Halfspace bounds of the zonotope along each normal
+    d = np.sum(np.abs(normals.T @ G), axis=1)
+
+    return bool(np.any(np.abs(normals.T @ b).flatten() > d + tol))
+
+
 def lagrange_remainder_f(del_s_, xnom_, unom_, m, dt):
     """Lagrange remainder function
 
@@ -346,7 +665,59 @@ def lagrange_remainder_f(del_s_, xnom_, unom_, m, dt):
     return L
 
 
-def generate_robot_matrices(x_nom, u_nom, Q_lqr, R_lqr, dt):
+def lagrange_remainder_f_batch(del_s_G, del_s_Sigma, xnom_, m, dt):
+    """Lagrange remainder function for a batch of trajectories
+
+    Batched counterpart of lagrange_remainder_f. Since the lagrange remainder p-zonotopes 
+    have zero center and no generators, only their covariances are returned.
+
+    Parameters
+    ----------
+    del_s_G : np.array (Bx6xn_gen)
+        Generators of the state and input deviation p-zonotopes.
+    del_s_Sigma : np.array (Bx6x6)
+        Covariances of the state and input deviation p-zonotopes.
+    xnom_ : np.array (Bx4)
+        Nominal states.
+    m : float
+        Desired confidence level.
+    dt : float
+        Discrete time-step.
+
+    Returns
+    -------
+    np.array (Bx4x4)
+        Covariances of the lagrange remainder p-zonotopes.
+
+    """
+    n_batch = xnom_.shape[0]
+    state_dim = xnom_.shape[1]
+
+    d, v = np.linalg.eig(del_s_Sigma)
+    gamma = np.sum(np.abs(del_s_G), axis=2) + m * np.sum(np.abs(v * np.sqrt(np.abs(d))[:,None,:]), axis=2)
+
+    t1 = xnom_[:,2] - gamma[:,2]; t2 = xnom_[:,2] + gamma[:,2]
+
+    cos_max = np.where(np.floor(t1/np.pi) != np.floor(t2/np.pi), 1.0,
+                       np.maximum(np.abs(np.cos(t1)), np.abs(np.cos(t2))))
+    sin_max = np.where(np.floor((t1 - np.pi/2)/np.pi) != np.floor((t2 - np.pi/2)/np.pi), 1.0, 
+                       np.maximum(np.abs(np.sin(t1)), np.abs(np.sin(t2))))
+
+    V_max = xnom_[:,3] + gamma[:,3]
+
+    # Only the (theta, v) entries of the maximum jacobians are nonzero
+    LR = np.zeros((n_batch, state_dim))
+    LR[:,0] = 0.5 * (V_max * cos_max * dt * gamma[:,2]**2 + 2 * sin_max * dt * gamma[:,2] * gamma[:,3])
+    LR[:,1] = 0.5 * (V_max * sin_max * dt * gamma[:,2]**2 + 2 * cos_max * dt * gamma[:,2] * gamma[:,3])
+
+    Sigma = np.zeros((n_batch, state_dim, state_dim))
+    diag_idx = np.arange(state_dim)
+    Sigma[:,diag_idx,diag_idx] = (LR/m)**2
+
+    return Sigma
+
+
+def generate_robot_matrices(x_nom, u_nom, Q_lqr, R_lqr, dt, gain_schedule=None):
     """Generate A, B, C and K matrices for robot based on given nominal state and input vector.
 
     Parameters
@@ -361,6 +732,8 @@ def generate_robot_matrices(x_nom, u_nom, Q_lqr, R_lqr, dt):
         LQR input cost weight matrix
     dt: float
         discrete time-step
+    gain_schedule : GainSchedule
+        cached feedback gains (K is computed by solving the DARE if not provided)
 
     Returns
     -------
@@ -396,7 +769,10 @@ def generate_robot_matrices(x_nom, u_nom, Q_lqr, R_lqr, dt):
 
     # Compute control feedback gain matrix
     if np.abs(x_nom[3,0]) > 0.01:  # if there is sufficient speed for controllability
-        K = dlqr_calculate(A, B, Q_lqr, R_lqr)
+        if gain_schedule is None:
+            K = dlqr_calculate(A, B, Q_lqr, R_lqr)
+        else:
+            K = gain_schedule.get(x_nom[2,0], x_nom[3,0])
     else:
         K = np.array([[0, 0, 1.0, 0], 
                       [0, 0, 0, 1.0]])  # tuned from flight room tests
@@ -404,6 +780,68 @@ def generate_robot_matrices(x_nom, u_nom, Q_lqr, R_lqr, dt):
     return A, B, C, K
 
 
+def generate_robot_matrices_batch(x_nom, u_nom, Q_lqr, R_lqr, dt, gain_schedule=None):
+    """Generate A, B, C and K matrices for a batch of nominal states and inputs.
+
+    Parameters
+    ----------
+    x_nom : np.array (Bx4)
+        nominal states
+    u_nom : np.array (Bx2)
+        nominal inputs
+    Q_lqr : np.array (4x4)
+        LQR state cost weight matrix
+    R_lqr: np.array (2x2)
+        LQR input cost weight matrix
+    dt: float
+        discrete time-step
+    gain_schedule : GainSchedule
+        cached feedback gains (K is computed by solving the DARE if not provided)
+
+    Returns
+    -------
+    A : np.array (Bx4x4)
+        Linearized motion model matrices.
+    B : np.array (4x2)
+        Linearized control input matrix (same for all states).
+    C : np.array (3x4)
+        Measurement matrix (same for all states).
+    K : np.array (Bx2x4)
+        Control feedback gain matrices.
+
+    """
+    n_batch = x_nom.shape[0]
+    state_dim = x_nom.shape[1]
+    input_dim = u_nom.shape[1]
+    measurement_dim = 3  # assuming 2D position and heading measurement
+
+    # Form linearized motion model matrices
+    A = np.tile(np.identity(state_dim), (n_batch,1,1))
+    A[:,0,2] = -x_nom[:,3]*np.sin(x_nom[:,2])*dt
+    A[:,0,3] = np.cos(x_nom[:,2])*dt
+    A[:,1,2] = x_nom[:,3]*np.cos(x_nom[:,2])*dt
+    A[:,1,3] = np.sin(x_nom[:,2])*dt
+
+    # Form linearized control input matrix
+    B = np.zeros((state_dim,input_dim))
+    B[2,0] = dt; B[3,1] = dt
+
+    # Form measurement matrix
+    C = np.zeros((measurement_dim, state_dim))
+    C[0,0] = 1; C[1,1] = 1; C[2,2] = 1
+
+    # Compute control feedback gain matrices
+    K = np.tile(np.array([[0, 0, 1.0, 0], 
+                          [0, 0, 0, 1.0]]), (n_batch,1,1))  # tuned from flight room tests
+    for b in np.flatnonzero(np.abs(x_nom[:,3]) > 0.01):  # if there is sufficient speed for controllability
+        if gain_schedule is None:
+            K[b] = dlqr_calculate(A[b], B, Q_lqr, R_lqr)
+        else:
+            K[b] = gain_schedule.get(x_nom[b,2], x_nom[b,3])
+
+    return A, B, C, K
+
+
 def dlqr_calculate(G, H, Q, R):
     """
     Discrete-time Linear Quadratic Regulator calculation.
@@ -0,0 +1,141 @@
+# Persistent process pool for checking safety of trajectory parameters in parallel
+
+import multiprocessing as mp
+import queue
+import time
+import numpy as np
+
+import planner.planner_utils as plan_util
+import params.params as params
+
+
+def safety_check_worker(worker_idx, task_queue, result_queue, current_seg_id):
+    """Worker process loop
+
+    Receives the initial conditions once per segment, then checks batches of trajectory
+    parameters for that segment and streams back the safety verdicts. Batches from segments
+    older than the current one (shared by the parent in current_seg_id) are skipped without
+    being checked or returned.
+
+    Messages on the task queue are ('segment', seg_id, x_nom0, Xaug0, P0),
+    ('check', seg_id, kw, kv) or None to exit. Results are put on the result queue
+    as (worker_idx, seg_id, kw, kv, isSafe, latency), where latency is the time taken by
+    the batch safety check.
+
+    """
+    seg_id = None
+
+    while True:
+        msg = task_queue.get()
+        if msg is None:
+            break
+
+        if msg[0] == 'segment':
+            _, seg_id, x_nom0, Xaug0, P0 = msg
+
+        elif msg[0] == 'check':
+            _, task_seg_id, kw, kv = msg
+            if task_seg_id != current_seg_id.value:
+                continue  # stale batch, results would be discarded
+            if task_seg_id != seg_id:
+                continue  # initial conditions of this segment not received
+
+            t_check = time.time()
+            isSafe = plan_util.check_trajectory_parameter_safety_batch(kw, kv, x_nom0, Xaug0, P0, params.ENV_INFO)[0]
+            latency = time.time() - t_check
+
+            result_queue.put((worker_idx, task_seg_id, kw, kv, isSafe, latency))
+
+
+class SafetyCheckPool:
+    """Persistent pool of worker processes for checking safety of trajectory parameters
+
+    Workers are forked once (after params and the gain schedule have been loaded), so they
+    start with params.ENV_INFO preloaded. The pool must be created before rospy.init_node and
+    before any other threads are started, since forking a multithreaded process can leave
+    locks held by other threads locked in the workers. The initial conditions of each planning segment
+    are sent to every worker once, after which only trajectory parameters are sent.
+
+    Attributes
+    ----------
+    n_workers : int
+        Number of worker processes.
+    seg_id : int
+        Identifier of current segment, used to discard stale results.
+    current_seg_id : multiprocessing.Value
+        Identifier of current segment shared with the workers, used to skip stale batches.
+    n_pending : list of int
+        Number of batches submitted to each worker for current segment and not yet returned.
+
+    """
+    def __init__(self, n_workers):
+        ctx = mp.get_context('fork')
+        self.n_workers = n_workers
+        self.result_queue = ctx.Queue()
+        self.task_queues = [ctx.Queue() for _ in range(n_workers)]
+        self.current_seg_id = ctx.Value('i', 0, lock=False)
+        self.workers = [ctx.Process(target=safety_check_worker, args=(i, self.task_queues[i], self.result_queue, self.current_seg_id), daemon=True)
+                        for i in range(n_workers)]
+        for w in self.workers:
+            w.start()
+
+        self.seg_id = 0
+        self.n_pending = [0]*n_workers
+
+
+    def start_segment(self, x_nom0, Xaug0, P0):
+        """Send initial conditions for new planning segment to all workers"""
+        self.seg_id += 1
+        self.current_seg_id.value = self.seg_id
+        self.n_pending = [0]*self.n_workers
+        for q in self.task_queues:
+            q.put(('segment', self.seg_id, x_nom0, Xaug0, P0))
+
+
+    def submit(self, kw, kv):
+        """Submit batch of trajectory parameters to least loaded worker"""
+        i = int(np.argmin(self.n_pending))
+        self.task_queues[i].put(('check', self.seg_id, np.asarray(kw), np.asarray(kv)))
+        self.n_pending[i] += 1
+
+
+    def total_pending(self):
+        """Total number of batches pending for current segment"""
+        return sum(self.n_pending)
+
+
+    def get_results(self, timeout):
+        """Collect available results for current segment
+
+        Parameters
+        ----------
+        timeout : float
+            Maximum time to wait for the first result [s].
+
+        Returns
+        -------
+        list of tuples (kw, kv, isSafe, latency)
+            Checked batches of trajectory parameters, their safety verdicts and the batch
+            check latency [s].
+
+        """
+        results = []
+        try:
+            msg = self.result_queue.get(timeout=timeout)
+            while True:
+                worker_idx, seg_id, kw, kv, isSafe, latency = msg
+                if seg_id == self.seg_id:
+                    self.n_pending[worker_idx] -= 1
+                    results.append((kw, kv, isSafe, latency))
+                msg = self.result_queue.get_nowait()
+        except queue.Empty:
+            pass
+        return results
+
+
+    def close(self):
+        """Stop worker processes"""
+        for q in self.task_queues:
+            q.put(None)
+        for w in self.workers:
+            w.join(timeout=1.0)
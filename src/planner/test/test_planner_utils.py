@@ -0,0 +1,34 @@
+"""Equivalence tests of vectorized nominal trajectory generation against the per-parameter reference"""
+
+import numpy as np
+
+import planner.planner_utils as plan_util
+import params.params as params
+
+
+def test_nominal_trajectories_match_serial():
+    """Vectorized nominal trajectories match the per-parameter generator, including padding"""
+    rng = np.random.default_rng(0)
+    kw = rng.uniform(params.KW_LIMS[0], params.KW_LIMS[1], 50)
+    kv = rng.uniform(params.KV_LIMS[0], params.KV_LIMS[1], 50)
+    kv[:5] = [params.KV_LIMS[0], 0.0, params.KV_LIMS[1], params.MAX_ACC_MAG*params.DT, 0.25]  # boundary cases
+
+    # Initial states with headings close to the angle wrap
+    for x_nom0 in [params.X_0, np.array([[1.0],[2.0],[3.1],[0.4]]), np.array([[1.0],[2.0],[-3.1],[-0.3]])]:
+        xnom, unom, N_timesteps = plan_util.trajectory_parameters_to_nominal_trajectories(
+            kw, kv, x_nom0, params.T_SEG, params.DT, params.MAX_ACC_MAG)
+
+        for b in range(len(kw)):
+            xnom_ref, unom_ref = plan_util.trajectory_parameter_to_nominal_trajectory(
+                kw[b], kv[b], x_nom0, params.T_SEG, params.DT, params.MAX_ACC_MAG)
+            N = N_timesteps[b]
+            assert N == xnom_ref.shape[1]
+
+            err = xnom[b,:,:N] - xnom_ref
+            err[2] = np.angle(np.exp(1j*err[2]))  # headings compared modulo 2 pi
+            np.testing.assert_allclose(err, 0, atol=1e-9)
+            np.testing.assert_allclose(unom[b,:,:N-1], unom_ref, atol=1e-9)
+
+            # Padding holds the final state with zero control input
+            np.testing.assert_allclose(xnom[b,:,N:], np.tile(xnom_ref[:,[-1]], (1, xnom.shape[2]-N)), atol=1e-9)
+            np.testing.assert_allclose(unom[b,:,N-1:], 0, atol=1e-9)
@@ -0,0 +1,58 @@
+"""Equivalence tests of batched and closed form reachability computations against their references"""
+
+import numpy as np
+
+import planner.planner_utils as plan_util
+import planner.reachability_utils as reach_util
+import params.params as params
+
+
+def test_batch_reach_sets_match_serial():
+    """Batched reach sets and safety verdicts match the per-parameter computation"""
+    rng = np.random.default_rng(0)
+    kw = rng.uniform(params.KW_LIMS[0], params.KW_LIMS[1], 5)
+    kv = rng.uniform(params.KV_LIMS[0], params.KV_LIMS[1], 5)
+    Xaug0 = reach_util.initialize_reachability_analysis(params.X_0, params.P_0)
+
+    isSafe, reach_sets, xnom, _, N_timesteps = plan_util.check_trajectory_parameter_safety_batch(
+        kw, kv, params.X_0, Xaug0, params.P_0, params.ENV_INFO)
+    Xaug_G, Xaug_Sigma, Zaug_G, P_all = reach_sets
+
+    for b in range(len(kw)):
+        isSafe_ref, Xaug_ref, Zaug_ref, P_ref, xnom_ref, _ = plan_util.check_trajectory_parameter_safety(
+            kw[b], kv[b], params.X_0, Xaug0, params.P_0, params.ENV_INFO)
+        assert isSafe[b] == isSafe_ref
+        assert N_timesteps[b] == xnom_ref.shape[1]
+
+        Zaug = reach_util.get_batch_conf_zonotopes(xnom, Zaug_G, b, N_timesteps[b])
+        for k in range(N_timesteps[b]):
+            Xaug = reach_util.get_batch_reach_set(xnom, Xaug_G, Xaug_Sigma, b, k)
+            np.testing.assert_allclose(Xaug.c, Xaug_ref[k].c, atol=1e-9)
+            np.testing.assert_allclose(Xaug.G, Xaug_ref[k].G, atol=1e-9)
+            np.testing.assert_allclose(Xaug.Sigma, Xaug_ref[k].Sigma, atol=1e-9)
+            np.testing.assert_allclose(P_all[b,:,:,k], P_ref[:,:,k], atol=1e-9)
+
+            # Confidence zonotopes are compared by their interval hulls
+            np.testing.assert_allclose(Zaug[k].c, Zaug_ref[k].c, atol=1e-9)
+            np.testing.assert_allclose(np.sum(np.abs(Zaug[k].G), axis=1), np.sum(np.abs(Zaug_ref[k].G), axis=1), atol=1e-9)
+
+
+def test_2D_emptiness_matches_lp():
+    """Closed form 2D emptiness check agrees with the LP, including degenerate zonotopes"""
+    rng = np.random.default_rng(0)
+    for i in range(300):
+        n_gen = rng.integers(2, 8)
+        A = rng.normal(size=(2, n_gen))
+        if i % 10 == 0:
+            # Line segment (all generators parallel)
+            A = rng.normal(size=(2,1)) * rng.normal(size=(1, n_gen))
+        elif i % 10 == 1:
+            # Point
+            A = np.zeros((2, n_gen))
+        b = rng.normal(scale=2.0, size=(2,1))
+        if i % 10 in (0, 1):
+            # The LP is infeasible for b off the span of degenerate zonotopes
+            b = A @ rng.uniform(-2, 2, (n_gen, 1))
+
+        assert reach_util.is_empty_con_zonotope(A, b, method='geometric') == \
+               reach_util.is_empty_con_zonotope(A, b, method='scipy')
@@ -2,6 +2,7 @@ import rospy
 import rospkg
 import numpy as np
 import time 
+from scipy.spatial import cKDTree
 
 from trajectory_msgs.msg import JointTrajectory
 
@@ -53,10 +54,37 @@ class LinearPlanner:
 
         # Obstacles
         self.obstacles = params.OBSTACLES
+        self.c_obs, self.r_obs = utils.stack_obstacles(self.obstacles, params.N_DIM)
+        self.obs_tree = cKDTree(self.c_obs) if len(self.obstacles) > 0 else None
+        self.r_obs_max = np.max(self.r_obs) if len(self.obstacles) > 0 else 0.0
 
         self.done = False
 
 
+    def nearby_obstacles(self):
+        """Get obstacles which intersect the reachable corridor of the next plan.
+
+        The corridor is the ball around p_0 bounding all trajectories from the current 
+        initial conditions, and obstacles are queried from a KD-tree over their centers.
+
+        Returns
+        -------
+        np.array (N_nearby x n)
+            Obstacle centers
+        np.array (N_nearby)
+            Obstacle radii
+
+        """
+        if self.obs_tree is None:
+            return self.c_obs, self.r_obs
+        r_corridor = self.LPM.reach_radius(self.v_0, self.a_0, params.V_MAX_NORM) + 2*params.R_BOT
+        p_0 = self.p_0.flatten()
+        idx = np.array(self.obs_tree.query_ball_point(p_0, r_corridor + self.r_obs_max), dtype=int)
+        # Exact check with each obstacle's radius
+        idx = idx[np.linalg.norm(self.c_obs[idx] - p_0, axis=1) <= r_corridor + self.r_obs[idx]]
+        return self.c_obs[idx], self.r_obs[idx]
+
+
     def check_obstacle_collisions(self, positions):
         """ Check a sequence of positions against the current list of nearby obstacles for collision.
 
@@ -71,10 +99,8 @@ class LinearPlanner:
             True if plan is safe, False if there is a collision.
 
         """
-        for obs in self.obstacles:
-            if not utils.check_obs_collision(positions, obs, 2*params.R_BOT):
-                return False
-        return True
+        c_obs, r_obs = self.nearby_obstacles()
+        return utils.check_obs_collision_batch(positions[None,:,:], c_obs, r_obs, 2*params.R_BOT)[0]
 
 
     def traj_opt(self, t_start_plan):
@@ -99,6 +125,9 @@ class LinearPlanner:
         # Eliminate samples that exceed the max velocity and max delta from initial velocity
         V_peak = utils.prune_vel_samples(V_peak, self.v_0, params.V_MAX_NORM, params.DELTA_V_PEAK_MAX)
 
+        if V_peak.shape[1] == 0:
+            return None
+
         # Calculate the endpoints for the sample v_peaks
         P_endpoints = self.LPM.compute_endpoints(self.v_0, self.a_0, V_peak) + self.p_0
         
@@ -107,19 +136,21 @@ class LinearPlanner:
         V_sort_idxs = np.argsort(dist_to_goal)
         V_peak = V_peak[:,V_sort_idxs]
 
-        # Iterate through V_peaks until we find a feasible one
-        for i in range(V_peak.shape[1]):
-        
-            # Get candidate trajectory positions for current v_peak
-            v_peak = V_peak[:,i][:,None]
-            k = np.hstack((self.v_0, self.a_0, v_peak))
-            cand_traj = self.LPM.compute_positions(k) + self.p_0
+        c_obs, r_obs = self.nearby_obstacles()
 
-            # check against obstacles
-            check_obs = self.check_obstacle_collisions(cand_traj)
+        # Check V_peaks in chunks until we find a feasible one
+        for i in range(0, V_peak.shape[1], params.N_PLAN_CHUNK):
 
-            if check_obs:
-                return v_peak
+            # Candidate trajectory positions for current chunk of v_peaks (N_chunk x n x N)
+            V_chunk = V_peak[:,i:i+params.N_PLAN_CHUNK]
+            cand_trajs = self.LPM.compute_positions_batch(self.v_0, self.a_0, V_chunk) + self.p_0[None,:,:]
+
+            # Check against all nearby obstacles
+            safe = utils.check_obs_collision_batch(cand_trajs, c_obs, r_obs, 2*params.R_BOT)
+
+            # First safe v_peak is the closest to goal
+            if np.any(safe):
+                return V_chunk[:,np.argmax(safe)][:,None]
 
             if (time.time() - t_start_plan > params.T_PLAN):
                 print("Ran out of time for planning, idx = ", i)
@@ -129,6 +160,36 @@ class LinearPlanner:
         return None
 
 
+    def traj_opt_analytic(self):
+        """Analytic Trajectory Optimization
+
+        Solve for the collision-free v_peak nearest to the one which reaches the goal, 
+        using the forbidden regions of v_peak space defined by the obstacles.
+
+        Returns
+        -------
+        np.array or None
+            Optimal v_peak or None if failed to find one
+        
+        """
+        # Goal-reaching v_peak
+        v_goal = self.LPM.solve_trajectory(self.v_0, self.a_0, self.p_goal - self.p_0)
+
+        # Forbidden regions from nearby obstacles (relative to p_0)
+        c_obs, r_obs = self.nearby_obstacles()
+        c_forbid, r_forbid = self.LPM.compute_forbidden_regions(self.v_0, self.a_0, c_obs - self.p_0.T, 
+                                                                r_obs + 2*params.R_BOT)
+        if c_forbid is None:
+            return None
+
+        # Max velocity and max delta from initial velocity constraints
+        c_feas = np.vstack((np.zeros(params.N_DIM), self.v_0.T))
+        r_feas = np.array([params.V_MAX_NORM, params.DELTA_V_PEAK_MAX])
+
+        v_peak = utils.solve_free_v_peak(v_goal.flatten(), c_forbid, r_forbid, c_feas, r_feas, params.V_BOUNDS)
+        return None if v_peak is None else v_peak[:,None]
+
+
     def replan(self, event):
         """Replan
 
@@ -138,7 +199,11 @@ class LinearPlanner:
         t_start_plan = time.time()
 
         # Find a new v_peak
-        v_peak = self.traj_opt(t_start_plan)
+        v_peak = None
+        if params.PLAN_METHOD == 'analytic':
+            v_peak = self.traj_opt_analytic()
+        if v_peak is None:
+            v_peak = self.traj_opt(t_start_plan)
 
         if v_peak is None:
             # Failed to find new plan
@@ -160,13 +225,13 @@ class LinearPlanner:
 
             # Create and send trajectory msg
             t2start = 0  # TODO: this is just a filler value for now
-            traj_msg = utils.wrap_2D_traj_msg((P,V,A), t2start)
+            traj_msg = utils.wrap_traj_msg((P,V,A), t2start)
             self.traj_pub.publish(traj_msg)
         
-        # Check for goal-reached
-        if np.linalg.norm(P[:,-1][:,None] - self.p_goal) < params.R_GOAL_REACHED:
-            print("Goal reached")
-            self.done = True
+            # Check for goal-reached
+            if np.linalg.norm(P[:,-1][:,None] - self.p_goal) < params.R_GOAL_REACHED:
+                print("Goal reached")
+                self.done = True
 
     
     def run(self):
@@ -5,6 +5,7 @@ This module defines the Linear Planning Model (LPM) class.
 
 """
 
+import os
 import numpy as np
 from scipy.io import loadmat
 
@@ -30,17 +31,61 @@ class LPM:
         Matrix for computing velocities
     A_mat : np.array (3 x N)
         Matrix for computing accelerations
+    basis : np.array (3 x 3 x N)
+        Stacked position, velocity and acceleration matrices
     
     Methods
     -------
     compute_trajectory(k) 
         Compute nominal trajectory from a given trajectory parameter
+    compute_trajectory_batch(K)
+        Compute nominal trajectories for a batch of trajectory parameters
+    compute_positions_batch(v_0, a_0, V_peak)
+        Compute positions for a collection of V_peaks
+    reach_radius(v_0, a_0, v_peak_max)
+        Bound the distance from the initial position reachable by any trajectory
     solve_trajectory(v_0, a_0, p_goal)
+        Solve for the peak velocity which reaches a desired goal position
+    compute_forbidden_regions(v_0, a_0, c_obs, r_obs)
+        Compute the regions of peak velocity space which lead to collisions
 
     """
     def __init__(self, mat_file):
         """Construct LPM object from .mat file.
 
+        The parameters are converted once to a cached .npz file next to the .mat file
+        (same name), which is loaded instead on later constructions.
+
+        Parameters
+        ----------
+            mat_file : .mat
+                .mat file containing all the LPM parameters
+        """
+        cache_file = os.path.splitext(mat_file)[0] + '.npz'
+        if os.path.isfile(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(mat_file):
+            with np.load(cache_file) as lpm:
+                self.t_peak = float(lpm['t_peak'])
+                self.t_total = float(lpm['t_total'])
+                self.t_sample = float(lpm['t_sample'])
+                self.time = lpm['time']
+                self.basis = lpm['basis']
+        else:
+            self.load_mat(mat_file)
+            try:
+                np.savez(cache_file, t_peak=self.t_peak, t_total=self.t_total, t_sample=self.t_sample,
+                         time=self.time, basis=self.basis)
+            except OSError:
+                pass  # e.g. read-only install space, keep using the .mat file
+
+        # Views into stacked basis
+        self.P_mat = self.basis[0]
+        self.V_mat = self.basis[1]
+        self.A_mat = self.basis[2]
+
+
+    def load_mat(self, mat_file):
+        """Load LPM parameters from .mat file.
+
         Parameters
         ----------
             mat_file : .mat
@@ -55,9 +100,7 @@ class LPM:
         self.t_total = lpm['t_total'][0,0][0][0]
         self.t_sample = lpm['t_sample'][0,0][0][0]
         self.time = np.array(lpm['time'][0,0])[0]
-        self.P_mat = np.array(lpm['position'][0,0])
-        self.V_mat = np.array(lpm['velocity'][0,0])
-        self.A_mat = np.array(lpm['acceleration'][0,0])
+        self.basis = np.stack((lpm['position'][0,0], lpm['velocity'][0,0], lpm['acceleration'][0,0])).astype(float)
 
 
     def compute_trajectory(self, k):
@@ -74,9 +117,25 @@ class LPM:
             Tuple of the form (p,v,a) where each of p,v,a are n x N where n is the workspace dimension.
         
         """
-        p = k @ self.P_mat
-        v = k @ self.V_mat
-        a = k @ self.A_mat
+        p, v, a = np.einsum('nk,qkt->qnt', k, self.basis)
+        return p,v,a
+
+
+    def compute_trajectory_batch(self, K):
+        """Compute nominal trajectories for a batch of trajectory parameters.
+
+        Parameters
+        ----------
+        K : np.array
+            trajectory parameters, N_samples x n x 3 where each n x 3 is k = (v_0, a_0, v_peak)
+        
+        Returns
+        -------
+        Tuple 
+            Tuple of the form (p,v,a) where each of p,v,a are N_samples x n x N.
+        
+        """
+        p, v, a = np.einsum('snk,qkt->qsnt', K, self.basis, optimize=True)
         return p,v,a
 
     
@@ -97,6 +156,29 @@ class LPM:
         return k @ self.P_mat
 
     
+    def compute_positions_batch(self, v_0, a_0, V_peak):
+        """Compute positions for a collection of V_peaks with shared initial conditions.
+
+        Parameters
+        ----------
+        v_0 : np.array
+            Initial velocity (n x 1)
+        a_0 : np.array
+            Initial acceleration (n x 1)
+        V_peak : np.array
+            Peak velocities (n x N_samples)
+        
+        Returns
+        -------
+        np.array 
+            Positions (N_samples x n x N)
+        
+        """
+        # Position contribution from v_0 and a_0 is shared by all samples
+        p_from_ic = np.hstack((v_0, a_0)) @ self.P_mat[:2]
+        return p_from_ic[None,:,:] + V_peak.T[:,:,None] * self.P_mat[2][None,None,:]
+
+
     def compute_endpoints(self, v_0, a_0, V_peak):
         """Compute trajectory endpoints given initial conditions and collection of V_peaks
         
@@ -109,6 +191,28 @@ class LPM:
         return P_endpoints
 
 
+    def reach_radius(self, v_0, a_0, v_peak_max):
+        """Bound the distance from the initial position reachable by any trajectory.
+
+        Parameters
+        ----------
+        v_0 : np.array
+            Initial velocity (n x 1)
+        a_0 : np.array
+            Initial acceleration (n x 1)
+        v_peak_max : float
+            Max norm of peak velocity
+
+        Returns
+        -------
+        float
+            Max distance of any trajectory position from the initial position
+            
+        """
+        P_abs = np.abs(self.P_mat)
+        return np.max(np.linalg.norm(v_0)*P_abs[0] + np.linalg.norm(a_0)*P_abs[1] + v_peak_max*P_abs[2])
+
+
     def solve_trajectory(self, v_0, a_0, p_goal):
         """Solve for the peak velocity which reaches a desired goal position.
 
@@ -126,14 +230,58 @@ class LPM:
         Returns
         -------
         np.array 
-            Peak velocity (1 x n row vector).
+            Peak velocity (n x 1 column vector).
             
         """
         # Change to column vectors
-        v_0 = np.reshape(v_0, (3,1))
-        a_0 = np.reshape(a_0, (3,1))
+        v_0 = np.reshape(v_0, (-1,1))
+        a_0 = np.reshape(a_0, (-1,1))
+        p_goal = np.reshape(p_goal, (-1,1))
         # Position component due to v_0 and a_0
-        p_from_ic = np.dot(np.hstack((v_0, a_0)), self.P_mat[0:2,-1])
+        p_from_ic = (np.hstack((v_0, a_0)) @ self.P_mat[0:2,-1])[:,None]
         # Solve for v_peak
         v_peak = (p_goal - p_from_ic) / self.P_mat[2,-1]
-        return v_peak
\ No newline at end of file
+        return v_peak
+
+
+    def compute_forbidden_regions(self, v_0, a_0, c_obs, r_obs):
+        """Compute the regions of peak velocity space which lead to collisions.
+
+        Positions are linear in v_peak, p_t = p_ic,t + P_mat[2,t] * v_peak, so each timestep 
+        and obstacle pair (c, r) forbids the ball of v_peaks ||v_peak - (c - p_ic,t) / P_mat[2,t]|| 
+        <= r / |P_mat[2,t]|. Positions are relative to the initial position.
+
+        Parameters
+        ----------
+        v_0 : np.array
+            Initial velocity (n x 1)
+        a_0 : np.array
+            Initial acceleration (n x 1)
+        c_obs : np.array
+            Obstacle centers relative to initial position (N_obs x n)
+        r_obs : np.array
+            Obstacle radii, including robot collision radius (N_obs)
+
+        Returns
+        -------
+        np.array or None
+            Forbidden ball centers (N_regions x n), or None if a position which does not 
+            depend on v_peak is in collision
+        np.array or None
+            Forbidden ball radii (N_regions)
+            
+        """
+        # Position component due to v_0 and a_0 (n x N)
+        p_from_ic = np.hstack((v_0, a_0)) @ self.P_mat[:2]
+        scale = self.P_mat[2]
+        fixed = np.abs(scale) < 1e-9
+        
+        # Timesteps with positions independent of v_peak (e.g. t = 0)
+        d_fixed = np.linalg.norm(p_from_ic[:,fixed].T[None,:,:] - c_obs[:,None,:], axis=2)
+        if np.any(d_fixed <= r_obs[:,None]):
+            return None, None
+
+        # Forbidden balls (N_obs x N_free) for remaining timesteps
+        centers = (c_obs[:,:,None] - p_from_ic[None,:,~fixed]) / scale[~fixed]
+        radii = r_obs[:,None] / np.abs(scale[~fixed])[None,:]
+        return centers.transpose((0,2,1)).reshape((-1,len(v_0))), radii.flatten()
\ No newline at end of file
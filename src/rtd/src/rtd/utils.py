@@ -48,15 +48,17 @@ class Trajectory:
         self.accelerations = accelerations
 
 
-def wrap_2D_traj_msg(traj, t2start):
-    """Wraps a 2-D trajectory in a JointTrajectory message.
+def wrap_traj_msg(traj, t2start, joint_names=('x','y','z')):
+    """Wraps an N-D trajectory in a JointTrajectory message (one point per workspace dimension).
 
     Parameters
     ----------
-    traj : tuple (p,v,a) of np.array (2 x N)
+    traj : tuple (p,v,a) of np.array (N_dim x N)
         Trajectory containing position, velocity, and acceleration
     t2start : float
         Time to start in seconds
+    joint_names : sequence of str
+        Names of workspace dimensions
 
     Returns
     -------
@@ -64,29 +66,18 @@ def wrap_2D_traj_msg(traj, t2start):
         Wrapped message.
 
     """
-    p,v,a = traj
+    # Rows of stacked (N_dim x 3 x N) array are the (p,v,a) of each dimension
+    pva = np.stack(traj, axis=1).tolist()
     traj_msg = JointTrajectory()
-
-    jtp_x = JointTrajectoryPoint()
-    jtp_x.positions = p[0]
-    jtp_x.velocities = v[0]
-    jtp_x.accelerations = a[0]
-    jtp_x.time_from_start = rospy.Duration(t2start)
-
-    jtp_y = JointTrajectoryPoint()
-    jtp_y.positions = p[1]
-    jtp_y.velocities = v[1]
-    jtp_y.accelerations = a[1]
-    jtp_y.time_from_start = rospy.Duration(t2start)
-
-    traj_msg.points = [jtp_x, jtp_y]
-    traj_msg.joint_names = ['x','y']
+    traj_msg.points = [JointTrajectoryPoint(positions=p, velocities=v, accelerations=a, 
+                                            time_from_start=rospy.Duration(t2start)) for p,v,a in pva]
+    traj_msg.joint_names = list(joint_names[:len(pva)])
 
     return traj_msg
 
 
-def unwrap_2D_traj_msg(msg, time):
-    """Convert JointTrajectory message to Trajectory class
+def unwrap_traj_msg(msg, time):
+    """Convert N-D JointTrajectory message to Trajectory class
 
     Parameters
     ----------
@@ -101,19 +92,12 @@ def unwrap_2D_traj_msg(msg, time):
         Trajectory wrapped in class
 
     """
-    px = msg.points[0].positions
-    py = msg.points[1].positions
-    vx = msg.points[0].velocities
-    vy = msg.points[1].velocities
-    ax = msg.points[0].accelerations
-    ay = msg.points[1].accelerations
-
-    pos = np.vstack((px, py))
-    vel = np.vstack((vx, vy))
-    acc = np.vstack((ax, ay))
-
-    return Trajectory(time, pos, vel, acc)
+    # (3 x N_dim x N) array of positions, velocities and accelerations
+    pva = np.array([[pt.positions for pt in msg.points], 
+                    [pt.velocities for pt in msg.points], 
+                    [pt.accelerations for pt in msg.points]])
 
+    return Trajectory(time, pva[0], pva[1], pva[2])
 
 
 def check_obs_collision(positions, obs, r_collision):
@@ -129,6 +113,10 @@ def check_obs_collision(positions, obs, r_collision):
         True if the plan is safe, False is there is a collision
     """
     c_obs, r_obs = obs
+    # Obstacle does not reach the bounding box of the positions
+    r = r_collision + r_obs
+    if np.any(c_obs + r < np.min(positions, axis=1)) or np.any(c_obs - r > np.max(positions, axis=1)):
+        return True
     d_vec = np.linalg.norm(positions - c_obs[:,None], axis=0)
     if any(d_vec <= r_collision + r_obs):
         return False
@@ -136,6 +124,161 @@ def check_obs_collision(positions, obs, r_collision):
         return True
 
 
+def stack_obstacles(obstacles, N_dim):
+    """Stack list of obstacles into arrays of centers and radii
+    Parameters
+    ----------
+    obstacles : list
+        List of obstacles (center, radius)
+    N_dim : int
+        Workspace dimension
+    Returns
+    -------
+    np.array (N_obs x n)
+        Obstacle centers
+    np.array (N_obs)
+        Obstacle radii
+    """
+    if len(obstacles) == 0:
+        return np.zeros((0,N_dim)), np.zeros(0)
+    c_obs = np.vstack([np.asarray(c, dtype=float).flatten() for c,_ in obstacles])
+    r_obs = np.array([r for _,r in obstacles], dtype=float)
+    return c_obs, r_obs
+
+
+def check_obs_collision_batch(positions, c_obs, r_obs, r_collision):
+    """Check a batch of position sequences against all obstacles for collision.
+    Distances from every position to every obstacle are computed in one broadcast.
+    Parameters
+    ----------
+    positions : np.array (N_samples x n x N)
+        Position sequences
+    c_obs : np.array (N_obs x n)
+        Obstacle centers
+    r_obs : np.array (N_obs)
+        Obstacle radii
+    r_collision : float
+        Collision radius
+    Returns
+    -------
+    np.array (N_samples)
+        True if the plan is safe, False if there is a collision
+    """
+    if len(r_obs) == 0:
+        return np.ones(positions.shape[0], dtype=bool)
+    # Squared distances (N_samples x N_obs x N)
+    d_sq = np.sum((positions[:,None,:,:] - c_obs[None,:,:,None])**2, axis=2)
+    return np.all(d_sq > ((r_collision + r_obs)**2)[None,:,None], axis=(1,2))
+
+
+def sphere_intersections(c_1, r_1, c_2, r_2, v):
+    """Points on the intersections of pairs of spheres nearest and farthest from a point.
+    In 2D these are the two intersection points of each pair of circles.
+    Parameters
+    ----------
+    c_1, c_2 : np.array (N_pairs x n)
+        Sphere centers
+    r_1, r_2 : np.array (N_pairs)
+        Sphere radii
+    v : np.array (n)
+        Point
+    Returns
+    -------
+    np.array (2*N_intersecting x n)
+        Intersection points
+    """
+    d_vec = c_2 - c_1
+    d = np.linalg.norm(d_vec, axis=1)
+    keep = (d > 0) & (d <= r_1 + r_2) & (d >= np.abs(r_1 - r_2))
+    d_vec, d, c_1, r_1, r_2 = d_vec[keep], d[keep], c_1[keep], r_1[keep], r_2[keep]
+    u = d_vec / d[:,None]
+    # Center and radius of intersection
+    a = (r_1**2 - r_2**2 + d**2) / (2*d)
+    h = np.sqrt(np.maximum(r_1**2 - a**2, 0))
+    m = c_1 + a[:,None] * u
+    # Direction from center of intersection towards v, within intersection plane
+    w = v - m
+    w = w - np.sum(w * u, axis=1)[:,None] * u
+    w_norm = np.linalg.norm(w, axis=1)
+    if len(v) == 2:
+        # v on line through centers, use perpendicular direction
+        perp = np.stack((-u[:,1], u[:,0]), axis=1)
+        w = np.where((w_norm > 0)[:,None], w / np.maximum(w_norm, 1e-12)[:,None], perp)
+    else:
+        w = w[w_norm > 0] / w_norm[w_norm > 0][:,None]
+        m, h = m[w_norm > 0], h[w_norm > 0]
+    return np.vstack((m + h[:,None] * w, m - h[:,None] * w))
+
+
+def solve_free_v_peak(v_goal, c_forbid, r_forbid, c_feas, r_feas, bounds, eps=1e-6):
+    """Solve for the peak velocity nearest to the goal-reaching one which avoids all forbidden regions.
+    The nearest point of the free space (outside all forbidden balls, inside all feasible balls
+    and bounds) is either v_goal itself, the projection of v_goal onto a ball boundary, or on the
+    intersection of two ball boundaries. These candidates are generated in one pass and checked
+    in order of distance to v_goal. In 2D this is exact; in 3D, points on intersections of three
+    spheres are not generated, so the solution may be suboptimal or not found.
+    Parameters
+    ----------
+    v_goal : np.array (n)
+        Peak velocity which reaches the goal
+    c_forbid : np.array (N_forbid x n)
+        Forbidden ball centers
+    r_forbid : np.array (N_forbid)
+        Forbidden ball radii
+    c_feas : np.array (N_feas x n)
+        Feasible ball centers (v_peak must be inside all of them)
+    r_feas : np.array (N_feas)
+        Feasible ball radii
+    bounds : list
+        List of min and max values for each dimension.
+    eps : float
+        Margin from forbidden and feasible ball boundaries
+    Returns
+    -------
+    np.array (n) or None
+        Peak velocity, or None if no free peak velocity was found
+    """
+    # Drop forbidden balls outside a feasible ball or inside another forbidden ball
+    keep = np.all(np.linalg.norm(c_forbid[:,None,:] - c_feas[None,:,:], axis=2) < r_forbid[:,None] + r_feas[None,:], axis=1)
+    c_forbid, r_forbid = c_forbid[keep], r_forbid[keep]
+    d_forbid = np.linalg.norm(c_forbid[:,None,:] - c_forbid[None,:,:], axis=2)
+    margin = r_forbid[None,:] - r_forbid[:,None] - d_forbid
+    idx = np.arange(len(r_forbid))
+    contained = (margin > 0) | ((margin == 0) & (idx[:,None] > idx[None,:]))  # of identical balls, keep the first
+    c_forbid, r_forbid = c_forbid[~np.any(contained, axis=1)], r_forbid[~np.any(contained, axis=1)]
+
+    # Ball boundaries, slightly shifted into the free space
+    c = np.vstack((c_forbid, c_feas))
+    r = np.hstack((r_forbid + eps, r_feas - eps))
+
+    # Projections of v_goal onto boundaries
+    d_vec = v_goal - c
+    d = np.linalg.norm(d_vec, axis=1)
+    proj = c + (r / np.maximum(d, 1e-12))[:,None] * d_vec
+
+    # Pairwise boundary intersections
+    i, j = np.triu_indices(len(r), k=1)
+    inter = sphere_intersections(c[i], r[i], c[j], r[j], v_goal)
+
+    cands = np.vstack((v_goal[None,:], proj, inter))
+
+    # Feasibility constraints are cheap to check for all candidates
+    bounds = np.reshape(bounds, (-1,2))
+    feas = np.all(np.sum((cands[:,None,:] - c_feas[None,:,:])**2, axis=2) <= r_feas**2, axis=1)
+    feas &= np.all((cands >= bounds[:,0]) & (cands <= bounds[:,1]), axis=1)
+    cands = cands[feas]
+    cands = cands[np.argsort(np.linalg.norm(cands - v_goal, axis=1))]
+
+    # Check candidates against forbidden balls in order of distance
+    chunk = 256
+    for k in range(0, len(cands), chunk):
+        V = cands[k:k+chunk]
+        valid = np.all(np.sum((V[:,None,:] - c_forbid[None,:,:])**2, axis=2) > r_forbid**2, axis=1)
+        if np.any(valid):
+            return V[np.argmax(valid)]
+    return None
+
+
 def rand_in_bounds(bounds, n):
     """Generate random samples within specified bounds
     Parameters
@@ -0,0 +1,39 @@
+"""Equivalence tests of the analytic free peak velocity solver against brute-force sampling"""
+
+import numpy as np
+
+import rtd.utils as utils
+
+
+def test_solve_free_v_peak_matches_sampling():
+    """2D solution is free and at least as close to the goal peak velocity as any free sample"""
+    rng = np.random.default_rng(0)
+    bounds = np.array([-2.0, 2.0, -2.0, 2.0])
+
+    # Dense grid of peak velocity samples within bounds
+    x, y = np.meshgrid(np.linspace(-2, 2, 401), np.linspace(-2, 2, 401))
+    V = np.column_stack((x.flatten(), y.flatten()))
+
+    for trial in range(50):
+        v_0 = rng.uniform(-1, 1, 2)
+        v_goal = rng.uniform(-2, 2, 2)
+        n_forbid = rng.integers(1, 8)
+        c_forbid = v_goal + rng.normal(scale=0.8, size=(n_forbid,2))
+        r_forbid = rng.uniform(0.1, 0.8, n_forbid)
+        c_feas = np.vstack((np.zeros(2), v_0))
+        r_feas = np.array([2.0, 3.0])
+
+        v_peak = utils.solve_free_v_peak(v_goal, c_forbid, r_forbid, c_feas, r_feas, bounds)
+
+        free = np.all(np.sum((V[:,None,:] - c_forbid[None,:,:])**2, axis=2) > r_forbid**2, axis=1)
+        free &= np.all(np.sum((V[:,None,:] - c_feas[None,:,:])**2, axis=2) <= r_feas**2, axis=1)
+        if not np.any(free):
+            assert v_peak is None
+            continue
+        d_best = np.min(np.linalg.norm(V[free] - v_goal, axis=1))
+
+        assert v_peak is not None
+        assert np.all(np.sum((v_peak - c_forbid)**2, axis=1) > r_forbid**2)
+        assert np.all(np.sum((v_peak - c_feas)**2, axis=1) <= r_feas**2)
+        assert np.all((v_peak >= bounds[0::2]) & (v_peak <= bounds[1::2]))
+        assert np.linalg.norm(v_peak - v_goal) <= d_best + 1e-6
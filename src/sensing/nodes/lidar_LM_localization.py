@@ -3,16 +3,17 @@
 from operator import ge
 import rospy
 import numpy as np
-import ros_numpy
+import threading
 
 from scipy.spatial.transform import Rotation as R
-from geometry_msgs.msg import Point
-from std_msgs.msg import Float64
+from geometry_msgs.msg import PointStamped
+from std_msgs.msg import Float64, Float64MultiArray, MultiArrayDimension
 from sensor_msgs.msg import PointCloud2, PointCloud
 
 from planner.msg import State
 import params.params as params
-from sensing.lidar_utils import detect_landmark, get_pos_measurement, rotate_points
+from sensing.lidar_utils import detect_landmark_pointcloud2, get_pos_measurement, rotate_points, LandmarkMap
+from sensing.mailbox import Mailbox
 from controller.controller_utils import wrap_angle
 
 
@@ -28,14 +29,23 @@ class LidarLMLocalization():
         # Class variables
         self.x_hat = None
         self.heading = None
-        self.pos_measurement = None
+        self.measurement = None  # latest unpublished (position measurement, source cloud time, processing latency, stacked landmark measurement)
+        self.n_stale = 0  # number of point clouds skipped for being too old
 
         # Relative vector from robot to landmark in robot local frame
         # Initialize using robot initial state and landmark position
         self.landmark_relative_vec = rotate_points((params.LANDMARK_POS - params.X_0[:2].flatten())[None,:], params.X_0[2][0]).flatten()
 
+        # Landmark map for multi-landmark localization
+        self.landmark_map = None
+        if params.LANDMARK_MAP_FILE is not None:
+            self.landmark_map = LandmarkMap.load(params.LANDMARK_MAP_FILE)
+            rospy.loginfo("Loaded landmark map with %d landmarks", len(self.landmark_map))
+
         # Publishers
-        self.pos_measurement_pub = rospy.Publisher('sensing/lidar/pos_measurement', Point, queue_size=10)
+        self.pos_measurement_pub = rospy.Publisher('sensing/lidar/pos_measurement', PointStamped, queue_size=10)
+        self.latency_pub = rospy.Publisher('sensing/lidar/latency', Float64, queue_size=10)
+        self.landmark_measurements_pub = rospy.Publisher('sensing/lidar/landmark_measurements', Float64MultiArray, queue_size=10)
         ### For debugging
         self.pc_pub = rospy.Publisher('sensing/debug/pc', PointCloud, queue_size=10)
 
@@ -48,6 +58,11 @@ class LidarLMLocalization():
         self.path = '/home/navlab-nuc/Rover/lidar_data/5_15_2022/fr_config_5'
         self.frame_num = 0
 
+        # Latest point cloud is processed on a worker thread
+        self.mailbox = Mailbox()
+        self.worker_thread = threading.Thread(target=self.processing_loop, daemon=True)
+        self.worker_thread.start()
+
 
     def imu_callback(self, data):
         """IMU callback
@@ -77,37 +92,94 @@ class LidarLMLocalization():
     def pointcloud_callback(self, data):
         """Point cloud subscriber callback
 
-        Receive point cloud data, detect the landmark, and use it to localize.
+        Hand point cloud to the worker thread, replacing any unprocessed one.
 
         """
-        P = ros_numpy.point_cloud2.pointcloud2_to_xyz_array(data)
+        self.mailbox.put(data)
+
+
+    def processing_loop(self):
+        """Worker thread loop
+
+        Process the latest point cloud: detect the landmark (or all landmarks in view if a 
+        landmark map is given) and use it to localize. Point clouds older than 
+        params.LIDAR_MAX_FRAME_AGE are skipped.
 
-        if self.x_hat is not None:
-            self.landmark_relative_vec = detect_landmark(P, self.landmark_relative_vec)
-            self.pos_measurement = get_pos_measurement(self.landmark_relative_vec, self.x_hat)
-        else:
-            print("Waiting for initial state estimate")
+        """
+        while not rospy.is_shutdown():
+            data = self.mailbox.get(timeout=0.1)
+            if data is None:
+                continue
+
+            stamp = data.header.stamp.to_sec()
+            if rospy.get_time() - stamp > params.LIDAR_MAX_FRAME_AGE:
+                self.n_stale += 1
+                continue
+
+            if self.x_hat is not None and self.landmark_map is not None:
+                # Search windows of all landmarks in view are extracted in one pass
+                z, idx, n_pts = self.landmark_map.measure(data, self.x_hat, params.LANDMARK_VIEW_RANGE)
+                if len(idx) == 0:
+                    print("No landmarks detected")
+                    continue
+                # Stacked measurement is published as is, along with its fusion weighted by 
+                # number of landmark points for consumers of a single position measurement
+                pos_measurement = np.average(z.reshape((-1,2)), axis=0, weights=n_pts)
+                self.measurement = (pos_measurement, stamp, rospy.get_time() - stamp, (z, idx, n_pts))
+            elif self.x_hat is not None:
+                # Only the landmark search region is copied out of the message
+                landmark_relative_vec = detect_landmark_pointcloud2(data, self.landmark_relative_vec)
+                if landmark_relative_vec is None:
+                    # Keep previous relative vector as search region for the next point cloud
+                    print("No landmark points detected")
+                    continue
+                self.landmark_relative_vec = landmark_relative_vec
+                pos_measurement = get_pos_measurement(self.landmark_relative_vec, self.x_hat)
+                self.measurement = (pos_measurement, stamp, rospy.get_time() - stamp, None)
+            else:
+                print("Waiting for initial state estimate")
 
     
     def publish_measurement(self):
         """Publish position measurement
         
+        Stamped with the time of the point cloud it was computed from, and the 
+        processing latency is published separately. Each measurement is only published 
+        once, so nothing is published for point clouds without landmark points.
+
+        With a landmark map, the stacked measurement is also published as an array with
+        one row (landmark index, x, y, number of points) per detected landmark.
+
         """
-        p = Point()
-        p.x = self.pos_measurement[0]
-        p.y = self.pos_measurement[1]
+        pos_measurement, stamp, latency, landmark_measurements = self.measurement
+        self.measurement = None
+        if landmark_measurements is not None:
+            z, idx, n_pts = landmark_measurements
+            msg = Float64MultiArray()
+            msg.layout.dim = [MultiArrayDimension(label='landmarks', size=len(idx), stride=4*len(idx)),
+                              MultiArrayDimension(label='idx,x,y,n_pts', size=4, stride=4)]
+            msg.data = np.column_stack((idx, z.reshape((-1,2)), n_pts)).flatten().tolist()
+            self.landmark_measurements_pub.publish(msg)
+        p = PointStamped()
+        p.header.stamp = rospy.Time.from_sec(stamp)
+        p.point.x = pos_measurement[0]
+        p.point.y = pos_measurement[1]
         self.pos_measurement_pub.publish(p)
-        print(f'Published position measurement: ({p.x}, {p.y})')
+        self.latency_pub.publish(latency)
+        print(f'Published position measurement: ({p.point.x}, {p.point.y}), latency: {latency:.3f} s')
 
 
     def run(self):
         rospy.loginfo("Running Lidar localization node")
         while not rospy.is_shutdown():
             
-            if self.pos_measurement is not None:
+            if self.measurement is not None:
                 self.publish_measurement()
 
             self.rate.sleep()
+
+        rospy.loginfo("Point clouds received: %d, overwritten before processing: %d, stale: %d", 
+                      self.mailbox.n_put, self.mailbox.n_overwritten, self.n_stale)
         
         # spin() simply keeps python from exiting until this node is stopped
         rospy.spin()
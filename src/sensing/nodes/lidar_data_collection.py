@@ -8,6 +8,9 @@ import ros_numpy
 from sensor_msgs.msg import PointCloud2
 from geometry_msgs.msg import PoseStamped
 
+from sensing.pc_recorder import PointCloudRecorder
+import params.params as params
+
 
 class LidarDC():
     """Collect LiDAR point cloud measurements
@@ -27,6 +30,13 @@ class LidarDC():
         self.path = '/home/navlab-nuc/Rover/lidar_data/9_19_2022/flightroom/run_3'
         self.frame_num = 0
 
+        # Chunked recording (written on background thread), otherwise one .npy file per point cloud and pose
+        if params.PC_RECORD_CHUNKED:
+            self.recorder = PointCloudRecorder(os.path.join(self.path, 'chunks'), params.PC_RECORD_CHUNK_FRAMES, 
+                params.PC_RECORD_ENCODING, params.PC_RECORD_QUANT_RES, params.PC_RECORD_QUEUE_LEN, params.PC_RECORD_INDEX_PERIOD)
+        else:
+            self.recorder = None
+
 
     def vrpn_callback(self, data):
         """Mocap subscriber callback
@@ -50,6 +60,13 @@ class LidarDC():
         """
         P = ros_numpy.point_cloud2.pointcloud2_to_xyz_array(data)
 
+        # Queue point cloud and pose for chunked recording
+        if self.recorder is not None:
+            if not self.recorder.record(P, self.pose, data.header.stamp.to_sec()):
+                print("Dropped point cloud ", self.frame_num)
+            self.frame_num += 1
+            return
+
         # Save points as .npy
         filename = 'pc_'+str(self.frame_num)+'.npy'
         np.save(os.path.join(self.path, 'pcs', filename), P)
@@ -66,6 +83,10 @@ class LidarDC():
         while not rospy.is_shutdown():
 
             self.rate.sleep()
+
+        if self.recorder is not None:
+            self.recorder.close()
+            rospy.loginfo("Recorded %d point clouds (%d dropped)", self.recorder.n_frames, self.recorder.n_dropped)
         
         # spin() simply keeps python from exiting until this node is stopped
         rospy.spin()
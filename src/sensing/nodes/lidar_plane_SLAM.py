@@ -3,7 +3,6 @@
 from operator import ge
 import rospy
 import numpy as np
-import ros_numpy
 import time
 
 from scipy.spatial.transform import Rotation as R
@@ -13,7 +12,7 @@ from sensor_msgs.msg import PointCloud2, PointCloud
 
 from planner.msg import State
 import params.params as params
-from sensing.lidar_utils import detect_landmark, get_pos_measurement, rotate_points
+from sensing.lidar_utils import pointcloud2_roi_points, get_pos_measurement, rotate_points
 from controller.controller_utils import wrap_angle
 
 from planeslam.scan import pc_to_scan
@@ -65,7 +64,7 @@ class LidarPlaneSLAM():
         Receive point cloud data, detect the landmark, and use it to localize.
 
         """
-        P = ros_numpy.point_cloud2.pointcloud2_to_xyz_array(data)
+        P = pointcloud2_roi_points(data)
         start_time = time.time()
         scan = pc_to_scan(P)
         print(time.time() - start_time)
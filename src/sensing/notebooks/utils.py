@@ -2,9 +2,15 @@
 
 """
 
+import os
+import sys
 import numpy as np
 import open3d as o3d
 
+# sensing package source (for use without a sourced catkin workspace)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+from sensing.clustering import cluster_table
+
 
 def dist_filter(P, threshold):
     """Filter points by distance
@@ -120,9 +126,15 @@ def extract_landmarks(P, d_thresh=6.0, lidar_height=0.15, dbscan_eps=0.2, dbscan
         Distance threshold for filtering
     lidar_height : float (meters)
         LiDAR height (for ground plane removal)
+    dbscan_eps : float (meters)
+        DBSCAN neighborhood radius
+    dbscan_minpts : int
+        DBSCAN minimum number of points in neighborhood
 
     Returns
     -------
+    np.array (n_clusters) of sensing.clustering.CLUSTER_DTYPE
+        Cluster table (label, number of points, centroid, extent)
     
     """
     # Distance filter
@@ -133,10 +145,7 @@ def extract_landmarks(P, d_thresh=6.0, lidar_height=0.15, dbscan_eps=0.2, dbscan
     pcd = o3d.geometry.PointCloud()
     pcd.points = o3d.utility.Vector3dVector(P_filter)
     labels = np.array(pcd.cluster_dbscan(eps=dbscan_eps, min_points=dbscan_minpts))
-    clusters = [[] for _ in range(labels.max()+1)]  # TODO: faster way to do this?
-    for i in range(len(labels)):
-        if labels[i] >= 0:
-            clusters[labels[i]].append(i)
+    return cluster_table(P_filter, labels)
 
 
 def spherical_project(P):
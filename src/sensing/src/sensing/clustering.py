@@ -0,0 +1,74 @@
+"""Point cloud cluster utils
+
+Grouping of clustered points (e.g. DBSCAN labels) into a cluster table. Only depends
+on NumPy, so it can be used in the notebooks without ROS.
+
+"""
+
+import numpy as np
+
+
+# Cluster table row: label, number of points, centroid, and axis-aligned extent (max - min)
+CLUSTER_DTYPE = np.dtype([('label', np.int64), ('n_pts', np.int64),
+                          ('centroid', np.float64, (3,)), ('extent', np.float64, (3,))])
+
+
+def group_labels(labels):
+    """Group point indices by cluster label
+
+    Parameters
+    ----------
+    labels : np.array (n_pts)
+        Cluster label of each point (negative for noise)
+
+    Returns
+    -------
+    order : np.array (n_clustered)
+        Indices of clustered points, sorted by label
+    cluster_labels : np.array (n_clusters)
+        Label of each cluster (ascending)
+    starts : np.array (n_clusters)
+        Start of each cluster in order
+    counts : np.array (n_clusters)
+        Number of points of each cluster
+
+    """
+    labels = np.asarray(labels)
+    clustered = np.flatnonzero(labels >= 0)
+    order = clustered[np.argsort(labels[clustered], kind='stable')]
+    counts = np.bincount(labels[order]) if len(order) > 0 else np.zeros(0, dtype=int)
+    cluster_labels = np.flatnonzero(counts)
+    counts = counts[cluster_labels]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(int)
+    return order, cluster_labels, starts, counts
+
+
+def cluster_table(P, labels, min_pts=1):
+    """Compute cluster table (centroids, extents and point counts) from clustered points
+
+    Parameters
+    ----------
+    P : np.array (n_pts x 3)
+        3D point cloud
+    labels : np.array (n_pts)
+        Cluster label of each point (negative for noise)
+    min_pts : int
+        Minimum number of points of a cluster to keep
+
+    Returns
+    -------
+    np.array (n_clusters) of CLUSTER_DTYPE
+        Cluster table, sorted by label
+
+    """
+    order, cluster_labels, starts, counts = group_labels(labels)
+    table = np.zeros(len(cluster_labels), dtype=CLUSTER_DTYPE)
+    if len(cluster_labels) == 0:
+        return table
+
+    P_sorted = np.asarray(P, dtype=float)[order]
+    table['label'] = cluster_labels
+    table['n_pts'] = counts
+    table['centroid'] = np.add.reduceat(P_sorted, starts, axis=0) / counts[:,None]
+    table['extent'] = np.maximum.reduceat(P_sorted, starts, axis=0) - np.minimum.reduceat(P_sorted, starts, axis=0)
+    return table[counts >= min_pts]
@@ -3,6 +3,7 @@
 """
 
 import numpy as np
+from scipy.spatial import cKDTree
 
 import params.params as params
 
@@ -26,6 +27,81 @@ def dist_filter(P, threshold):
     return P[keep_idx,:] 
 
 
+# sensor_msgs/PointField datatypes
+POINTFIELD_DTYPES = {1: np.int8, 2: np.uint8, 3: np.int16, 4: np.uint16,
+                     5: np.int32, 6: np.uint32, 7: np.float32, 8: np.float64}
+
+
+def pointcloud2_view(msg):
+    """View PointCloud2 message buffer as a structured array without copying
+
+    Parameters
+    ----------
+    msg : sensor_msgs.msg.PointCloud2
+        Point cloud message
+
+    Returns
+    -------
+    np.array (height x width)
+        Structured array with one field per point field, sharing memory with msg.data
+    
+    """
+    endian = '>' if msg.is_bigendian else '<'
+    dtype = np.dtype({'names': [f.name for f in msg.fields],
+                      'formats': [(np.dtype(POINTFIELD_DTYPES[f.datatype]).newbyteorder(endian), (f.count,)) if f.count > 1 
+                                  else np.dtype(POINTFIELD_DTYPES[f.datatype]).newbyteorder(endian) for f in msg.fields],
+                      'offsets': [f.offset for f in msg.fields],
+                      'itemsize': msg.point_step})
+    return np.ndarray(shape=(msg.height, msg.width), dtype=dtype, buffer=msg.data, 
+                      strides=(msg.row_step, msg.point_step))
+
+
+def pointcloud2_roi_points(msg, box=None, max_range=np.inf, min_z=-np.inf):
+    """Extract xyz points within region of interest from PointCloud2 message
+
+    The message buffer is only viewed, and the region of interest is applied as one mask 
+    before copying: the (x,y) box is tested on all points first, and the range and height 
+    limits are then only tested on the points inside the box. Only the surviving points are 
+    copied. Invalid (NaN) points are always removed.
+
+    Parameters
+    ----------
+    msg : sensor_msgs.msg.PointCloud2
+        Point cloud message
+    box : tuple (xmin, xmax, ymin, ymax) or None
+        Axis-aligned (x,y) box in sensor frame (no box if None)
+    max_range : float
+        Keep points closer than max_range
+    min_z : float
+        Keep points above min_z
+
+    Returns
+    -------
+    np.array (n_pts x 3)
+        Points in region of interest
+    
+    """
+    pc = pointcloud2_view(msg).ravel() if msg.row_step == msg.width*msg.point_step else pointcloud2_view(msg)
+    x = pc['x']; y = pc['y']; z = pc['z']
+
+    # (x,y) box on all points (comparisons with NaN are False)
+    if box is not None:
+        mask = x >= box[0]
+        mask &= x <= box[1]
+        mask &= y >= box[2]
+        mask &= y <= box[3]
+    else:
+        mask = np.isfinite(x)
+        mask &= np.isfinite(y)
+    idx = np.nonzero(mask)
+    xs = x[idx]; ys = y[idx]; zs = z[idx]
+
+    # Range and height limits on points inside the box
+    keep = zs > min_z
+    keep &= xs*xs + ys*ys + zs*zs < max_range*max_range
+    return np.stack((xs[keep], ys[keep], zs[keep]), axis=1)
+
+
 def rotate_points(P, theta):
     """Rotate 2D points by theta
 
@@ -166,6 +242,40 @@ def detect_landmark(P, prev_vec, d_thresh=10.0):
     return np.mean(landmark_pts, axis=0)
 
 
+def landmark_search_box(prev_vec):
+    """Landmark search region (xmin, xmax, ymin, ymax) around previous robot to landmark vector"""
+    return (prev_vec[0] - params.LM_BOX_W / 2, prev_vec[0] + params.LM_BOX_W / 2,
+            prev_vec[1] - params.LM_BOX_W / 2, prev_vec[1] + params.LM_BOX_W / 2)
+
+
+def detect_landmark_pointcloud2(msg, prev_vec, d_thresh=10.0):
+    """Detect landmark directly from PointCloud2 message
+
+    Same as detect_landmark, but only the points in the landmark search region (within
+    distance threshold and above the ground) are copied out of the message.
+    
+    Parameters
+    ----------
+    msg : sensor_msgs.msg.PointCloud2
+        Point cloud message
+    prev_vec : np.array (2 x 1)
+        Previous robot to landmark relative vector
+    
+    Returns
+    -------
+    np.array (2) or None
+        Estimated 2D landmark position in local frame (None if there are no points in the
+        landmark search region)
+    
+    """
+    landmark_pts = pointcloud2_roi_points(msg, landmark_search_box(prev_vec), d_thresh, -params.LIDAR_HEIGHT)
+
+    if len(landmark_pts) == 0:
+        return None
+
+    return np.mean(landmark_pts[:,:2], axis=0)
+
+
 def get_pos_measurement(robot_to_landmark_local, x_hat):
     """Get position measurement
     
@@ -177,3 +287,131 @@ def get_pos_measurement(robot_to_landmark_local, x_hat):
     robot_to_landmark_global = rotate_points(robot_to_landmark_local, x_hat[2][0])
     lidar_offset_global = rotate_points(params.LIDAR_OFFSET, x_hat[2][0])
     return params.LANDMARK_POS - robot_to_landmark_global - lidar_offset_global
+
+
+class LandmarkMap:
+    """Map of landmark positions for multi-landmark localization
+
+    Landmarks predicted to be in view are found with a KD-tree over the landmark 
+    positions, and the search windows of all of them are extracted from the point 
+    cloud in one pass.
+
+    Attributes
+    ----------
+    positions : np.array (n_landmarks x 2)
+        Landmark positions in global frame [m]
+    tree : cKDTree
+        KD-tree over landmark positions
+    
+    """
+    def __init__(self, positions):
+        self.positions = np.asarray(positions, dtype=float).reshape((-1,2))
+        self.tree = cKDTree(self.positions)
+
+
+    @classmethod
+    def load(cls, filename):
+        """Load landmark map from .npy file of landmark positions (n_landmarks x 2)"""
+        return cls(np.load(filename))
+
+
+    def __len__(self):
+        return len(self.positions)
+
+
+    def landmarks_in_view(self, x_hat, view_range):
+        """Indices of landmarks within view range of state estimate"""
+        return np.array(sorted(self.tree.query_ball_point(x_hat[:2,0], view_range)), dtype=int)
+
+
+    def predicted_relative_vecs(self, idx, x_hat):
+        """Predicted robot to landmark vectors in robot local frame (inverse of get_pos_measurements)
+
+        Returns
+        -------
+        np.array (n x 2)
+        
+        """
+        return rotate_points(self.positions[idx] - x_hat[:2,0], -x_hat[2][0]) - params.LIDAR_OFFSET
+
+
+    def detect_landmarks_pointcloud2(self, msg, idx, x_hat, d_thresh=10.0):
+        """Detect landmarks in search windows around their predicted positions
+
+        Only points inside the bounding box of all search windows (within distance threshold
+        and above the ground) are copied out of the message, and they are assigned to the 
+        windows with one broadcast comparison.
+
+        Parameters
+        ----------
+        msg : sensor_msgs.msg.PointCloud2
+            Point cloud message
+        idx : np.array (n)
+            Indices of landmarks to detect
+        x_hat : np.array (4 x 1)
+            State estimate (x, y, theta, v)
+
+        Returns
+        -------
+        rel_vecs : np.array (n x 2)
+            Estimated robot to landmark vectors in local frame (NaN if not detected)
+        n_pts : np.array (n)
+            Number of points in each search window
+        
+        """
+        centers = self.predicted_relative_vecs(idx, x_hat)
+        w = params.LM_BOX_W / 2
+        box = (np.min(centers[:,0]) - w, np.max(centers[:,0]) + w, 
+               np.min(centers[:,1]) - w, np.max(centers[:,1]) + w)
+        P_2D = pointcloud2_roi_points(msg, box, d_thresh, -params.LIDAR_HEIGHT)[:,:2]
+
+        # Assign points to search windows (n_pts x n)
+        in_window = np.all(np.abs(P_2D[:,None,:] - centers[None,:,:]) <= w, axis=2)
+        n_pts = np.sum(in_window, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rel_vecs = (in_window.T @ P_2D) / n_pts[:,None]
+        return rel_vecs, n_pts
+
+
+    def get_pos_measurements(self, idx, rel_vecs, x_hat):
+        """Position measurements from robot to landmark vectors (vectorized get_pos_measurement)
+
+        Returns
+        -------
+        np.array (n x 2)
+            Position measurement from each landmark
+        
+        """
+        robot_to_landmark_global = rotate_points(rel_vecs + params.LIDAR_OFFSET, x_hat[2][0])
+        return self.positions[idx] - robot_to_landmark_global
+
+
+    def measure(self, msg, x_hat, view_range, d_thresh=10.0):
+        """Stacked position measurement from all detected landmarks in view
+
+        Parameters
+        ----------
+        msg : sensor_msgs.msg.PointCloud2
+            Point cloud message
+        x_hat : np.array (4 x 1)
+            State estimate (x, y, theta, v)
+        view_range : float
+            Range for selecting landmarks in view [m]
+
+        Returns
+        -------
+        z : np.array (2n)
+            Stacked position measurements (x_1, y_1, ..., x_n, y_n)
+        idx : np.array (n)
+            Indices of detected landmarks
+        n_pts : np.array (n)
+            Number of points of each detected landmark
+        
+        """
+        idx = self.landmarks_in_view(x_hat, min(view_range, d_thresh))
+        if len(idx) == 0:
+            return np.zeros(0), idx, np.zeros(0, dtype=int)
+        rel_vecs, n_pts = self.detect_landmarks_pointcloud2(msg, idx, x_hat, d_thresh)
+        detected = n_pts > 0
+        z = self.get_pos_measurements(idx[detected], rel_vecs[detected], x_hat)
+        return z.flatten(), idx[detected], n_pts[detected]
@@ -0,0 +1,46 @@
+"""Single-slot mailbox
+
+"""
+
+import threading
+
+
+class Mailbox:
+    """Single-slot mailbox holding only the latest item
+
+    Putting an item replaces any item which has not been taken yet, so a slow consumer
+    always gets the newest item instead of working through a backlog.
+
+    Attributes
+    ----------
+    n_put : int
+        Number of items put.
+    n_overwritten : int
+        Number of items replaced before being taken.
+
+    """
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.item = None
+        self.n_put = 0
+        self.n_overwritten = 0
+
+
+    def put(self, item):
+        """Put item, replacing the current one"""
+        with self.cond:
+            if self.item is not None:
+                self.n_overwritten += 1
+            self.item = item
+            self.n_put += 1
+            self.cond.notify()
+
+
+    def get(self, timeout=None):
+        """Take latest item, waiting up to timeout [s] (returns None if there is none)"""
+        with self.cond:
+            if self.item is None:
+                self.cond.wait(timeout)
+            item = self.item
+            self.item = None
+            return item
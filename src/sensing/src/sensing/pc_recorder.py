@@ -0,0 +1,223 @@
+"""Point cloud recording
+
+Chunked point cloud recorder with a background writer thread, and a matching
+memory-mapped reader. Only depends on NumPy, so recorded runs can be opened
+in the notebooks without ROS.
+
+Run folder layout:
+    chunk_<k>.bin : encoded points of consecutive frames, appended as (n_pts x 3) arrays
+    index.npz     : per-frame chunk, offset and number of points, stamps and poses,
+                    and the point encoding (dtype, quantization resolution). Saved
+                    periodically while recording, so a run which is not closed (e.g.
+                    after a crash) can still be read up to the last saved frame.
+
+"""
+
+import os
+import queue
+import threading
+import numpy as np
+
+
+ENCODINGS = {'float32': np.float32, 'float16': np.float16, 'int16': np.int16}
+
+
+def encode_points(P, encoding, quant_res):
+    """Encode points for recording (int16 is quantized with resolution quant_res)"""
+    if encoding == 'int16':
+        lim = np.iinfo(np.int16).max
+        return np.clip(np.round(P / quant_res), -lim, lim).astype(np.int16)
+    return P.astype(ENCODINGS[encoding])
+
+
+def decode_points(P_enc, encoding, quant_res):
+    """Decode recorded points to float32"""
+    if encoding == 'int16':
+        return P_enc.astype(np.float32) * np.float32(quant_res)
+    return P_enc.astype(np.float32)
+
+
+class PointCloudRecorder:
+    """Chunked point cloud recorder
+
+    Frames are put on a bounded queue and written by a background thread, so recording
+    never blocks the subscriber callback on disk I/O. If the queue is full, the frame is
+    dropped and counted.
+
+    Attributes
+    ----------
+    path : str
+        Run folder.
+    chunk_frames : int
+        Number of frames per chunk file.
+    index_period : int
+        Number of frames between index saves (the index is also saved on chunk rollover
+        and close).
+    encoding : str
+        Point encoding ('float32', 'float16' or 'int16' quantized).
+    quant_res : float
+        Quantization resolution [m] for 'int16' encoding.
+    n_frames : int
+        Number of frames written.
+    n_dropped : int
+        Number of frames dropped because the queue was full.
+
+    """
+    def __init__(self, path, chunk_frames, encoding='float32', quant_res=0.005, queue_len=50, index_period=50):
+        if encoding not in ENCODINGS:
+            raise ValueError("Unknown point encoding: " + encoding)
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.chunk_frames = chunk_frames
+        self.index_period = index_period
+        self.encoding = encoding
+        self.quant_res = quant_res
+
+        self.n_frames = 0
+        self.n_dropped = 0
+        self.chunk = []; self.offset = []; self.n_pts = []
+        self.stamps = []; self.poses = []
+
+        self.chunk_file = None
+        self.chunk_idx = -1
+        self.chunk_offset = 0
+
+        self.queue = queue.Queue(maxsize=queue_len)
+        self.writer_thread = threading.Thread(target=self.writer_loop, daemon=True)
+        self.writer_thread.start()
+
+
+    def record(self, P, pose, stamp):
+        """Queue a frame for writing
+
+        Parameters
+        ----------
+        P : np.array (n_pts x 3)
+            Point cloud.
+        pose : np.array (7) or None
+            Pose (x, y, z, qx, qy, qz, qw) at time of frame.
+        stamp : float
+            Frame time [s].
+
+        Returns
+        -------
+        bool
+            False if the frame was dropped.
+
+        """
+        try:
+            self.queue.put_nowait((P, pose, stamp))
+            return True
+        except queue.Full:
+            self.n_dropped += 1
+            return False
+
+
+    def writer_loop(self):
+        """Writer thread loop"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            self.write_frame(*item)
+
+
+    def write_frame(self, P, pose, stamp):
+        """Append frame to current chunk file"""
+        # Start new chunk
+        if self.n_frames % self.chunk_frames == 0:
+            if self.chunk_file is not None:
+                self.chunk_file.close()
+                self.save_index()
+            self.chunk_idx += 1
+            self.chunk_offset = 0
+            self.chunk_file = open(os.path.join(self.path, 'chunk_'+str(self.chunk_idx)+'.bin'), 'wb')
+
+        P_enc = encode_points(np.asarray(P).reshape((-1,3)), self.encoding, self.quant_res)
+        self.chunk_file.write(P_enc.tobytes())
+
+        self.chunk.append(self.chunk_idx)
+        self.offset.append(self.chunk_offset)
+        self.n_pts.append(len(P_enc))
+        self.stamps.append(stamp)
+        self.poses.append(np.full(7, np.nan) if pose is None else pose)
+        self.chunk_offset += len(P_enc)
+        self.n_frames += 1
+
+        if self.n_frames % self.index_period == 0:
+            self.chunk_file.flush()
+            self.save_index()
+
+
+    def save_index(self):
+        """Save frame index of recorded chunks
+
+        The index is written to a temporary file which then replaces the previous index,
+        so the index on disk is always complete.
+
+        """
+        filename = os.path.join(self.path, 'index.npz')
+        with open(filename + '.tmp', 'wb') as f:
+            np.savez(f, chunk=np.array(self.chunk, dtype=int),
+                     offset=np.array(self.offset, dtype=int), n_pts=np.array(self.n_pts, dtype=int),
+                     stamps=np.array(self.stamps), poses=np.array(self.poses).reshape((-1,7)),
+                     encoding=self.encoding, quant_res=self.quant_res)
+        os.replace(filename + '.tmp', filename)
+
+
+    def close(self):
+        """Write remaining queued frames and save index"""
+        self.queue.put(None)
+        self.writer_thread.join()
+        if self.chunk_file is not None:
+            self.chunk_file.close()
+        self.save_index()
+
+
+class PointCloudReader:
+    """Memory-mapped reader for runs recorded by PointCloudRecorder
+
+    Chunk files are memory-mapped on first access, so only the frames which are
+    accessed are read from disk.
+
+    Attributes
+    ----------
+    stamps : np.array (n_frames)
+        Frame times [s].
+    poses : np.array (n_frames x 7)
+        Poses (x, y, z, qx, qy, qz, qw), NaN if no pose was available.
+
+    """
+    def __init__(self, path):
+        index = np.load(os.path.join(path, 'index.npz'))
+        self.path = path
+        self.chunk = index['chunk']
+        self.offset = index['offset']
+        self.n_pts = index['n_pts']
+        self.stamps = index['stamps']
+        self.poses = index['poses']
+        self.encoding = str(index['encoding'])
+        self.quant_res = float(index['quant_res'])
+        self.chunks = {}
+
+
+    def __len__(self):
+        return len(self.chunk)
+
+
+    def chunk_points(self, k):
+        """Memory-mapped encoded points of chunk k (empty if the chunk file is empty)"""
+        if k not in self.chunks:
+            filename = os.path.join(self.path, 'chunk_'+str(k)+'.bin')
+            if os.path.getsize(filename) == 0:
+                # Zero-byte files cannot be memory-mapped (only frames without points)
+                self.chunks[k] = np.zeros((0,3), dtype=ENCODINGS[self.encoding])
+            else:
+                self.chunks[k] = np.memmap(filename, dtype=ENCODINGS[self.encoding], mode='r').reshape((-1,3))
+        return self.chunks[k]
+
+
+    def __getitem__(self, i):
+        """Decoded point cloud (n_pts x 3) of frame i"""
+        P_enc = self.chunk_points(self.chunk[i])[self.offset[i]:self.offset[i]+self.n_pts[i]]
+        return decode_points(P_enc, self.encoding, self.quant_res)
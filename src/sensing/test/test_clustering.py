@@ -0,0 +1,38 @@
+"""Equivalence tests of the vectorized cluster table against a per-label loop"""
+
+import numpy as np
+
+from sensing.clustering import cluster_table
+
+
+def cluster_table_loop(P, labels, min_pts=1):
+    """Reference cluster table computed one cluster at a time"""
+    rows = []
+    for label in np.unique(labels[labels >= 0]):
+        P_c = P[labels == label]
+        if len(P_c) >= min_pts:
+            rows.append((label, len(P_c), np.mean(P_c, axis=0), np.max(P_c, axis=0) - np.min(P_c, axis=0)))
+    return rows
+
+
+def test_cluster_table_matches_loop():
+    """Cluster table matches the per-label loop, with noise points and non-contiguous labels"""
+    rng = np.random.default_rng(0)
+    P = rng.normal(size=(500,3))
+    labels = rng.choice([-1, 0, 2, 3, 7], size=500, p=[0.2, 0.3, 0.01, 0.29, 0.2])
+
+    for min_pts in [1, 10]:
+        table = cluster_table(P, labels, min_pts)
+        ref = cluster_table_loop(P, labels, min_pts)
+        assert len(table) == len(ref)
+        for row, (label, n_pts, centroid, extent) in zip(table, ref):
+            assert row['label'] == label
+            assert row['n_pts'] == n_pts
+            np.testing.assert_allclose(row['centroid'], centroid)
+            np.testing.assert_allclose(row['extent'], extent)
+
+
+def test_cluster_table_empty():
+    """No points or only noise gives an empty table"""
+    assert len(cluster_table(np.zeros((0,3)), np.zeros(0, dtype=int))) == 0
+    assert len(cluster_table(np.ones((5,3)), -np.ones(5, dtype=int))) == 0